@@ -1,10 +1,11 @@
 import os
 import shutil
-from sqlalchemy import create_engine, Column, Integer, String, Text, JSON, Table, ForeignKey, Boolean, UniqueConstraint, inspect, text
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, Column, Integer, String, Text, JSON, Table, ForeignKey, Boolean, UniqueConstraint, Index, LargeBinary, event, inspect, text
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship, validates
 from datetime import datetime
 
 from backend.core.settings import settings
+from backend.core.utils import normalize_title
 
 Base = declarative_base()
 
@@ -20,6 +21,7 @@ class Paper(Base):
 
     id = Column(Integer, primary_key=True)
     title = Column(Text)
+    normalized_title = Column(Text, nullable=True)  # 规范化标题（语义查重用，随 title 自动维护）
     title_cn = Column(Text, nullable=True)
     authors = Column(Text)
     year = Column(String(10))
@@ -44,9 +46,19 @@ class Paper(Base):
     translated_at = Column(String(50), nullable=True)       # 翻译完成时间
     translation_error = Column(Text, nullable=True)         # 翻译错误信息
 
+    # 问答缓存（按论文开启，近似相同的问题直接返回已有回答）
+    chat_cache_enabled = Column(Boolean, default=False)
+
     owner = relationship("User", back_populates="papers")
     groups = relationship("Group", secondary=paper_group, back_populates="papers")
 
+    __table_args__ = (Index("ix_papers_owner_normalized_title", "owner_id", "normalized_title"),)
+
+    @validates("title")
+    def _sync_normalized_title(self, key, value):
+        self.normalized_title = normalize_title(value)
+        return value
+
 # ================= 3. Group 模型 =================
 class Group(Base):
     __tablename__ = 'groups'
@@ -66,6 +78,7 @@ class User(Base):
     email = Column(String(100), nullable=True)
     role = Column(String(20), default="user")
     storage_quota_mb = Column(Integer, nullable=True)  # 用户存储配额（MB），为空则使用系统默认
+    upload_concurrency = Column(Integer, nullable=True)  # 流式上传并发处理文件数，为空则使用系统默认
 
     papers = relationship("Paper", back_populates="owner")
     # 团队空间关系
@@ -94,6 +107,8 @@ class LLMProvider(Base):
     last_failure_at = Column(String(50), nullable=True)
     last_error = Column(Text, nullable=True)
     avg_latency_ms = Column(Integer, nullable=True)
+    success_count = Column(Integer, default=0)
+    failure_count = Column(Integer, default=0)
 
 # ================= 6. SystemConfig 模型 =================
 class SystemConfig(Base):
@@ -319,6 +334,143 @@ class PaperChatHistory(Base):
     paper = relationship("Paper")
     user = relationship("User")
 
+# ================= 19. LLMResponseCache 模型（LLM 响应缓存）=================
+class LLMResponseCache(Base):
+    """LLM 响应缓存（按请求内容哈希寻址）"""
+    __tablename__ = 'llm_response_cache'
+
+    cache_key = Column(String(64), primary_key=True)        # sha256(池子、模型、消息、格式、温度)
+    pool_name = Column(String(50), nullable=False)
+    content = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(String(50), default=lambda: datetime.now().isoformat(), index=True)
+    last_hit_at = Column(String(50), nullable=True)
+
+# ================= 20. PaperMinHash 模型（近似查重签名）=================
+class PaperMinHash(Base):
+    """论文开头几页文本的 MinHash 签名（不设外键，论文删除时由事件同步清理）"""
+    __tablename__ = 'paper_minhash'
+
+    paper_id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, nullable=True, index=True)
+    signature = Column(LargeBinary, nullable=False)         # NUM_PERM 个 uint32，小端序
+    created_at = Column(String(50), default=lambda: datetime.now().isoformat())
+
+# ================= 21. PaperLSHBucket 模型（近似查重 LSH 分桶）=================
+class PaperLSHBucket(Base):
+    """MinHash 签名按 band 切分后的桶键，签名相近的论文至少落入同一个桶"""
+    __tablename__ = 'paper_lsh_buckets'
+
+    id = Column(Integer, primary_key=True)
+    paper_id = Column(Integer, nullable=False, index=True)
+    owner_id = Column(Integer, nullable=True)
+    bucket_key = Column(String(40), nullable=False)         # "{band}:{band 哈希}"
+
+    __table_args__ = (Index("ix_paper_lsh_owner_bucket", "owner_id", "bucket_key"),)
+
+
+# ================= 22. IngestionJob 模型（论文入库任务队列）=================
+class IngestionJob(Base):
+    """论文入库任务：文件已持久化，解析/元数据/分析/入库由后台 worker 执行"""
+    __tablename__ = 'ingestion_jobs'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    md5_hash = Column(String(32), nullable=False)
+    original_filename = Column(String(255), nullable=True)
+    file_path = Column(String(500), nullable=True)          # 相对 file_service.base_path 的路径
+    file_size = Column(Integer, nullable=True)
+    uploaded_at = Column(String(50), nullable=True)
+
+    status = Column(String(20), default="pending")          # pending/processing/completed/duplicate/failed/cancelled
+    stage = Column(String(30), nullable=True)               # extract/metadata/dedup/analysis/persist
+    error_message = Column(Text, nullable=True)
+    retry_count = Column(Integer, default=0)
+    paper_id = Column(Integer, nullable=True)               # 成功（或失败占位）时关联的论文
+
+    created_at = Column(String(50), default=lambda: datetime.now().isoformat())
+    next_attempt_at = Column(String(50), nullable=True)     # 重试退避：早于该时间不领取
+    started_at = Column(String(50), nullable=True)
+    completed_at = Column(String(50), nullable=True)
+
+    __table_args__ = (
+        Index("ix_ingestion_jobs_status_created", "status", "created_at"),
+        Index("ix_ingestion_jobs_user_md5", "user_id", "md5_hash"),
+    )
+
+
+# ================= 23. IngestCheckpoint 模型（入库阶段检查点）=================
+class IngestCheckpoint(Base):
+    """论文入库各阶段的已完成结果（按 owner + 文件 MD5），入库成功后删除"""
+    __tablename__ = 'ingest_checkpoints'
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, nullable=True)
+    md5_hash = Column(String(32), nullable=False)
+    stage = Column(String(30), nullable=True)               # 最后完成的阶段：extract/metadata/dedup/analysis
+    paper_metadata = Column(JSON, nullable=True)            # metadata 阶段结果
+    analysis = Column(Text, nullable=True)                  # analysis 阶段结果
+    error_message = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)                   # 失败次数
+    created_at = Column(String(50), default=lambda: datetime.now().isoformat())
+    updated_at = Column(String(50), default=lambda: datetime.now().isoformat())
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "md5_hash", name="uq_ingest_checkpoint_owner_md5"),
+        Index("ix_ingest_checkpoints_updated", "updated_at"),
+    )
+
+
+# ================= 24. PaperChatSummary 模型（论文问答滚动摘要）=================
+class PaperChatSummary(Base):
+    """论文问答中较早对话的滚动摘要（每个用户 + 论文一行），最近几轮保留原文不折叠"""
+    __tablename__ = 'paper_chat_summaries'
+
+    id = Column(Integer, primary_key=True)
+    paper_id = Column(Integer, ForeignKey("papers.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    summary = Column(Text, nullable=True)
+    covered_until_id = Column(Integer, default=0)           # 已折叠进摘要的最后一条 PaperChatHistory.id
+    covered_messages = Column(Integer, default=0)           # 已折叠的消息数
+    updated_at = Column(String(50), default=lambda: datetime.now().isoformat())
+
+    __table_args__ = (
+        UniqueConstraint("paper_id", "user_id", name="uq_paper_chat_summary_paper_user"),
+    )
+
+
+# ================= 25. PaperChatAnswerCache 模型（论文问答回答缓存）=================
+class PaperChatAnswerCache(Base):
+    """论文问答的问题 → 回答缓存（论文开启问答缓存时使用）"""
+    __tablename__ = 'paper_chat_answer_cache'
+
+    id = Column(Integer, primary_key=True)
+    paper_id = Column(Integer, ForeignKey("papers.id"), nullable=False)
+    question = Column(Text, nullable=False)
+    normalized_question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    fingerprint = Column(String(64), nullable=False)        # 论文内容指纹（MD5 + 摘要 + 深度分析），变化即失效
+    hits = Column(Integer, default=0)
+    created_at = Column(String(50), default=lambda: datetime.now().isoformat())
+    last_used_at = Column(String(50), default=lambda: datetime.now().isoformat())
+
+    __table_args__ = (Index("ix_paper_chat_answer_cache_paper", "paper_id"),)
+
+
+@event.listens_for(Paper, "after_delete")
+def _drop_paper_derived_rows(mapper, connection, target):
+    """删除论文时清理其派生数据：近似查重签名与分桶、问答摘要与回答缓存、入库检查点"""
+    connection.execute(PaperLSHBucket.__table__.delete().where(PaperLSHBucket.paper_id == target.id))
+    connection.execute(PaperMinHash.__table__.delete().where(PaperMinHash.paper_id == target.id))
+    connection.execute(PaperChatSummary.__table__.delete().where(PaperChatSummary.paper_id == target.id))
+    connection.execute(PaperChatAnswerCache.__table__.delete().where(PaperChatAnswerCache.paper_id == target.id))
+    if target.md5_hash:
+        # 失败占位论文被删除时一并丢弃其入库检查点
+        connection.execute(IngestCheckpoint.__table__.delete().where(
+            IngestCheckpoint.owner_id == target.owner_id,
+            IngestCheckpoint.md5_hash == target.md5_hash,
+        ))
+
 # ================= 初始化 =================
 DB_URL = settings.db_url
 
@@ -390,8 +542,25 @@ def _add_column_if_missing(table: str, column: str, column_type: str):
 # 兼容旧数据库：为 llm_providers 增加 proxy 列（若缺失）
 _add_column_if_missing("llm_providers", "proxy", "VARCHAR(500)")
 _add_column_if_missing("llm_providers", "request_format", "VARCHAR(30)")
+_add_column_if_missing("llm_providers", "success_count", "INTEGER DEFAULT 0")
+_add_column_if_missing("llm_providers", "failure_count", "INTEGER DEFAULT 0")
 _add_column_if_missing("translation_llm_providers", "request_format", "VARCHAR(30)")
 _add_column_if_missing("translation_llm_providers", "proxy", "VARCHAR(500)")
+_add_column_if_missing("papers", "normalized_title", "TEXT")
+_add_column_if_missing("users", "upload_concurrency", "INTEGER")
+_add_column_if_missing("papers", "chat_cache_enabled", "BOOLEAN DEFAULT 0")
+
+
+def _create_index_if_missing(name: str, table: str, columns: str):
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    except Exception:
+        return
+
+
+# 旧数据库补建查重索引（新库由 create_all 创建）
+_create_index_if_missing("ix_papers_owner_normalized_title", "papers", "owner_id, normalized_title")
 
 Session = sessionmaker(bind=engine)
 
@@ -1,6 +1,8 @@
 """
 数据库服务模块 - 封装所有数据库访问逻辑
 """
+import threading
+import time
 from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, joinedload
@@ -8,6 +10,7 @@ import streamlit as st
 
 from backend.core.db_models import Paper, Group, User, SystemConfig
 from backend.core.settings import settings
+from backend.core.utils import normalize_title
 
 # ================= 数据库连接 =================
 DB_URL = settings.db_url
@@ -115,6 +118,28 @@ def is_md5_exist(md5_val: str) -> bool:
         return False
 
 
+def backfill_normalized_titles(batch_size: int = 500) -> int:
+    """为旧数据补齐 normalized_title（按主键分批，返回更新行数）"""
+    updated = 0
+    last_id = 0
+    while True:
+        with get_db_session() as session:
+            rows = (
+                session.query(Paper.id, Paper.title)
+                .filter(Paper.normalized_title.is_(None), Paper.id > last_id)
+                .order_by(Paper.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return updated
+            session.bulk_update_mappings(Paper, [
+                {"id": paper_id, "normalized_title": normalize_title(title)} for paper_id, title in rows
+            ])
+            updated += len(rows)
+            last_id = rows[-1][0]
+
+
 def delete_paper(paper_id: int) -> bool:
     """删除指定论文"""
     try:
@@ -150,14 +175,67 @@ def get_all_users() -> list[dict]:
 
 
 # ================= 系统配置操作 =================
-def get_config(key: str, default: str = None) -> str:
-    """获取系统配置值"""
-    try:
+class SystemConfigCache:
+    """
+    SystemConfig 进程内快照
+
+    整表一次读入内存，热路径（每次 LLM 调用、每次上传）读取配置不再访问数据库。
+    本进程写入时立即失效并递增版本号；TTL 兜底多进程部署下其他进程的写入。
+    """
+
+    def __init__(self, ttl_seconds: float = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.system_config_cache_ttl
+        self.version = 0
+        self._values: dict[str, str] | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, str]:
         with get_db_session() as session:
-            config = session.query(SystemConfig).filter_by(key=key).first()
-            return config.value if config else default
-    except Exception:
-        return default
+            return {c.key: c.value for c in session.query(SystemConfig).all()}
+
+    def snapshot(self) -> dict[str, str]:
+        """返回当前配置快照（过期或失效时重新加载）"""
+        now = time.monotonic()
+        values = self._values
+        if values is not None and now - self._loaded_at < self.ttl_seconds:
+            return values
+        with self._lock:
+            if self._values is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return self._values
+            version = self.version
+            try:
+                loaded = self._load()
+            except Exception:
+                # 数据库暂不可用时沿用旧快照
+                return self._values or {}
+            # 加载期间发生写入则不缓存本次结果，下次读取重新加载
+            if version == self.version:
+                self._values = loaded
+                self._loaded_at = time.monotonic()
+            return loaded
+
+    def get(self, key: str, default: str = None) -> str:
+        return self.snapshot().get(key, default)
+
+    def invalidate(self) -> None:
+        """配置写入后调用：丢弃快照并递增版本号"""
+        with self._lock:
+            self._values = None
+            self.version += 1
+
+
+config_cache = SystemConfigCache()
+
+
+def get_config(key: str, default: str = None) -> str:
+    """获取系统配置值（读取进程内快照）"""
+    return config_cache.get(key, default)
+
+
+def get_config_version() -> int:
+    """本进程内系统配置版本号，每次写入后递增"""
+    return config_cache.version
 
 
 def set_config(key: str, value: str) -> bool:
@@ -169,7 +247,8 @@ def set_config(key: str, value: str) -> bool:
                 config.value = str(value)
             else:
                 session.add(SystemConfig(key=key, value=str(value)))
-            return True
+        config_cache.invalidate()
+        return True
     except Exception:
         return False
 
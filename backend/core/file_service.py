@@ -2,9 +2,13 @@
 文件存储服务模块
 负责 PDF 文件的持久化存储、读取、删除等操作
 """
+import asyncio
+import hashlib
 import os
 import re
 import shutil
+import uuid
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 from backend.core.log_service import get_logger
@@ -12,6 +16,23 @@ from backend.core.settings import settings
 
 logger = get_logger("file_service")
 
+# 流式上传每次读取/写入的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 上传临时文件前缀（位于用户目录内，保证与目标文件同一文件系统，rename 为原子操作）
+UPLOAD_TEMP_PREFIX = ".upload-"
+
+
+class UploadTooLargeError(ValueError):
+    """上传内容超过允许写入的字节数"""
+
+
+@dataclass
+class StagedUpload:
+    """已落盘但尚未转正的上传文件"""
+    temp_path: str
+    md5_hash: str
+    file_size: int
+
 
 class FileService:
     """文件存储服务"""
@@ -219,6 +240,87 @@ class FileService:
             "uploaded_at": uploaded_at
         }
     
+    async def stage_upload(self, upload, user_id: int, max_bytes: Optional[int] = None) -> StagedUpload:
+        """
+        流式写入上传文件：分块读取、边写临时文件边计算 MD5，不在内存中缓存整个文件
+
+        Args:
+            upload: 支持 ``await read(size)`` 的上传对象（如 FastAPI UploadFile）
+            user_id: 用户 ID
+            max_bytes: 允许写入的最大字节数，超过立即中止并删除临时文件
+
+        Returns:
+            StagedUpload: 临时文件路径、MD5 与文件大小，需随后 commit_upload 或 discard_upload
+
+        Raises:
+            UploadTooLargeError: 已写入字节数超过 max_bytes
+        """
+        user_dir = self._get_user_dir(user_id)
+        temp_path = os.path.join(user_dir, f"{UPLOAD_TEMP_PREFIX}{uuid.uuid4().hex}.part")
+        digest = hashlib.md5()
+        file_size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    file_size += len(chunk)
+                    if max_bytes is not None and file_size > max_bytes:
+                        raise UploadTooLargeError(f"上传内容超过 {max_bytes} 字节")
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            self._remove_quietly(temp_path)
+            raise
+        return StagedUpload(temp_path=temp_path, md5_hash=digest.hexdigest(), file_size=file_size)
+
+    def commit_upload(self, staged: StagedUpload, user_id: int, original_filename: str) -> dict:
+        """
+        将临时文件原子重命名为正式存储路径（user_{id}/{md5}.pdf）
+
+        Returns:
+            dict: 文件信息，格式同 save_file
+        """
+        file_path = self._get_file_path(user_id, staged.md5_hash)
+        os.replace(staged.temp_path, file_path)
+
+        logger.info(f"文件保存成功: user_{user_id}/{staged.md5_hash}.pdf, 大小: {staged.file_size} 字节")
+
+        return {
+            "file_path": os.path.relpath(file_path, self.base_path),
+            "file_size": staged.file_size,
+            "original_filename": original_filename,
+            "uploaded_at": datetime.now().isoformat()
+        }
+
+    def discard_upload(self, staged: StagedUpload) -> None:
+        """丢弃未转正的临时文件（如 MD5 重复）"""
+        self._remove_quietly(staged.temp_path)
+
+    def cleanup_stale_uploads(self) -> int:
+        """删除进程异常退出遗留的上传临时文件（仅在启动时调用，此时没有进行中的上传）"""
+        removed = 0
+        if not os.path.isdir(self.base_path):
+            return removed
+        for dirname in os.listdir(self.base_path):
+            user_dir = os.path.join(self.base_path, dirname)
+            if not dirname.startswith("user_") or not os.path.isdir(user_dir):
+                continue
+            for filename in os.listdir(user_dir):
+                if filename.startswith(UPLOAD_TEMP_PREFIX):
+                    self._remove_quietly(os.path.join(user_dir, filename))
+                    removed += 1
+        return removed
+
+    def _remove_quietly(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"临时文件清理失败: {e}")
+
     def get_file_path(self, user_id: int, md5_hash: str) -> Optional[str]:
         """
         根据用户ID和MD5获取文件完整路径
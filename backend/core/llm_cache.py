@@ -0,0 +1,212 @@
+"""
+LLM 响应缓存模块
+重新分析、分析失败后重传、多人上传同一 PDF 都会向 metadata 池发送逐字节相同的提示词。
+这里按 (池子, 模型族, 消息, response_format, temperature) 的哈希寻址缓存已通过质检的响应：
+  - 内存 LRU：进程内热点命中，零 IO
+  - 数据库：跨进程/重启复用，带 TTL 与条目上限淘汰
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+
+from backend.core.db_models import LLMResponseCache
+from backend.core.db_service import get_db_session
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+
+logger = get_logger("llm_cache")
+
+
+class CachedMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class CachedChoice:
+    def __init__(self, content: str):
+        self.message = CachedMessage(content)
+
+
+class CachedChatResponse:
+    """缓存命中时返回的 chat.completions 兼容结构"""
+
+    def __init__(self, content: str):
+        self.choices = [CachedChoice(content)]
+        self.cached = True
+
+
+def make_cache_key(pool_name: str, model_family: str, messages: list,
+                   response_format=None, temperature: float = None) -> str:
+    """请求内容的稳定哈希（字典键排序，保证相同请求得到相同键）"""
+    payload = json.dumps(
+        {
+            "pool": pool_name,
+            "models": model_family,
+            "messages": messages,
+            "response_format": response_format,
+            "temperature": temperature,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCacheStore:
+    """两级 LLM 响应缓存（内存 LRU + 数据库）"""
+
+    def __init__(self, pools: str = None, ttl_seconds: int = None,
+                 memory_entries: int = None, max_entries: int = None):
+        raw_pools = settings.llm_response_cache_pools if pools is None else pools
+        self.pools = {p.strip() for p in (raw_pools or "").split(",") if p.strip()}
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.llm_response_cache_ttl_seconds
+        self.memory_entries = memory_entries if memory_entries is not None else settings.llm_response_cache_memory_entries
+        self.max_entries = max_entries if max_entries is not None else settings.llm_response_cache_max_entries
+        # key -> (content, 写入时间)
+        self._memory: OrderedDict[str, tuple[str, datetime]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def enabled_for(self, pool_name: str) -> bool:
+        return pool_name in self.pools
+
+    def _expired(self, created_at: datetime) -> bool:
+        return datetime.now() - created_at > timedelta(seconds=self.ttl_seconds)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _remember(self, key: str, content: str, created_at: datetime) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (content, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry[0]
+
+    def _get_db_sync(self, key: str) -> Optional[tuple[str, datetime]]:
+        with get_db_session() as session:
+            row = session.query(LLMResponseCache).filter(LLMResponseCache.cache_key == key).first()
+            if row is None:
+                return None
+            created_at = datetime.fromisoformat(row.created_at)
+            if self._expired(created_at):
+                session.delete(row)
+                return None
+            row.hit_count = (row.hit_count or 0) + 1
+            row.last_hit_at = datetime.now().isoformat()
+            return row.content, created_at
+
+    def _put_db_sync(self, key: str, pool_name: str, content: str) -> int:
+        """写入数据库并淘汰过期/超量条目，返回淘汰数"""
+        now = datetime.now()
+        with get_db_session() as session:
+            row = session.query(LLMResponseCache).filter(LLMResponseCache.cache_key == key).first()
+            if row is None:
+                session.add(LLMResponseCache(
+                    cache_key=key, pool_name=pool_name, content=content,
+                    hit_count=0, created_at=now.isoformat(),
+                ))
+            else:
+                row.content = content
+                row.created_at = now.isoformat()
+
+            cutoff = (now - timedelta(seconds=self.ttl_seconds)).isoformat()
+            evicted = (
+                session.query(LLMResponseCache)
+                .filter(LLMResponseCache.created_at < cutoff)
+                .delete(synchronize_session=False)
+            )
+            session.flush()
+            overflow = session.query(LLMResponseCache).count() - self.max_entries
+            if overflow > 0:
+                # 超出上限时按最近使用时间淘汰（未命中过的按写入时间）
+                stale_keys = [
+                    k for (k,) in session.query(LLMResponseCache.cache_key)
+                    .order_by(func.coalesce(LLMResponseCache.last_hit_at, LLMResponseCache.created_at).asc())
+                    .limit(overflow)
+                ]
+                evicted += (
+                    session.query(LLMResponseCache)
+                    .filter(LLMResponseCache.cache_key.in_(stale_keys))
+                    .delete(synchronize_session=False)
+                )
+            return evicted
+
+    async def get(self, key: str) -> Optional[str]:
+        """查询缓存：先内存后数据库，数据库命中会回填内存"""
+        content = self._get_memory(key)
+        if content is not None:
+            self._count("memory_hits")
+            return content
+        try:
+            entry = await asyncio.to_thread(self._get_db_sync, key)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM 响应缓存读取失败: {e}")
+            entry = None
+        if entry is None:
+            self._count("misses")
+            return None
+        self._remember(key, entry[0], entry[1])
+        self._count("db_hits")
+        return entry[0]
+
+    async def put(self, key: str, pool_name: str, content: str) -> None:
+        """写入缓存（调用方保证内容已通过质检）"""
+        if not content:
+            return
+        self._remember(key, content, datetime.now())
+        try:
+            evicted = await asyncio.to_thread(self._put_db_sync, key, pool_name, content)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM 响应缓存写入失败: {e}")
+            return
+        self._count("stores")
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _delete_db_sync(self, key: str) -> None:
+        with get_db_session() as session:
+            session.query(LLMResponseCache).filter(LLMResponseCache.cache_key == key).delete()
+
+    async def invalidate(self, key: str) -> None:
+        """删除单条缓存（例如命中内容未通过本次调用的质检）"""
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            await asyncio.to_thread(self._delete_db_sync, key)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM 响应缓存删除失败: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 3) if lookups else 0.0
+        stats["pools"] = sorted(self.pools)
+        return stats
+
+
+# 全局实例
+llm_response_cache = LLMResponseCacheStore()
@@ -76,6 +76,8 @@ def to_model_config_response(provider: LLMProvider) -> ModelConfigResponse:
         last_failure_at=getattr(provider, "last_failure_at", None),
         last_error=getattr(provider, "last_error", None),
         avg_latency_ms=getattr(provider, "avg_latency_ms", None),
+        success_count=getattr(provider, "success_count", None),
+        failure_count=getattr(provider, "failure_count", None),
         created_at=getattr(provider, "created_at", None),
     )
 
@@ -5,14 +5,28 @@ LLM 池管理器 - 从数据库读取配置，支持动态刷新
   - 智能重试（排除失败的通道）
   - OpenAI 和 Gemini API 格式（含自定义地址）
   - 流式响应支持
+  - Gemini / Anthropic 长连接复用（按 base_url + proxy 共享连接池）
+  - 上游 Key 级限流（与论文翻译共享 RPM / TPM / 并发配额，超限排队）
+  - 响应缓存（按请求内容哈希复用已通过质检的结果，默认仅 metadata 池）
+  - 增量重载（复用未变化的客户端、关闭被移除的客户端，池子快照整体替换）
 """
+import json
 import random
 import asyncio
+import hashlib
 import httpx
+import threading
 import time
 import inspect
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+from typing import Any, Callable
 from openai import AsyncOpenAI, APIStatusError
-from backend.core.llm_service import get_enabled_providers, import_from_json, mark_provider_success, mark_provider_failure
+from backend.core.llm_service import LLM_CONFIG_VERSION_KEY, get_enabled_providers, import_from_json
+from backend.core.provider_health import provider_health
+from backend.core.llm_routing import AdaptiveRouter, ROUTING_MODE_ADAPTIVE, node_route_key, normalize_routing_mode
+from backend.core.llm_cache import CachedChatResponse, llm_response_cache, make_cache_key
+from backend.core.rate_governor import estimate_tokens, rate_governor, throttle
 from backend.core.db_service import get_config
 from backend.core.log_service import llm_logger, get_logger
 from backend.core.settings import settings
@@ -20,9 +34,23 @@ from backend.core.llm_format import normalize_request_format, format_to_legacy_a
 
 logger = get_logger("llm_pool")
 OPENAI_USER_AGENT = "PaperFlow/1.0"
+LLM_HTTP_TIMEOUT = httpx.Timeout(120.0, connect=30.0)
 
 
-def build_httpx_client(timeout: httpx.Timeout, proxy: str | None) -> httpx.AsyncClient:
+def build_httpx_limits() -> httpx.Limits:
+    """按配置构建 LLM 连接池上限"""
+    return httpx.Limits(
+        max_connections=settings.llm_http_max_connections,
+        max_keepalive_connections=settings.llm_http_max_keepalive_connections,
+        keepalive_expiry=settings.llm_http_keepalive_expiry,
+    )
+
+
+def build_httpx_client(
+    timeout: httpx.Timeout,
+    proxy: str | None,
+    limits: httpx.Limits | None = None,
+) -> httpx.AsyncClient:
     kwargs = {}
     if proxy:
         params = inspect.signature(httpx.AsyncClient).parameters
@@ -30,9 +58,228 @@ def build_httpx_client(timeout: httpx.Timeout, proxy: str | None) -> httpx.Async
             kwargs["proxy"] = proxy
         elif "proxies" in params:
             kwargs["proxies"] = proxy
+    if limits is not None:
+        kwargs["limits"] = limits
     return httpx.AsyncClient(timeout=timeout, **kwargs)
 
 
+def _close_on_loop(close_coro_factory, loop: asyncio.AbstractEventLoop | None) -> None:
+    """
+    在合适的事件循环上执行异步关闭
+
+    reload_config 可能在线程池中执行，客户端需回到其所属的事件循环关闭；
+    从未发起过请求的客户端没有绑定事件循环，直接在当前线程关闭。
+    """
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+
+    if running_loop is not None and (loop is None or loop is running_loop):
+        running_loop.create_task(close_coro_factory())
+    elif loop is not None:
+        if not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(close_coro_factory(), loop)
+    elif running_loop is None:
+        asyncio.run(close_coro_factory())
+
+
+class SharedHTTPClientPool:
+    """
+    按 (base_url, proxy) 共享的长连接 httpx 客户端池
+
+    - 客户端在首次请求时才创建（懒加载），同一地址的不同 Key / 模型共用连接
+    - 通过 lease() 按地址统计在途请求；prune() / retire() 后待在途请求结束再关闭连接
+    """
+
+    def __init__(self, timeout: httpx.Timeout = LLM_HTTP_TIMEOUT, limits: httpx.Limits | None = None):
+        self._timeout = timeout
+        self._limits = limits or build_httpx_limits()
+        self._clients: dict[tuple[str, str | None], httpx.AsyncClient] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._inflight: dict[tuple[str, str | None], int] = {}
+        self._pruned: set[tuple[str, str | None]] = set()
+        self._retired = False
+        self._closed = False
+
+    def get(self, base_url: str, proxy: str | None) -> httpx.AsyncClient:
+        """获取（必要时创建）指定地址的共享客户端；连接池已关闭时抛出 RuntimeError"""
+        if self._closed:
+            raise RuntimeError("LLM 连接池已关闭")
+        key = (base_url, proxy)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = build_httpx_client(self._timeout, proxy, self._limits)
+            self._clients[key] = client
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        return client
+
+    @asynccontextmanager
+    async def lease(self, base_url: str, proxy: str | None):
+        """租用共享客户端，期间计入在途请求，避免被提前关闭"""
+        if self._closed:
+            # 连接池已关闭（如旧配置上的重试晚于关闭）：使用一次性客户端，租约结束即关闭，不留存在池中
+            client = build_httpx_client(self._timeout, proxy, self._limits)
+            try:
+                yield client
+            finally:
+                await client.aclose()
+            return
+        key = (base_url, proxy)
+        self._inflight[key] = self._inflight.get(key, 0) + 1
+        try:
+            yield self.get(base_url, proxy)
+        finally:
+            self._inflight[key] -= 1
+            if self._inflight[key] == 0:
+                del self._inflight[key]
+                if self._retired:
+                    if not self._inflight:
+                        await self.aclose()
+                elif key in self._pruned:
+                    await self._close_key(key)
+
+    def _has_inflight(self) -> bool:
+        return bool(self._inflight)
+
+    async def _close_key(self, key: tuple[str, str | None]) -> None:
+        """关闭单个地址的客户端（期间若被重新启用则保留）"""
+        if key not in self._pruned or key in self._inflight:
+            return
+        self._pruned.discard(key)
+        client = self._clients.pop(key, None)
+        if client is not None:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭 LLM 连接失败: {e}")
+
+    def prune(self, keep: set[tuple[str, str | None]]) -> int:
+        """关闭不再被任何节点使用的地址（有在途请求的待其结束），返回待关闭数"""
+        self._pruned.difference_update(keep)
+        stale = [key for key in self._clients if key not in keep]
+        for key in stale:
+            self._pruned.add(key)
+            if key not in self._inflight:
+                _close_on_loop(lambda key=key: self._close_key(key), self._loop)
+        return len(stale)
+
+    def retire(self) -> None:
+        """标记为退役：无在途请求时立即关闭，否则由最后一个请求负责关闭"""
+        self._retired = True
+        if self._has_inflight() or not self._clients:
+            return
+        _close_on_loop(self.aclose, self._loop)
+
+    async def aclose(self) -> None:
+        """关闭全部共享客户端"""
+        if self._closed:
+            return
+        self._closed = True
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭 LLM 连接池失败: {e}")
+
+
+class ManagedClient:
+    """
+    带在途计数的 LLM 客户端句柄
+
+    配置重载时未变化的客户端原样复用；被移除的客户端 retire() 后，
+    待在途请求全部结束再关闭（OpenAI 客户端各自持有连接池，必须显式关闭）。
+    已关闭后仍被租用（如请求持有旧节点快照）时，用 factory 创建一次性客户端，租约结束即关闭。
+    """
+
+    def __init__(self, client, signature: tuple, factory: Callable[[], Any] | None = None):
+        self.client = client
+        self.signature = signature
+        self._factory = factory
+        self._inflight = 0
+        self._retired = False
+        self._closed = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @asynccontextmanager
+    async def lease(self):
+        if self._closed and self._factory is not None:
+            client = self._factory()
+            try:
+                yield client
+            finally:
+                await _close_client(client)
+            return
+        self._inflight += 1
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        try:
+            yield self.client
+        finally:
+            self._inflight -= 1
+            if self._retired and self._inflight == 0:
+                await self.aclose()
+
+    def retire(self) -> None:
+        self._retired = True
+        if self._inflight == 0:
+            _close_on_loop(self.aclose, self._loop)
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        await _close_client(self.client)
+
+
+async def _close_client(client) -> None:
+    """关闭持有连接池的客户端（没有异步 close 的客户端无需关闭）"""
+    close = getattr(client, "close", None)
+    if close is None or not inspect.iscoroutinefunction(close):
+        return
+    try:
+        await close()
+    except Exception as e:
+        logger.warning(f"⚠️ 关闭 LLM 客户端失败: {e}")
+
+
+@asynccontextmanager
+async def _lease_client(node: dict):
+    """请求期间占用节点客户端（未托管的节点直接放行）"""
+    handle = node.get("client_handle")
+    if handle is None:
+        yield node["client"]
+        return
+    async with handle.lease() as client:
+        yield client
+
+
+async def _raise_for_stream_status(response: httpx.Response) -> None:
+    """流式响应出错时读取完整响应体再抛出，便于日志定位"""
+    if response.is_error:
+        await response.aread()
+        response.raise_for_status()
+
+
+async def _iter_sse_data(response: httpx.Response):
+    """逐条解析 SSE 响应中的 data 字段（JSON）"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if not data or data == "[DONE]":
+            continue
+        try:
+            yield json.loads(data)
+        except json.JSONDecodeError:
+            logger.debug(f"忽略无法解析的 SSE 数据: {data[:100]}")
+
+
 def build_openai_async_client(
     api_key: str,
     base_url: str | None,
@@ -59,15 +306,26 @@ class GeminiClientWrapper:
     Gemini API 客户端包装器
     支持自定义 base_url（如中转服务）
     """
-    def __init__(self, api_key: str, base_url: str = None, proxy: str | None = None):
+    def __init__(self, api_key: str, base_url: str = None, proxy: str | None = None,
+                 http_clients: SharedHTTPClientPool | None = None):
         self.api_key = api_key
         # 默认使用 Google 官方 API，也支持自定义地址
         self.base_url = base_url.rstrip("/") if base_url else "https://generativelanguage.googleapis.com/v1beta"
         self.proxy = proxy
+        self.http_clients = http_clients
+
+    @asynccontextmanager
+    async def _http_client(self):
+        """优先使用共享连接池；未提供时（如连通性测试）使用一次性客户端"""
+        if self.http_clients is None:
+            async with build_httpx_client(LLM_HTTP_TIMEOUT, self.proxy) as client:
+                yield client
+        else:
+            async with self.http_clients.lease(self.base_url, self.proxy) as client:
+                yield client
     
-    async def create_chat_completion(self, model: str, messages: list, temperature: float = 0.7, **kwargs):
-        """调用 Gemini API 并返回 OpenAI 兼容的响应格式"""
-        # 将 OpenAI 消息格式转换为 Gemini 格式
+    def _build_request_body(self, messages: list, temperature: float) -> dict:
+        """将 OpenAI 消息格式转换为 Gemini 请求体"""
         gemini_contents = []
         system_instruction = None
         
@@ -92,13 +350,17 @@ class GeminiClientWrapper:
         
         if system_instruction:
             request_body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        return request_body
+
+    async def create_chat_completion(self, model: str, messages: list, temperature: float = 0.7, **kwargs):
+        """调用 Gemini API 并返回 OpenAI 兼容的响应格式"""
+        request_body = self._build_request_body(messages, temperature)
         
         # 构建 URL
         url = f"{self.base_url}/models/{model}:generateContent?key={self.api_key}"
         
-        # 发送请求 - 使用更细粒度的超时配置
-        timeout = httpx.Timeout(120.0, connect=30.0)  # 总超时5分钟，连接超时30秒
-        async with build_httpx_client(timeout, self.proxy) as client:
+        # 发送请求（超时配置见 LLM_HTTP_TIMEOUT）
+        async with self._http_client() as client:
             response = await client.post(url, json=request_body)
             response.raise_for_status()
             data = response.json()
@@ -106,6 +368,23 @@ class GeminiClientWrapper:
         # 包装成 OpenAI 兼容的响应格式
         return GeminiResponseWrapper(data)
 
+    async def stream_chat_completion(self, model: str, messages: list, temperature: float = 0.7, **kwargs):
+        """调用 Gemini streamGenerateContent (SSE)，逐段 yield 文本"""
+        request_body = self._build_request_body(messages, temperature)
+        url = f"{self.base_url}/models/{model}:streamGenerateContent?alt=sse&key={self.api_key}"
+
+        async with self._http_client() as client:
+            async with client.stream("POST", url, json=request_body) as response:
+                await _raise_for_stream_status(response)
+                async for payload in _iter_sse_data(response):
+                    if payload.get("error"):
+                        raise RuntimeError(f"Gemini 流式响应错误: {payload['error']}")
+                    for candidate in payload.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            # 跳过思考模型的 thought 片段
+                            if part.get("text") and not part.get("thought"):
+                                yield part["text"]
+
 
 class GeminiResponseWrapper:
     """将 Gemini 响应包装成 OpenAI 兼容格式"""
@@ -141,14 +420,25 @@ class AnthropicClientWrapper:
     Anthropic API 客户端包装器
     支持自定义 base_url（如中转服务）
     """
-    def __init__(self, api_key: str, base_url: str = None, proxy: str | None = None):
+    def __init__(self, api_key: str, base_url: str = None, proxy: str | None = None,
+                 http_clients: SharedHTTPClientPool | None = None):
         self.api_key = api_key
         self.base_url = base_url.rstrip("/") if base_url else "https://api.anthropic.com"
         self.proxy = proxy
+        self.http_clients = http_clients
+
+    @asynccontextmanager
+    async def _http_client(self):
+        """优先使用共享连接池；未提供时（如连通性测试）使用一次性客户端"""
+        if self.http_clients is None:
+            async with build_httpx_client(LLM_HTTP_TIMEOUT, self.proxy) as client:
+                yield client
+        else:
+            async with self.http_clients.lease(self.base_url, self.proxy) as client:
+                yield client
     
-    async def create_chat_completion(self, model: str, messages: list, temperature: float = 0.7, **kwargs):
-        """调用 Anthropic API 并返回 OpenAI 兼容的响应格式"""
-        # 将 OpenAI 消息格式转换为 Anthropic 格式
+    def _build_request(self, model: str, messages: list, temperature: float, **kwargs) -> tuple[dict, dict]:
+        """将 OpenAI 消息格式转换为 Anthropic 请求体，返回 (request_body, headers)"""
         anthropic_messages = []
         system_content = None
         
@@ -172,18 +462,19 @@ class AnthropicClientWrapper:
         if system_content:
             request_body["system"] = system_content
         
-        # 构建 URL
-        url = f"{self.base_url}/v1/messages"
-        
-        # 发送请求 - 使用更细粒度的超时配置
         headers = {
             "Content-Type": "application/json",
             "x-api-key": self.api_key,
             "anthropic-version": "2023-06-01"
         }
+        return request_body, headers
+
+    async def create_chat_completion(self, model: str, messages: list, temperature: float = 0.7, **kwargs):
+        """调用 Anthropic API 并返回 OpenAI 兼容的响应格式"""
+        request_body, headers = self._build_request(model, messages, temperature, **kwargs)
+        url = f"{self.base_url}/v1/messages"
         
-        timeout = httpx.Timeout(120.0, connect=30.0)  # 总超时5分钟，连接超时30秒
-        async with build_httpx_client(timeout, self.proxy) as client:
+        async with self._http_client() as client:
             response = await client.post(url, json=request_body, headers=headers)
             response.raise_for_status()
             data = response.json()
@@ -191,6 +482,26 @@ class AnthropicClientWrapper:
         # 包装成 OpenAI 兼容的响应格式
         return AnthropicResponseWrapper(data)
 
+    async def stream_chat_completion(self, model: str, messages: list, temperature: float = 0.7, **kwargs):
+        """调用 Anthropic Messages 流式接口 (SSE)，逐段 yield 文本"""
+        request_body, headers = self._build_request(model, messages, temperature, **kwargs)
+        request_body["stream"] = True
+        url = f"{self.base_url}/v1/messages"
+
+        async with self._http_client() as client:
+            async with client.stream("POST", url, json=request_body, headers=headers) as response:
+                await _raise_for_stream_status(response)
+                async for event in _iter_sse_data(response):
+                    event_type = event.get("type")
+                    if event_type == "content_block_delta":
+                        delta = event.get("delta", {})
+                        if delta.get("type") == "text_delta" and delta.get("text"):
+                            yield delta["text"]
+                    elif event_type == "error":
+                        raise RuntimeError(f"Anthropic 流式响应错误: {event.get('error')}")
+                    elif event_type == "message_stop":
+                        break
+
 
 class AnthropicResponseWrapper:
     """将 Anthropic 响应包装成 OpenAI 兼容格式"""
@@ -259,6 +570,36 @@ class OpenAIResponsesMessageWrapper:
         self.content = text
 
 
+def _response_tokens(response, prompt_tokens: int) -> int | None:
+    """本次调用实际消耗的 token 数：优先取 usage，缺失时按输出文本估算"""
+    usage = getattr(response, "usage", None)
+    total = getattr(usage, "total_tokens", None) if usage is not None else None
+    if isinstance(total, int) and total > 0:
+        return total
+    try:
+        content = response.choices[0].message.content or ""
+    except (AttributeError, IndexError):
+        return None
+    return prompt_tokens + estimate_tokens([content])
+
+
+POOL_TYPES = ("metadata", "analysis")
+
+# 参与配置指纹的字段（健康统计等运行时字段变化不触发重载）
+_FINGERPRINT_FIELDS = (
+    "id", "base_url", "proxy", "api_key", "api_type", "request_format",
+    "models", "is_primary", "priority", "weight",
+)
+
+
+def _providers_fingerprint(providers_by_pool: dict[str, list[dict]]) -> str:
+    payload = {
+        pool: [{field: entry.get(field) for field in _FINGERPRINT_FIELDS} for entry in entries]
+        for pool, entries in providers_by_pool.items()
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
 class LLMManager:
     def __init__(self):
         # 首次启动时，尝试从 JSON 导入配置
@@ -266,19 +607,80 @@ class LLMManager:
         if imported > 0:
             logger.info(f"✅ 已从 llm_config.json 导入 {imported} 个提供商配置")
         
-        # 构建池子
-        self.pools = {"metadata": [], "analysis": []}
+        # 构建池子（只读快照，重载时整体替换）
+        self.pools = MappingProxyType({pool_type: () for pool_type in POOL_TYPES})
+        # 共享连接池在进程内常驻，重载时只关闭不再使用的地址
+        self.http_clients = SharedHTTPClientPool()
+        # 按 (格式, base_url, proxy, Key) 复用的客户端句柄
+        self._clients: dict[tuple, ManagedClient] = {}
+        # 本进程内配置版本号：每次实际生效的重载递增
+        self.config_version = 0
+        self._fingerprint: str | None = None
+        self._config_marker: str | None = None
+        self._reload_lock = threading.Lock()
+        # 路由状态按节点 route_key 保存，跨配置重载保留
+        self.router = AdaptiveRouter()
+        # 对冲请求计数（按池子）：hedged=发出的副本数，*_wins=胜出方，cancelled=被取消的请求数
+        self.hedge_stats: dict[str, dict[str, int]] = {}
         self.reload_config()
 
-    def reload_config(self):
-        """重新加载配置（从数据库）"""
-        self.pools = {
-            "metadata": self._build_pool("metadata"),
-            "analysis": self._build_pool("analysis"),
-        }
-        logger.info("🔌 LLM 配置已加载")
+    def reload_config(self, force: bool = False) -> bool:
+        """
+        重新加载配置（从数据库），返回是否发生变化
+
+        - 配置指纹未变化时直接跳过
+        - 配置未变化的客户端原样复用，被移除的客户端待在途请求结束后关闭
+        - 新池子构建完成后整体替换，正在遍历旧池子的协程不受影响
+        """
+        with self._reload_lock:
+            marker = get_config(LLM_CONFIG_VERSION_KEY)
+            providers_by_pool = {pool_type: get_enabled_providers(pool_type) for pool_type in POOL_TYPES}
+            fingerprint = _providers_fingerprint(providers_by_pool)
+            self._config_marker = marker
+            if not force and fingerprint == self._fingerprint:
+                return False
+
+            clients: dict[tuple, ManagedClient] = {}
+            pools = MappingProxyType({
+                pool_type: tuple(self._build_pool(providers_by_pool[pool_type], clients))
+                for pool_type in POOL_TYPES
+            })
+
+            removed = [handle for signature, handle in self._clients.items() if signature not in clients]
+            reused = len(clients) - sum(1 for signature in clients if signature not in self._clients)
+            self.pools = pools
+            self._clients = clients
+            self._fingerprint = fingerprint
+            self.config_version += 1
+
+            for handle in removed:
+                handle.retire()
+            self.http_clients.prune({
+                (handle.client.base_url, handle.client.proxy)
+                for handle in clients.values()
+                if isinstance(handle.client, (GeminiClientWrapper, AnthropicClientWrapper))
+            })
+
+        logger.info(f"🔌 LLM 配置已加载 (v{self.config_version}，复用 {reused} 个客户端，关闭 {len(removed)} 个)")
         logger.info(f"   - Metadata 主力: {self._get_first_name('metadata')}")
         logger.info(f"   - Analysis 主力: {self._get_first_name('analysis')}")
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """
+        仅在配置版本标记变化时重载（读取进程内配置快照，通常不访问数据库）
+
+        适合在每次上传等高频路径调用。
+        """
+        if get_config(LLM_CONFIG_VERSION_KEY) == self._config_marker:
+            return False
+        return self.reload_config()
+
+    async def aclose(self) -> None:
+        """关闭全部客户端（进程退出时调用）"""
+        for handle in list(self._clients.values()):
+            await handle.aclose()
+        await self.http_clients.aclose()
 
     def _get_first_name(self, pool_name: str) -> str:
         """获取主力模型名称（is_primary 优先，然后按 priority 排序的第一个）"""
@@ -290,9 +692,33 @@ class LLMManager:
         request_format = node.get("request_format", node.get("api_type", "openai"))
         return f"[{node['model']}] @ {node['provider']} ({request_format}){primary_tag}"
 
-    def _build_pool(self, pool_type: str) -> list:
-        """从数据库构建客户端池"""
-        providers = get_enabled_providers(pool_type)
+    def _get_client(self, request_format: str, base_url: str, proxy: str | None, key: str,
+                    clients: dict[tuple, ManagedClient]) -> ManagedClient:
+        """复用相同配置的客户端句柄，否则新建"""
+        signature = (request_format, base_url, proxy, key)
+        handle = clients.get(signature) or self._clients.get(signature)
+        if handle is None:
+            if request_format == "gemini":
+                factory = lambda: GeminiClientWrapper(
+                    api_key=key, base_url=base_url or None, proxy=proxy, http_clients=self.http_clients
+                )
+            elif request_format == "anthropic":
+                factory = lambda: AnthropicClientWrapper(
+                    api_key=key, base_url=base_url or None, proxy=proxy, http_clients=self.http_clients
+                )
+            else:  # 默认 openai - 添加超时配置
+                factory = lambda: build_openai_async_client(
+                    api_key=key,
+                    base_url=base_url,
+                    timeout=LLM_HTTP_TIMEOUT,
+                    proxy=proxy,
+                )
+            handle = ManagedClient(factory(), signature, factory)
+        clients[signature] = handle
+        return handle
+
+    def _build_pool(self, providers: list[dict], clients: dict[tuple, ManagedClient]) -> list:
+        """根据提供商配置构建客户端池（复用的客户端记录到 clients）"""
         client_pool = []
 
         for entry in providers:
@@ -307,25 +733,14 @@ class LLMManager:
             )
             api_type = format_to_legacy_api_type(request_format)
 
-            for key in keys:
-                # 根据 api_type 创建不同的客户端
-                if request_format == "gemini":
-                    client = GeminiClientWrapper(api_key=key, base_url=base_url or None, proxy=proxy)
-                elif request_format == "anthropic":
-                    client = AnthropicClientWrapper(api_key=key, base_url=base_url or None, proxy=proxy)
-                else:  # 默认 openai - 添加超时配置
-                    timeout = httpx.Timeout(120.0, connect=30.0)
-                    client = build_openai_async_client(
-                        api_key=key,
-                        base_url=base_url,
-                        timeout=timeout,
-                        proxy=proxy,
-                    )
+            for key_index, key in enumerate(keys):
+                handle = self._get_client(request_format, base_url, proxy, key, clients)
                 
                 for model_index, model in enumerate(models):
                     provider = base_url.split("//")[-1].split("/")[0] if base_url else "googleapis.com"
                     client_pool.append({
-                        "client": client,
+                        "client": handle.client,
+                        "client_handle": handle,
                         "model": model,
                         "provider": provider,
                         "api_type": api_type,
@@ -336,7 +751,11 @@ class LLMManager:
                         "model_index": model_index,  # 模型在列表中的索引，用于保证同一提供商内的模型按顺序调用
                         "proxy": proxy,
                         "id": f"[{model}] @ {provider}",
+                        "route_key": f"{entry.get('id')}/{key_index}/{model}",
+                        "seed_latency_ms": entry.get("avg_latency_ms"),
                         "provider_db_id": entry.get("id"),
+                        # 同一上游 Key 的所有模型共享限流器（None 表示未配置限额）
+                        "rate_limiter": rate_governor.limiter(base_url, key),
                     })
 
         # 按 is_primary DESC, priority ASC, model_index ASC 排序
@@ -367,131 +786,343 @@ class LLMManager:
         except (ValueError, TypeError):
             return settings.llm_max_retries
 
+    def _get_routing_mode(self) -> str:
+        """获取路由模式配置（sequential / adaptive）"""
+        return normalize_routing_mode(get_config("llm_routing_mode", settings.llm_routing_mode))
+
+    def _attempt_plan(self, target_pool: list, max_retries: int, hard_failed: set):
+        """
+        生成 (node, attempt) 尝试序列
+
+        - sequential: 按优先级逐个节点，每个节点竭尽 max_retries 次后再切换
+        - adaptive: 每轮按路由得分排序，每个节点尝试一次后立即切换；
+          熔断中的节点被跳过，仅在整轮无可用节点时兜底探测
+        """
+        if self._get_routing_mode() == ROUTING_MODE_ADAPTIVE:
+            for attempt in range(max_retries):
+                ordered = [n for n in self.router.order(target_pool) if node_route_key(n) not in hard_failed]
+                tried = False
+                for node in ordered:
+                    if not self.router.is_available(node):
+                        continue
+                    tried = True
+                    yield node, attempt
+                if not tried and ordered:
+                    yield ordered[0], attempt
+            return
+
+        for node in target_pool:
+            for attempt in range(max_retries):
+                if node_route_key(node) in hard_failed:
+                    break
+                yield node, attempt
+            # 当前 Provider 已用尽所有重试次数，切换到下一个
+            if node_route_key(node) in hard_failed:
+                logger.warning(f"⚠️ Provider {node['id']} 不可重试错误，切换到下一个")
+            else:
+                logger.warning(f"⚠️ Provider {node['id']} 已用尽 {max_retries} 次重试，切换到下一个")
+
+    def _record_success(self, node: dict, latency_ms: int) -> None:
+        """记录节点成功（路由状态 + 健康统计）"""
+        self.router.record_success(node, latency_ms)
+        if node.get("provider_db_id"):
+            provider_health.record_success(node["provider_db_id"], latency_ms)
+
+    def _record_failure(self, node: dict, error: Exception) -> None:
+        """记录节点失败（路由状态 + 健康统计）"""
+        if self.router.record_failure(node):
+            logger.warning(f"⚡ 节点 {node['id']} 已熔断 {self.router.cooldown_seconds:.0f}s")
+        if node.get("provider_db_id"):
+            provider_health.record_failure(node["provider_db_id"], str(error))
+
+    def _hedge_enabled(self, pool_name: str, hedge: bool | None) -> bool:
+        """是否对本次调用启用对冲（未显式指定时按 LLM_HEDGE_POOLS 配置）"""
+        if hedge is not None:
+            return hedge
+        hedge_pools = {p.strip() for p in (settings.llm_hedge_pools or "").split(",") if p.strip()}
+        return pool_name in hedge_pools
+
+    def _hedge_delay_seconds(self, node: dict) -> float:
+        """对冲等待时间：节点观测延迟的分位数，无样本时使用默认值"""
+        delay_ms = self.router.latency_percentile(node, settings.llm_hedge_percentile)
+        if delay_ms is None:
+            delay_ms = settings.llm_hedge_default_delay_ms
+        return max(delay_ms, settings.llm_hedge_min_delay_ms) / 1000
+
+    def _pick_hedge_node(self, target_pool: list, node: dict, hard_failed: set) -> dict | None:
+        """选择对冲节点：按路由顺序取第一个可用且不同于主请求的节点"""
+        primary_key = node_route_key(node)
+        for candidate in self.router.order(target_pool):
+            candidate_key = node_route_key(candidate)
+            if candidate_key == primary_key or candidate_key in hard_failed:
+                continue
+            if self.router.is_available(candidate):
+                return candidate
+        return None
+
+    async def _hedged_call(self, pool_name: str, node: dict, target_pool: list, hard_failed: set, run_attempt):
+        """
+        对冲请求：主请求超过观测延迟分位数仍未返回时，向下一个可用节点发送副本，
+        取先返回的有效结果（run_attempt 内已完成质检），并取消落后的请求
+        """
+        stats = self.hedge_stats.setdefault(
+            pool_name, {"hedged": 0, "hedge_wins": 0, "primary_wins": 0, "cancelled": 0}
+        )
+        tasks: dict[asyncio.Task, dict] = {asyncio.ensure_future(run_attempt(node)): node}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay_seconds(node))
+            if not done:
+                hedge_node = self._pick_hedge_node(target_pool, node, hard_failed)
+                if hedge_node is not None:
+                    hedged = True
+                    stats["hedged"] += 1
+                    logger.info(f"🪃 [{pool_name}] {node['id']} 响应较慢，对冲请求发往 {hedge_node['id']}")
+                    tasks[asyncio.ensure_future(run_attempt(hedge_node))] = hedge_node
+
+            primary_error = None
+            last_error = None
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task_node = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if hedged:
+                            stats["primary_wins" if task_node is node else "hedge_wins"] += 1
+                        return task.result()
+                    last_error = error
+                    if task_node is node:
+                        primary_error = error
+            raise primary_error or last_error
+        finally:
+            if tasks:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if hedged:
+                    stats["cancelled"] += len(tasks)
+
+    async def _request_node(self, node: dict, messages: list, temperature: float, response_format=None):
+        """对单个节点发起一次非流式调用，返回 chat.completions 兼容结构"""
+        request_format = node.get("request_format", node.get("api_type", "openai"))
+        if request_format in ("gemini", "anthropic"):
+            return await node["client"].create_chat_completion(
+                model=node["model"],
+                messages=messages,
+                temperature=temperature,
+                response_format=response_format
+            )
+
+        if request_format == "openai_response":
+            kwargs = {
+                "model": node["model"],
+                "input": messages,
+                "temperature": temperature,
+            }
+            text_config = _to_responses_text_config(response_format)
+            if text_config:
+                kwargs["text"] = text_config
+            response_obj = await node["client"].responses.create(**kwargs)
+            return OpenAIResponsesWrapper(response_obj)
+
+        # OpenAI
+        kwargs = {
+            "model": node["model"],
+            "messages": messages,
+            "temperature": temperature,
+        }
+        if response_format:
+            kwargs["response_format"] = response_format
+        try:
+            return await node["client"].chat.completions.create(**kwargs)
+        except APIStatusError as api_error:
+            # 降级兼容：部分中转/网关不支持 response_format(JSON mode)
+            status_code = getattr(getattr(api_error, "response", None), "status_code", None)
+            combined = (str(api_error) + " " + str(getattr(api_error, "body", ""))).lower()
+            if response_format and status_code in (400, 403) and (
+                "response_format" in combined or "json_object" in combined
+            ):
+                fallback_kwargs = dict(kwargs)
+                fallback_kwargs.pop("response_format", None)
+                logger.warning(f"⚠️ {node['id']} 不支持 response_format，已降级重试")
+                return await node["client"].chat.completions.create(**fallback_kwargs)
+            raise
+
+    def _model_family(self, target_pool: list) -> str:
+        """池子当前可能应答的模型集合（参与缓存键，模型配置变化后自然失效）"""
+        return ",".join(sorted({node["model"] for node in target_pool}))
+
     async def chat(self, pool_name: str, messages: list, response_format=None,
-                   temperature: float = 0.7, validator=None):
+                   temperature: float = 0.7, validator=None, hedge: bool | None = None,
+                   cache: bool | None = None):
         """
         调用 LLM，支持:
           - 顺序故障转移 (按 priority 顺序)
           - 单点竭尽重试 (每个 Provider 重试 N 次后再切换)
+          - 自适应路由 (llm_routing_mode=adaptive：按 EWMA 延迟/错误率排序 + 熔断)
+          - 对冲请求 (hedge=True 或池子在 LLM_HEDGE_POOLS 中：慢请求向下一节点发送副本)
+          - 响应缓存 (cache=None 时按 LLM_RESPONSE_CACHE_POOLS，cache=False 绕过缓存)
           - OpenAI、Gemini 和 Anthropic API
         """
         target_pool = self.pools.get(pool_name, [])
         if not target_pool:
             raise ValueError(f"❌ 池子 {pool_name} 为空，请在管理面板配置 LLM 提供商")
 
+        cache_key = None
+        if cache is True or (cache is None and llm_response_cache.enabled_for(pool_name)):
+            cache_key = make_cache_key(
+                pool_name, self._model_family(target_pool), messages, response_format, temperature
+            )
+            cached_content = await llm_response_cache.get(cache_key)
+            if cached_content is not None:
+                if validator is None or validator(cached_content):
+                    logger.info(f"💾 LLM 响应缓存命中 ({pool_name})")
+                    return CachedChatResponse(cached_content)
+                await llm_response_cache.invalidate(cache_key)
+
         max_retries = self._get_max_retries()
+        use_hedge = self._hedge_enabled(pool_name, hedge) and len(target_pool) > 1
         last_error = None
+        hard_failed: set[str] = set()
+        prompt_tokens = estimate_tokens(messages)
 
-        # 按优先级顺序遍历每个 Provider
-        for node in target_pool:
+        async def run_attempt(attempt_node: dict):
+            """单次请求 + 质检 + 记录结果（对冲副本同样走这里）"""
+            self.router.mark_attempt(attempt_node)
+            try:
+                # 上游 Key 限流：排队时间不计入节点延迟
+                async with throttle(attempt_node.get("rate_limiter"), prompt_tokens) as ticket, \
+                        _lease_client(attempt_node):
+                    start_time = time.monotonic()
+                    response = await self._request_node(attempt_node, messages, temperature, response_format)
+                    latency_ms = int((time.monotonic() - start_time) * 1000)
+                    ticket.settle(_response_tokens(response, prompt_tokens))
+
+                # 质检环节
+                if validator:
+                    content = response.choices[0].message.content
+                    if not validator(content):
+                        raise ValueError(f"内容质检未通过: {content[:50]}...")
+            except asyncio.CancelledError:
+                self.router.release_attempt(attempt_node)
+                raise
+            except Exception as e:
+                self._record_failure(attempt_node, e)
+                raise
+            self._record_success(attempt_node, latency_ms)
+            return response
+
+        for node, attempt in self._attempt_plan(target_pool, max_retries, hard_failed):
             provider_id = node['id']
-            hard_fail = False
-            
-            # 对当前 Provider 进行最多 max_retries 次尝试
-            for attempt in range(max_retries):
-                try:
-                    request_format = node.get("request_format", node.get("api_type", "openai"))
-                    if attempt == 0:
-                        llm_logger.log_request(pool_name, provider_id, request_format, node.get('priority', 1))
-                    else:
-                        llm_logger.log_retry(attempt, max_retries, provider_id, str(last_error))
+            try:
+                request_format = node.get("request_format", node.get("api_type", "openai"))
+                if attempt == 0:
+                    llm_logger.log_request(pool_name, provider_id, request_format, node.get('priority', 1))
+                else:
+                    llm_logger.log_retry(attempt, max_retries, provider_id, str(last_error))
 
-                    start_time = time.monotonic()
-                    # 根据 API 类型调用不同的方法
-                    if request_format == "gemini":
-                        response = await node["client"].create_chat_completion(
-                            model=node["model"],
-                            messages=messages,
-                            temperature=temperature,
-                            response_format=response_format
-                        )
-                    elif request_format == "anthropic":
-                        response = await node["client"].create_chat_completion(
-                            model=node["model"],
-                            messages=messages,
-                            temperature=temperature,
-                            response_format=response_format
-                        )
-                    elif request_format == "openai_response":
-                        kwargs = {
-                            "model": node["model"],
-                            "input": messages,
-                            "temperature": temperature,
-                        }
-                        text_config = _to_responses_text_config(response_format)
-                        if text_config:
-                            kwargs["text"] = text_config
-                        response_obj = await node["client"].responses.create(**kwargs)
-                        response = OpenAIResponsesWrapper(response_obj)
-                    else:  # OpenAI
-                        kwargs = {
-                            "model": node["model"],
-                            "messages": messages,
-                            "temperature": temperature,
-                        }
-                        if response_format:
-                            kwargs["response_format"] = response_format
-                        try:
-                            response = await node["client"].chat.completions.create(**kwargs)
-                        except APIStatusError as api_error:
-                            # 降级兼容：部分中转/网关不支持 response_format(JSON mode)
-                            status_code = getattr(getattr(api_error, "response", None), "status_code", None)
-                            combined = (str(api_error) + " " + str(getattr(api_error, "body", ""))).lower()
-                            if response_format and status_code in (400, 403) and (
-                                "response_format" in combined or "json_object" in combined
-                            ):
-                                fallback_kwargs = dict(kwargs)
-                                fallback_kwargs.pop("response_format", None)
-                                logger.warning(f"⚠️ {provider_id} 不支持 response_format，已降级重试")
-                                response = await node["client"].chat.completions.create(**fallback_kwargs)
-                            else:
-                                raise
-
-                    # 质检环节
-                    if validator:
-                        content = response.choices[0].message.content
-                        if not validator(content):
-                            raise ValueError(f"内容质检未通过: {content[:50]}...")
+                if use_hedge:
+                    response = await self._hedged_call(pool_name, node, target_pool, hard_failed, run_attempt)
+                else:
+                    response = await run_attempt(node)
+                if cache_key:
+                    # run_attempt 已完成质检，这里只缓存通过质检的响应
+                    await llm_response_cache.put(cache_key, pool_name, response.choices[0].message.content)
+                return response
 
-                    latency_ms = int((time.monotonic() - start_time) * 1000)
-                    if node.get("provider_db_id"):
-                        mark_provider_success(node["provider_db_id"], latency_ms)
-                    return response
-
-                except Exception as e:
-                    if node.get("provider_db_id"):
-                        mark_provider_failure(node["provider_db_id"], str(e))
-                    llm_logger.log_failure(provider_id, str(e))
-                    last_error = e
-
-                    # 400/401/403 往往是请求或权限问题，继续重试同一通道无意义，直接切换下一个 Provider
-                    if isinstance(e, APIStatusError):
-                        status_code = getattr(getattr(e, "response", None), "status_code", None)
-                        if status_code in (400, 401, 403):
-                            logger.warning(f"⚠️ Provider {provider_id} 返回 {status_code}，不再重试该通道")
-                            hard_fail = True
-                            break
-
-                    # 继续当前 Provider 的下一次重试
-                    continue
-            
-            # 当前 Provider 已用尽所有重试次数，切换到下一个
-            if hard_fail:
-                logger.warning(f"⚠️ Provider {provider_id} 不可重试错误，切换到下一个")
-            else:
-                logger.warning(f"⚠️ Provider {provider_id} 已用尽 {max_retries} 次重试，切换到下一个")
+            except Exception as e:
+                llm_logger.log_failure(provider_id, str(e))
+                last_error = e
+
+                # 400/401/403 往往是请求或权限问题，继续重试同一通道无意义，直接切换下一个 Provider
+                if isinstance(e, APIStatusError):
+                    status_code = getattr(getattr(e, "response", None), "status_code", None)
+                    if status_code in (400, 401, 403):
+                        logger.warning(f"⚠️ Provider {provider_id} 返回 {status_code}，不再重试该通道")
+                        hard_failed.add(node_route_key(node))
 
         # 所有 Provider 均已尝试完毕
         llm_logger.log_exhausted()
         raise last_error or ValueError("所有 LLM 通道均不可用")
 
+    async def _stream_node(self, node: dict, messages: list, temperature: float, response_format=None):
+        """
+        对单个节点发起原生流式调用，逐段 yield 文本
+
+        - openai: chat.completions(stream=True)
+        - openai_response: responses.create(stream=True)
+        - gemini: streamGenerateContent (SSE)
+        - anthropic: Messages stream (SSE)
+        """
+        request_format = node.get("request_format", node.get("api_type", "openai"))
+
+        if request_format in ("gemini", "anthropic"):
+            async for piece in node["client"].stream_chat_completion(
+                model=node["model"],
+                messages=messages,
+                temperature=temperature,
+                response_format=response_format
+            ):
+                yield piece
+            return
+
+        if request_format == "openai_response":
+            kwargs = {
+                "model": node["model"],
+                "input": messages,
+                "temperature": temperature,
+                "stream": True,
+            }
+            text_config = _to_responses_text_config(response_format)
+            if text_config:
+                kwargs["text"] = text_config
+            stream = await node["client"].responses.create(**kwargs)
+            async for event in stream:
+                event_type = getattr(event, "type", "")
+                if event_type == "response.output_text.delta":
+                    if event.delta:
+                        yield event.delta
+                elif event_type in ("response.failed", "error"):
+                    raise RuntimeError(f"Responses 流式响应错误: {event}")
+            return
+
+        # OpenAI chat.completions 流式调用
+        stream_kwargs = {
+            "model": node["model"],
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True
+        }
+        if response_format:
+            stream_kwargs["response_format"] = response_format
+        try:
+            stream = await node["client"].chat.completions.create(**stream_kwargs)
+        except APIStatusError as api_error:
+            status_code = getattr(getattr(api_error, "response", None), "status_code", None)
+            combined = (str(api_error) + " " + str(getattr(api_error, "body", ""))).lower()
+            if response_format and status_code in (400, 403) and (
+                "response_format" in combined or "json_object" in combined
+            ):
+                fallback_kwargs = dict(stream_kwargs)
+                fallback_kwargs.pop("response_format", None)
+                logger.warning(f"⚠️ {node['id']} 不支持 response_format，已降级重试")
+                stream = await node["client"].chat.completions.create(**fallback_kwargs)
+            else:
+                raise
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     async def chat_stream(self, pool_name: str, messages: list,
                           temperature: float = 0.7, on_chunk=None, response_format=None):
         """
         流式调用 LLM，支持:
           - 顺序故障转移 (按 priority 顺序)
           - 单点竭尽重试 (每个 Provider 重试 N 次后再切换)
-          - 实时返回生成内容
+          - 实时返回生成内容（OpenAI / OpenAI Responses / Gemini / Anthropic 均为原生流式）
+          - 已通过 on_chunk 输出部分内容后出错直接抛出（换节点重新生成会让回调收到重复或混杂的文本）
         
         Args:
             pool_name: 池子名称 (metadata/analysis)
@@ -499,9 +1130,6 @@ class LLMManager:
             temperature: 温度参数
             on_chunk: 可选的回调函数，每收到一个 chunk 时调用
         
-        Yields:
-            str: 每个生成的文本片段
-        
         Returns:
             str: 完整的生成内容
         """
@@ -511,108 +1139,105 @@ class LLMManager:
 
         max_retries = self._get_max_retries()
         last_error = None
+        prompt_tokens = estimate_tokens(messages)
 
-        # 按优先级顺序遍历每个 Provider
-        for node in target_pool:
+        for node, attempt in self._attempt_plan(target_pool, max_retries, set()):
             provider_id = node['id']
-            
-            # 对当前 Provider 进行最多 max_retries 次尝试
-            for attempt in range(max_retries):
-                try:
-                    request_format = node.get("request_format", node.get("api_type", "openai"))
-                    if attempt == 0:
-                        llm_logger.log_request(pool_name, provider_id, request_format, node.get('priority', 1))
-                    else:
-                        llm_logger.log_retry(attempt, max_retries, provider_id, str(last_error))
+            emitted = False
+            try:
+                request_format = node.get("request_format", node.get("api_type", "openai"))
+                if attempt == 0:
+                    llm_logger.log_request(pool_name, provider_id, request_format, node.get('priority', 1))
+                else:
+                    llm_logger.log_retry(attempt, max_retries, provider_id, str(last_error))
 
+                self.router.mark_attempt(node)
+                content_parts = []
+                async with throttle(node.get("rate_limiter"), prompt_tokens) as ticket, _lease_client(node):
                     start_time = time.monotonic()
-                    # 目前只有 OpenAI 兼容 API 支持流式
-                    if request_format != "openai":
-                        # 对于不支持流式的 API，回退到普通调用
-                        logger.info(f"⚠️ {request_format} 不支持流式，使用普通调用")
-                        if request_format == "gemini":
-                            response = await node["client"].create_chat_completion(
-                                model=node["model"],
-                                messages=messages,
-                                temperature=temperature,
-                                response_format=response_format
-                            )
-                        elif request_format == "anthropic":
-                            response = await node["client"].create_chat_completion(
-                                model=node["model"],
-                                messages=messages,
-                                temperature=temperature,
-                                response_format=response_format
-                            )
-                        elif request_format == "openai_response":
-                            kwargs = {
-                                "model": node["model"],
-                                "input": messages,
-                                "temperature": temperature,
-                            }
-                            text_config = _to_responses_text_config(response_format)
-                            if text_config:
-                                kwargs["text"] = text_config
-                            response_obj = await node["client"].responses.create(**kwargs)
-                            response = OpenAIResponsesWrapper(response_obj)
-                        else:
-                            raise ValueError(f"不支持的 request_format: {request_format}")
-                        content = response.choices[0].message.content
+                    async for content_piece in self._stream_node(node, messages, temperature, response_format):
+                        content_parts.append(content_piece)
                         if on_chunk:
-                            on_chunk(content)
-                        latency_ms = int((time.monotonic() - start_time) * 1000)
-                        if node.get("provider_db_id"):
-                            mark_provider_success(node["provider_db_id"], latency_ms)
-                        return content
-                    
-                    # OpenAI 流式调用
-                    full_content = ""
-                    stream_kwargs = {
-                        "model": node["model"],
-                        "messages": messages,
-                        "temperature": temperature,
-                        "stream": True
-                    }
-                    if response_format:
-                        stream_kwargs["response_format"] = response_format
+                            emitted = True
+                            on_chunk(content_piece)
+                    full_content = "".join(content_parts)
+                    latency_ms = int((time.monotonic() - start_time) * 1000)
+                    ticket.settle(prompt_tokens + estimate_tokens([full_content]))
+
+                logger.info(f"✅ 流式响应完成，总长度: {len(full_content)}")
+                self._record_success(node, latency_ms)
+                return full_content
+
+            except asyncio.CancelledError:
+                self.router.release_attempt(node)
+                raise
+            except Exception as e:
+                self._record_failure(node, e)
+                llm_logger.log_failure(provider_id, str(e))
+                last_error = e
+                if emitted:
+                    raise
+
+        # 所有 Provider 均已尝试完毕
+        llm_logger.log_exhausted()
+        raise last_error or ValueError("所有 LLM 通道均不可用")
+
+    async def iter_chat_stream(self, pool_name: str, messages: list,
+                               temperature: float = 0.7, response_format=None):
+        """
+        流式调用 LLM 的异步迭代器版本，逐段 yield 生成内容（用于 SSE 逐 token 推送）
+
+        - 尚未输出任何内容时按 chat_stream 相同的策略重试/故障转移
+        - 已输出部分内容后出错直接抛出（换节点重新生成会让调用方收到重复文本）
+        - 调用方停止迭代（aclose / 任务取消）时关闭上游流并释放节点
+        """
+        target_pool = self.pools.get(pool_name, [])
+        if not target_pool:
+            raise ValueError(f"❌ 池子 {pool_name} 为空，请在管理面板配置 LLM 提供商")
+
+        max_retries = self._get_max_retries()
+        last_error = None
+        prompt_tokens = estimate_tokens(messages)
+
+        for node, attempt in self._attempt_plan(target_pool, max_retries, set()):
+            provider_id = node['id']
+            emitted = False
+            try:
+                request_format = node.get("request_format", node.get("api_type", "openai"))
+                if attempt == 0:
+                    llm_logger.log_request(pool_name, provider_id, request_format, node.get('priority', 1))
+                else:
+                    llm_logger.log_retry(attempt, max_retries, provider_id, str(last_error))
+
+                self.router.mark_attempt(node)
+                content_parts = []
+                async with throttle(node.get("rate_limiter"), prompt_tokens) as ticket, _lease_client(node):
+                    start_time = time.monotonic()
+                    stream = self._stream_node(node, messages, temperature, response_format)
                     try:
-                        stream = await node["client"].chat.completions.create(**stream_kwargs)
-                    except APIStatusError as api_error:
-                        status_code = getattr(getattr(api_error, "response", None), "status_code", None)
-                        combined = (str(api_error) + " " + str(getattr(api_error, "body", ""))).lower()
-                        if response_format and status_code in (400, 403) and (
-                            "response_format" in combined or "json_object" in combined
-                        ):
-                            fallback_kwargs = dict(stream_kwargs)
-                            fallback_kwargs.pop("response_format", None)
-                            logger.warning(f"⚠️ {provider_id} 不支持 response_format，已降级重试")
-                            stream = await node["client"].chat.completions.create(**fallback_kwargs)
-                        else:
-                            raise
-                    
-                    async for chunk in stream:
-                        if chunk.choices and chunk.choices[0].delta.content:
-                            content_piece = chunk.choices[0].delta.content
-                            full_content += content_piece
-                            if on_chunk:
-                                on_chunk(content_piece)
-
-                    logger.info(f"✅ 流式响应完成，总长度: {len(full_content)}")
+                        async for content_piece in stream:
+                            content_parts.append(content_piece)
+                            emitted = True
+                            yield content_piece
+                    finally:
+                        await stream.aclose()
+                    full_content = "".join(content_parts)
                     latency_ms = int((time.monotonic() - start_time) * 1000)
-                    if node.get("provider_db_id"):
-                        mark_provider_success(node["provider_db_id"], latency_ms)
-                    return full_content
-
-                except Exception as e:
-                    if node.get("provider_db_id"):
-                        mark_provider_failure(node["provider_db_id"], str(e))
-                    llm_logger.log_failure(provider_id, str(e))
-                    last_error = e
-                    # 继续当前 Provider 的下一次重试
-                    continue
-            
-            # 当前 Provider 已用尽所有重试次数，切换到下一个
-            logger.warning(f"⚠️ Provider {provider_id} 已用尽 {max_retries} 次重试，切换到下一个")
+                    ticket.settle(prompt_tokens + estimate_tokens([full_content]))
+
+                logger.info(f"✅ 流式响应完成，总长度: {len(full_content)}")
+                self._record_success(node, latency_ms)
+                return
+
+            except (asyncio.CancelledError, GeneratorExit):
+                self.router.release_attempt(node)
+                raise
+            except Exception as e:
+                self._record_failure(node, e)
+                llm_logger.log_failure(provider_id, str(e))
+                last_error = e
+                if emitted:
+                    raise
 
         # 所有 Provider 均已尝试完毕
         llm_logger.log_exhausted()
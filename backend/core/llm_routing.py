@@ -0,0 +1,205 @@
+"""
+LLM 自适应路由模块
+按节点近期的 EWMA 延迟与错误率打分，并为持续失败的节点提供熔断（冷却窗口），
+使故障转移在进程内毫秒级完成，而不必等待 N 次完整超时。
+"""
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from backend.core.provider_health import apply_ewma
+from backend.core.settings import settings
+
+ROUTING_MODE_SEQUENTIAL = "sequential"
+ROUTING_MODE_ADAPTIVE = "adaptive"
+SUPPORTED_ROUTING_MODES = {ROUTING_MODE_SEQUENTIAL, ROUTING_MODE_ADAPTIVE}
+
+# 每个节点保留的最近延迟样本数（用于分位数估计）
+_LATENCY_WINDOW = 64
+
+# 错误率对得分的放大系数：错误率 50% 的节点得分约为同延迟健康节点的 3 倍
+_ERROR_RATE_PENALTY = 4.0
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+def normalize_routing_mode(value: Optional[str]) -> str:
+    """规范化路由模式，未知值回退为顺序模式"""
+    mode = (value or "").strip().lower()
+    return mode if mode in SUPPORTED_ROUTING_MODES else ROUTING_MODE_SEQUENTIAL
+
+
+def node_route_key(node: dict) -> str:
+    """节点唯一标识（同一 Provider 的不同 Key / 模型分别统计）"""
+    return node.get("route_key") or node["id"]
+
+
+def node_tier(node: dict) -> tuple:
+    """节点所属优先级层级：主模型优先，其次 priority"""
+    return (not node.get("is_primary", False), node.get("priority", 1))
+
+
+@dataclass
+class NodeRouteState:
+    """单个节点的路由状态"""
+    ewma_latency_ms: Optional[float] = None
+    ewma_error_rate: float = 0.0
+    consecutive_failures: int = 0
+    circuit: str = CIRCUIT_CLOSED
+    opened_until: float = 0.0
+    probe_in_flight: bool = False
+    recent_latencies: deque = field(default_factory=lambda: deque(maxlen=_LATENCY_WINDOW))
+
+
+class AdaptiveRouter:
+    """基于 EWMA 延迟/错误率打分 + 熔断的节点路由器（进程内状态）"""
+
+    def __init__(
+        self,
+        failure_threshold: int = None,
+        cooldown_seconds: float = None,
+        ewma_alpha: float = None,
+    ):
+        self.failure_threshold = failure_threshold or settings.llm_circuit_failure_threshold
+        self.cooldown_seconds = cooldown_seconds if cooldown_seconds is not None else settings.llm_circuit_cooldown_seconds
+        self.ewma_alpha = ewma_alpha if ewma_alpha is not None else settings.llm_health_ewma_alpha
+        self._states: dict[str, NodeRouteState] = {}
+        self._lock = threading.Lock()
+
+    def _get_state(self, node: dict) -> NodeRouteState:
+        key = node_route_key(node)
+        state = self._states.get(key)
+        if state is None:
+            state = NodeRouteState(ewma_latency_ms=node.get("seed_latency_ms"))
+            self._states[key] = state
+        return state
+
+    def _refresh_circuit(self, state: NodeRouteState, now: float) -> None:
+        """冷却窗口结束后转为半开状态，允许一次探测请求"""
+        if state.circuit == CIRCUIT_OPEN and now >= state.opened_until:
+            state.circuit = CIRCUIT_HALF_OPEN
+            state.probe_in_flight = False
+
+    def is_available(self, node: dict) -> bool:
+        """节点当前是否可接收流量（熔断打开时不可用，半开时仅允许一次探测）"""
+        with self._lock:
+            state = self._get_state(node)
+            self._refresh_circuit(state, time.monotonic())
+            if state.circuit == CIRCUIT_OPEN:
+                return False
+            if state.circuit == CIRCUIT_HALF_OPEN:
+                return not state.probe_in_flight
+            return True
+
+    def mark_attempt(self, node: dict) -> None:
+        """记录即将发起的请求（半开状态下占用探测名额）"""
+        with self._lock:
+            state = self._get_state(node)
+            if state.circuit == CIRCUIT_HALF_OPEN:
+                state.probe_in_flight = True
+
+    def release_attempt(self, node: dict) -> None:
+        """请求被取消（未得出结果）时释放半开探测名额"""
+        with self._lock:
+            self._get_state(node).probe_in_flight = False
+
+    def score(self, node: dict, default_latency_ms: float = 0.0) -> float:
+        """节点得分，越小越优"""
+        state = self._get_state(node)
+        latency = state.ewma_latency_ms if state.ewma_latency_ms is not None else default_latency_ms
+        weight = max(node.get("weight") or 1, 1)
+        return latency * (1 + _ERROR_RATE_PENALTY * state.ewma_error_rate) / weight
+
+    def order(self, pool: list) -> list:
+        """
+        生成本轮尝试顺序:
+          1. 按优先级层级分组，层级之间保持原有顺序
+          2. 层级内按得分排序，仅包含可用节点
+          3. 熔断中的节点放在最后（按恢复时间先后），保证请求不会仅因熔断而失败
+        """
+        now = time.monotonic()
+        with self._lock:
+            tiers: dict[tuple, list] = {}
+            unavailable = []
+            for node in pool:
+                state = self._get_state(node)
+                self._refresh_circuit(state, now)
+                if state.circuit == CIRCUIT_OPEN or (state.circuit == CIRCUIT_HALF_OPEN and state.probe_in_flight):
+                    unavailable.append((state.opened_until, node))
+                else:
+                    tiers.setdefault(node_tier(node), []).append(node)
+
+            ordered = []
+            for tier in sorted(tiers):
+                nodes = tiers[tier]
+                known = [
+                    self._states[node_route_key(n)].ewma_latency_ms
+                    for n in nodes
+                    if self._states[node_route_key(n)].ewma_latency_ms is not None
+                ]
+                # 未观测过的节点按层级内最快节点估计，保证其有机会被探索
+                default_latency = min(known) if known else 0.0
+                ordered.extend(sorted(nodes, key=lambda n: self.score(n, default_latency)))
+
+            unavailable.sort(key=lambda item: item[0])
+            ordered.extend(node for _, node in unavailable)
+            return ordered
+
+    def record_success(self, node: dict, latency_ms: int) -> None:
+        """记录成功：更新延迟/错误率并关闭熔断"""
+        with self._lock:
+            state = self._get_state(node)
+            state.ewma_latency_ms = apply_ewma(state.ewma_latency_ms, latency_ms, self.ewma_alpha)
+            state.recent_latencies.append(latency_ms)
+            state.ewma_error_rate = apply_ewma(state.ewma_error_rate, 0.0, self.ewma_alpha)
+            state.consecutive_failures = 0
+            state.circuit = CIRCUIT_CLOSED
+            state.probe_in_flight = False
+
+    def record_failure(self, node: dict) -> bool:
+        """记录失败，返回本次是否触发熔断"""
+        with self._lock:
+            state = self._get_state(node)
+            state.ewma_error_rate = apply_ewma(state.ewma_error_rate, 1.0, self.ewma_alpha)
+            state.consecutive_failures += 1
+            state.probe_in_flight = False
+            should_open = (
+                state.circuit == CIRCUIT_HALF_OPEN
+                or state.consecutive_failures >= self.failure_threshold
+            )
+            if should_open:
+                state.circuit = CIRCUIT_OPEN
+                state.opened_until = time.monotonic() + self.cooldown_seconds
+            return should_open
+
+    def latency_percentile(self, node: dict, percentile: float) -> Optional[float]:
+        """节点最近成功请求延迟的分位数（毫秒），无样本时返回 None"""
+        with self._lock:
+            samples = sorted(self._get_state(node).recent_latencies)
+        if not samples:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * len(samples)))
+        return float(samples[min(rank, len(samples)) - 1])
+
+    def snapshot(self) -> list[dict]:
+        """导出当前路由状态（管理面板展示用）"""
+        now = time.monotonic()
+        with self._lock:
+            result = []
+            for key, state in self._states.items():
+                self._refresh_circuit(state, now)
+                result.append({
+                    "node": key,
+                    "circuit": state.circuit,
+                    "ewma_latency_ms": int(state.ewma_latency_ms) if state.ewma_latency_ms is not None else None,
+                    "ewma_error_rate": round(state.ewma_error_rate, 3),
+                    "consecutive_failures": state.consecutive_failures,
+                    "cooldown_remaining_s": round(max(0.0, state.opened_until - now), 1)
+                    if state.circuit == CIRCUIT_OPEN else 0.0,
+                })
+            return result
@@ -3,12 +3,23 @@ LLM 服务模块 - 处理 LLM 提供商的 CRUD 操作
 """
 import json
 import os
-from datetime import datetime
-from backend.core.db_service import get_db_session, SessionLocal
+import time
+from backend.core.db_service import get_db_session, SessionLocal, set_config
 from backend.core.db_models import LLMProvider
 from backend.core.llm_format import normalize_request_format, format_to_legacy_api_type
 
 
+# SystemConfig 中的 LLM 配置版本标记：提供商配置变更后写入新值，各进程据此判断是否需要重载
+LLM_CONFIG_VERSION_KEY = "llm_config_version"
+
+
+def bump_llm_config_version() -> str:
+    """标记 LLM 提供商配置已变更，返回新的版本标记"""
+    marker = str(time.time_ns())
+    set_config(LLM_CONFIG_VERSION_KEY, marker)
+    return marker
+
+
 # ================= CRUD 操作 =================
 
 def get_all_providers(pool_type: str = None) -> list[dict]:
@@ -40,6 +51,8 @@ def get_all_providers(pool_type: str = None) -> list[dict]:
                 "last_failure_at": getattr(p, "last_failure_at", None),
                 "last_error": getattr(p, "last_error", None),
                 "avg_latency_ms": getattr(p, "avg_latency_ms", None),
+                "success_count": getattr(p, "success_count", None),
+                "failure_count": getattr(p, "failure_count", None),
             }
             for p in providers
         ]
@@ -82,29 +95,33 @@ def get_enabled_providers(pool_type: str) -> list[dict]:
         ]
 
 
-def mark_provider_success(provider_id: int, latency_ms: int) -> None:
-    """记录提供商健康状态（成功）"""
-    with get_db_session() as session:
-        provider = session.query(LLMProvider).get(provider_id)
-        if not provider:
-            return
-        provider.last_success_at = str(datetime.now().isoformat())
-        provider.last_error = None
-        if latency_ms is not None:
-            if provider.avg_latency_ms is None:
-                provider.avg_latency_ms = latency_ms
-            else:
-                provider.avg_latency_ms = int((provider.avg_latency_ms + latency_ms) / 2)
-
-
-def mark_provider_failure(provider_id: int, error: str) -> None:
-    """记录提供商健康状态（失败）"""
+def apply_provider_health_batch(batch: dict[int, dict], ewma_alpha: float) -> None:
+    """
+    批量写入提供商健康统计（由 provider_health 后台任务调用）
+
+    Args:
+        batch: {provider_id: {success, failure, latencies, last_success_at, last_failure_at, last_error}}
+        ewma_alpha: EWMA 平滑系数，延迟样本按顺序叠加到库中已有的 avg_latency_ms
+    """
+    if not batch:
+        return
     with get_db_session() as session:
-        provider = session.query(LLMProvider).get(provider_id)
-        if not provider:
-            return
-        provider.last_failure_at = str(datetime.now().isoformat())
-        provider.last_error = error[:500] if error else None
+        providers = session.query(LLMProvider).filter(LLMProvider.id.in_(list(batch.keys()))).all()
+        for provider in providers:
+            delta = batch[provider.id]
+            provider.success_count = (provider.success_count or 0) + delta["success"]
+            provider.failure_count = (provider.failure_count or 0) + delta["failure"]
+            if delta["last_success_at"]:
+                provider.last_success_at = delta["last_success_at"]
+            if delta["last_failure_at"]:
+                provider.last_failure_at = delta["last_failure_at"]
+            provider.last_error = delta["last_error"]
+
+            avg = provider.avg_latency_ms
+            for latency_ms in delta["latencies"]:
+                avg = latency_ms if avg is None else ewma_alpha * latency_ms + (1 - ewma_alpha) * avg
+            if avg is not None:
+                provider.avg_latency_ms = int(avg)
 
 
 def add_provider(name: str, base_url: str, api_key: str, pool_type: str, 
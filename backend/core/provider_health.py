@@ -0,0 +1,181 @@
+"""
+LLM 提供商健康统计模块
+在内存中聚合每次调用的成功/失败与延迟（EWMA），由后台任务定期批量写入数据库，
+避免在 LLM 调用热路径上同步写库。
+"""
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+
+logger = get_logger("provider_health")
+
+# 单个 Provider 在两次落库之间最多缓存的延迟样本数
+_MAX_PENDING_LATENCIES = 200
+
+
+@dataclass
+class ProviderHealthStats:
+    """单个 Provider 的健康统计"""
+    ewma_latency_ms: Optional[float] = None
+    success_count: int = 0
+    failure_count: int = 0
+    last_success_at: Optional[str] = None
+    last_failure_at: Optional[str] = None
+    last_error: Optional[str] = None
+    # 以下为待落库的增量
+    pending_success: int = 0
+    pending_failure: int = 0
+    pending_latencies: list[int] = field(default_factory=list)
+    pending_error: bool = False
+
+
+def apply_ewma(current: Optional[float], sample: float, alpha: float) -> float:
+    """指数加权移动平均"""
+    if current is None:
+        return float(sample)
+    return alpha * sample + (1 - alpha) * current
+
+
+class ProviderHealthAggregator:
+    """Provider 健康统计聚合器（内存聚合 + 后台批量落库）"""
+
+    def __init__(self, flush_interval: float = None, ewma_alpha: float = None):
+        self.flush_interval = flush_interval if flush_interval is not None else settings.llm_health_flush_interval
+        self.ewma_alpha = ewma_alpha if ewma_alpha is not None else settings.llm_health_ewma_alpha
+        self._stats: dict[int, ProviderHealthStats] = {}
+        self._lock = threading.Lock()
+        self._worker_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        """检查后台落库任务是否运行中"""
+        return self._worker_task is not None and not self._worker_task.done()
+
+    def _get_stats(self, provider_id: int) -> ProviderHealthStats:
+        stats = self._stats.get(provider_id)
+        if stats is None:
+            stats = ProviderHealthStats()
+            self._stats[provider_id] = stats
+        return stats
+
+    def record_success(self, provider_id: int, latency_ms: int) -> None:
+        """记录一次成功调用（仅更新内存，不阻塞调用方）"""
+        with self._lock:
+            stats = self._get_stats(provider_id)
+            stats.success_count += 1
+            stats.pending_success += 1
+            stats.last_success_at = datetime.now().isoformat()
+            stats.last_error = None
+            stats.pending_error = True
+            if latency_ms is not None:
+                stats.ewma_latency_ms = apply_ewma(stats.ewma_latency_ms, latency_ms, self.ewma_alpha)
+                if len(stats.pending_latencies) < _MAX_PENDING_LATENCIES:
+                    stats.pending_latencies.append(int(latency_ms))
+        self.ensure_worker()
+
+    def record_failure(self, provider_id: int, error: str) -> None:
+        """记录一次失败调用（仅更新内存，不阻塞调用方）"""
+        with self._lock:
+            stats = self._get_stats(provider_id)
+            stats.failure_count += 1
+            stats.pending_failure += 1
+            stats.last_failure_at = datetime.now().isoformat()
+            stats.last_error = error[:500] if error else None
+            stats.pending_error = True
+        self.ensure_worker()
+
+    def get_stats(self, provider_id: int) -> Optional[ProviderHealthStats]:
+        """获取内存中的健康统计（只读使用）"""
+        return self._stats.get(provider_id)
+
+    def _drain_pending(self) -> dict[int, dict]:
+        """取出所有待落库增量并清空"""
+        batch = {}
+        with self._lock:
+            for provider_id, stats in self._stats.items():
+                if not (stats.pending_success or stats.pending_failure or stats.pending_error):
+                    continue
+                batch[provider_id] = {
+                    "success": stats.pending_success,
+                    "failure": stats.pending_failure,
+                    "latencies": stats.pending_latencies,
+                    "last_success_at": stats.last_success_at,
+                    "last_failure_at": stats.last_failure_at,
+                    "last_error": stats.last_error,
+                }
+                stats.pending_success = 0
+                stats.pending_failure = 0
+                stats.pending_latencies = []
+                stats.pending_error = False
+        return batch
+
+    def _restore_pending(self, batch: dict[int, dict]) -> None:
+        """落库失败时把取出的增量合并回内存，下次落库一并写入（期间的新增量保留在其后）"""
+        with self._lock:
+            for provider_id, item in batch.items():
+                stats = self._get_stats(provider_id)
+                stats.pending_success += item["success"]
+                stats.pending_failure += item["failure"]
+                stats.pending_latencies = (item["latencies"] + stats.pending_latencies)[-_MAX_PENDING_LATENCIES:]
+                stats.pending_error = True
+
+    def flush_sync(self) -> int:
+        """同步落库（线程中或进程退出时调用），返回写入的 Provider 数"""
+        from backend.core.llm_service import apply_provider_health_batch
+
+        batch = self._drain_pending()
+        if not batch:
+            return 0
+        try:
+            apply_provider_health_batch(batch, self.ewma_alpha)
+        except Exception as e:
+            self._restore_pending(batch)
+            logger.warning(f"⚠️ Provider 健康统计落库失败，保留到下次重试: {e}")
+            return 0
+        return len(batch)
+
+    async def flush(self) -> int:
+        """在线程池中落库，不阻塞事件循环"""
+        return await asyncio.to_thread(self.flush_sync)
+
+    async def start_worker(self) -> None:
+        """后台循环：每隔 flush_interval 秒批量落库"""
+        logger.info(f"Provider 健康统计落库任务启动，间隔 {self.flush_interval}s")
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            await self.flush()
+            raise
+
+    def ensure_worker(self) -> None:
+        """在有事件循环时按需启动后台落库任务"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self.is_running and self._worker_task.get_loop() is loop:
+            return
+        self._worker_task = loop.create_task(self.start_worker())
+
+    async def stop_worker(self) -> None:
+        """停止后台任务并落库剩余数据"""
+        task, self._worker_task = self._worker_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        else:
+            await self.flush()
+
+
+# 全局实例
+provider_health = ProviderHealthAggregator()
@@ -0,0 +1,365 @@
+"""
+上游 Key 级限流模块
+同一个上游 API Key 可能同时被元数据/分析池与论文翻译使用，各自的重试逻辑会叠加放大 429。
+这里按 (base_url 主机, API Key) 维护进程级令牌桶（RPM / TPM）与并发上限，
+超出限额的请求排队等待而不是直接失败。
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+
+logger = get_logger("rate_governor")
+
+# 翻译占用配额时，LLM 调用至少保留的 RPM 比例，避免元数据/分析被完全饿死
+_MIN_SHARE = 0.2
+
+# 排队超过该时长（秒）时输出一次日志
+_SLOW_WAIT_LOG_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """单个上游 Key 的限额（0 表示不限制）"""
+    rpm: int = 0
+    tpm: int = 0
+    max_concurrency: int = 0
+
+    @property
+    def unlimited(self) -> bool:
+        return not (self.rpm or self.tpm or self.max_concurrency)
+
+
+def estimate_tokens(messages: list) -> int:
+    """粗略估算消息的 token 数：ASCII 约 4 字符 1 token，中日韩等字符按 1 字符 1 token"""
+    ascii_chars = 0
+    other_chars = 0
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else message
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False) if content else ""
+        for ch in content:
+            if ord(ch) < 128:
+                ascii_chars += 1
+            else:
+                other_chars += 1
+    return max(1, ascii_chars // 4 + other_chars)
+
+
+def rate_key(base_url: Optional[str], api_key: Optional[str]) -> tuple[str, str]:
+    """
+    限流键：(主机, Key 摘要)
+
+    同一主机下不同路径（如 Gemini 原生接口与 /openai 兼容接口）共享同一个上游配额，
+    因此按主机而非完整 base_url 归并；Key 只保存摘要，避免在内存快照中暴露明文。
+    """
+    host = urlparse((base_url or "").strip()).netloc.lower()
+    digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+    return host, digest
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶，允许透支（用于按实际用量结算）"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, per_minute: float) -> None:
+        elapsed = now - self.updated
+        self.updated = now
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * per_minute / 60.0)
+
+    def wait_time(self, amount: float, per_minute: float) -> float:
+        """取走 amount 个令牌还需等待的秒数（单次请求超过桶容量时按容量计）"""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        if per_minute <= 0:
+            return 60.0
+        return (amount - self.tokens) * 60.0 / per_minute
+
+
+class KeyRateLimiter:
+    """单个上游 Key 的 RPM / TPM 令牌桶 + 并发上限（跨事件循环、跨线程安全）"""
+
+    def __init__(self, label: str, limit: RateLimit):
+        self.label = label
+        self.limit = limit
+        self.reserved_rpm = 0
+        self._request_bucket = TokenBucket(limit.rpm) if limit.rpm else None
+        self._token_bucket = TokenBucket(limit.tpm) if limit.tpm else None
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self.waited_requests = 0
+        self.total_wait_seconds = 0.0
+
+    def _effective_rpm(self) -> float:
+        """扣除翻译预留后的可用 RPM"""
+        rpm = self.limit.rpm
+        return max(rpm - self.reserved_rpm, rpm * _MIN_SHARE)
+
+    def _try_take(self, tokens: int) -> float:
+        """尝试扣减令牌，成功返回 0，否则返回需等待的秒数（调用方持有锁）"""
+        now = time.monotonic()
+        waits = []
+        if self._request_bucket is not None:
+            rpm = self._effective_rpm()
+            self._request_bucket.refill(now, rpm)
+            waits.append(self._request_bucket.wait_time(1, rpm))
+        if self._token_bucket is not None:
+            self._token_bucket.refill(now, self.limit.tpm)
+            waits.append(self._token_bucket.wait_time(tokens, self.limit.tpm))
+        wait = max(waits, default=0.0)
+        if wait > 0:
+            return wait
+        if self._request_bucket is not None:
+            self._request_bucket.tokens -= 1
+        if self._token_bucket is not None:
+            self._token_bucket.tokens -= min(tokens, self._token_bucket.capacity)
+        return 0.0
+
+    async def _acquire_slot(self) -> None:
+        """占用一个并发名额，满员时按 FIFO 排队"""
+        if not self.limit.max_concurrency:
+            return
+        with self._lock:
+            if self._in_flight < self.limit.max_concurrency and not self._waiters:
+                self._in_flight += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, waiter))
+                    handed_over = False
+                except ValueError:
+                    # 已出队说明名额已转交给本请求，需要继续转交
+                    handed_over = True
+            if handed_over:
+                self._release_slot()
+            raise
+
+    def _release_slot(self) -> None:
+        """释放并发名额：优先直接转交给队首等待者"""
+        if not self.limit.max_concurrency:
+            return
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if waiter.done() or loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(_wake_waiter, waiter)
+                return
+            self._in_flight = max(0, self._in_flight - 1)
+
+    async def acquire(self, tokens: int) -> float:
+        """排队直到并发与令牌均可用，返回等待时长（秒）"""
+        start = time.monotonic()
+        await self._acquire_slot()
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_take(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._release_slot()
+            raise
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            with self._lock:
+                self.waited_requests += 1
+                self.total_wait_seconds += waited
+            if waited >= _SLOW_WAIT_LOG_SECONDS:
+                logger.info(f"⏳ 上游 Key {self.label} 限流排队 {waited:.1f}s")
+        return waited
+
+    def release(self) -> None:
+        self._release_slot()
+
+    def settle(self, extra_tokens: int) -> None:
+        """按实际用量补扣（或退还）TPM 令牌"""
+        if self._token_bucket is None or not extra_tokens:
+            return
+        with self._lock:
+            self._token_bucket.tokens = min(
+                self._token_bucket.capacity, self._token_bucket.tokens - extra_tokens
+            )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "key": self.label,
+                "rpm": self.limit.rpm,
+                "tpm": self.limit.tpm,
+                "max_concurrency": self.limit.max_concurrency,
+                "reserved_rpm": self.reserved_rpm,
+                "in_flight": self._in_flight,
+                "queued": len(self._waiters),
+                "waited_requests": self.waited_requests,
+                "total_wait_seconds": round(self.total_wait_seconds, 1),
+            }
+
+
+def _wake_waiter(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RateTicket:
+    """一次已放行的请求，用于结算实际 token 用量"""
+
+    def __init__(self, limiter: Optional[KeyRateLimiter], estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        if self.limiter is not None and actual_tokens:
+            self.limiter.settle(int(actual_tokens) - self.estimated_tokens)
+
+
+@asynccontextmanager
+async def throttle(limiter: Optional[KeyRateLimiter], estimated_tokens: int = 1):
+    """在限流器上排队放行一次请求（limiter 为 None 时直接放行）"""
+    if limiter is None:
+        yield RateTicket(None, estimated_tokens)
+        return
+    await limiter.acquire(estimated_tokens)
+    try:
+        yield RateTicket(limiter, estimated_tokens)
+    finally:
+        limiter.release()
+
+
+def _translation_capacity(limiter: KeyRateLimiter) -> float:
+    """Key 上还可预留给翻译的 RPM（调用方持有锁）"""
+    return limiter.limit.rpm * (1 - _MIN_SHARE) - limiter.reserved_rpm
+
+
+class RateGovernor:
+    """进程级上游 Key 限流器注册表"""
+
+    def __init__(self, default_limit: RateLimit = None, overrides: dict[str, RateLimit] = None):
+        self.default_limit = default_limit if default_limit is not None else RateLimit(
+            rpm=settings.llm_key_rpm,
+            tpm=settings.llm_key_tpm,
+            max_concurrency=settings.llm_key_max_concurrency,
+        )
+        self.overrides = overrides if overrides is not None else _parse_overrides(settings.llm_key_rate_limits)
+        self._limiters: dict[tuple[str, str], KeyRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _resolve_limit(self, host: str, api_key: Optional[str]) -> RateLimit:
+        suffix = (api_key or "")[-4:]
+        for rule_key in (f"{host}#{suffix}", host):
+            if rule_key in self.overrides:
+                return self.overrides[rule_key]
+        return self.default_limit
+
+    def limiter(self, base_url: Optional[str], api_key: Optional[str]) -> Optional[KeyRateLimiter]:
+        """获取 Key 对应的限流器，未配置限额时返回 None"""
+        key = rate_key(base_url, api_key)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limit = self._resolve_limit(key[0], api_key)
+                if limit.unlimited:
+                    return None
+                suffix = (api_key or "")[-4:]
+                limiter = KeyRateLimiter(f"{key[0] or '-'}#{suffix}", limit)
+                self._limiters[key] = limiter
+            return limiter
+
+    def limit(self, base_url: Optional[str], api_key: Optional[str], estimated_tokens: int = 1):
+        """排队获取配额，退出时释放并发名额"""
+        return throttle(self.limiter(base_url, api_key), estimated_tokens)
+
+    @contextmanager
+    def reserve(self, base_url: Optional[str], api_key: Optional[str], rpm: int):
+        """
+        在翻译期间为该 Key 预留 RPM，LLM 调用相应降低补充速率
+
+        预留总量不超过 RPM 的 (1 - _MIN_SHARE)，保证 LLM 保底份额与翻译预留之和不超过 Key 限额；
+        yield 实际预留的 RPM。
+        """
+        limiter = self.limiter(base_url, api_key)
+        if limiter is None or not limiter.limit.rpm:
+            yield rpm
+            return
+        with limiter._lock:
+            granted = max(0, min(rpm, int(_translation_capacity(limiter))))
+            limiter.reserved_rpm += granted
+        try:
+            yield granted
+        finally:
+            with limiter._lock:
+                limiter.reserved_rpm = max(0, limiter.reserved_rpm - granted)
+
+    def translation_budget(self, base_url: Optional[str], api_key: Optional[str],
+                           qps: int, pool_workers: int) -> tuple[int, int]:
+        """
+        将翻译引擎的 QPS / 线程数收敛到 Key 限额内
+
+        pdf2zh 内部自行限速（QPS 为整数），这里只能在构建配置时约束其上限：
+        QPS 不超过尚未被其他翻译预留的 RPM 份额 / 60，线程数不超过并发上限。
+        份额不足 1 QPS 时返回 QPS 0，表示该 Key 上不能翻译（由调用方拒绝）。
+        """
+        limiter = self.limiter(base_url, api_key)
+        if limiter is None:
+            return qps, pool_workers
+        if limiter.limit.rpm:
+            with limiter._lock:
+                capacity = _translation_capacity(limiter)
+            qps = max(0, min(qps, int(capacity // 60)))
+        if limiter.limit.max_concurrency:
+            pool_workers = max(1, min(pool_workers, limiter.limit.max_concurrency))
+        return qps, pool_workers
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return [limiter.snapshot() for limiter in limiters]
+
+
+def _parse_overrides(raw: Optional[str]) -> dict[str, RateLimit]:
+    """解析 LLM_KEY_RATE_LIMITS（JSON），键为主机或“主机#Key 后 4 位”"""
+    if not raw or not raw.strip():
+        return {}
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as e:
+        logger.warning(f"⚠️ LLM_KEY_RATE_LIMITS 解析失败，已忽略: {e}")
+        return {}
+    overrides = {}
+    for key, value in (data or {}).items():
+        if not isinstance(value, dict):
+            continue
+        host, sep, suffix = key.strip().partition("#")
+        overrides[f"{host.lower()}{sep}{suffix}"] = RateLimit(
+            rpm=int(value.get("rpm", 0) or 0),
+            tpm=int(value.get("tpm", 0) or 0),
+            max_concurrency=int(value.get("concurrency", value.get("max_concurrency", 0)) or 0),
+        )
+    return overrides
+
+
+# 全局实例
+rate_governor = RateGovernor()
@@ -130,8 +130,50 @@ class Settings:
     log_level: str
     log_enabled: bool
     llm_max_retries: int
+    llm_http_max_connections: int
+    llm_http_max_keepalive_connections: int
+    llm_http_keepalive_expiry: float
+    llm_health_flush_interval: float
+    llm_health_ewma_alpha: float
+    llm_routing_mode: str
+    llm_circuit_failure_threshold: int
+    llm_circuit_cooldown_seconds: float
+    llm_hedge_pools: str
+    llm_hedge_percentile: float
+    llm_hedge_default_delay_ms: int
+    llm_hedge_min_delay_ms: int
+    llm_key_rpm: int
+    llm_key_tpm: int
+    llm_key_max_concurrency: int
+    llm_key_rate_limits: str
+    llm_response_cache_pools: str
+    llm_response_cache_ttl_seconds: int
+    llm_response_cache_memory_entries: int
+    llm_response_cache_max_entries: int
+    analysis_context_tokens: int
+    analysis_chunk_tokens: int
+    analysis_map_concurrency: int
+    speculative_analysis: bool
+    pdf_parse_workers: int
+    pdf_parse_timeout_seconds: float
+    pdf_max_pages: int
+    pdf_full_text_max_chars: int
+    near_duplicate_threshold: float
+    ingestion_max_concurrent: int
+    ingestion_retry_max: int
+    ingestion_retry_delay: int
+    upload_stream_user_concurrency: int
+    upload_stream_max_concurrent: int
+    paper_chat_top_k: int
+    paper_chat_chunk_tokens: int
+    paper_chat_recent_turns: int
+    paper_chat_prompt_token_budget: int
+    paper_chat_cache_threshold: float
+    paper_chat_cache_max_entries: int
     file_storage_path: str
     storage_quota_mb: int
+    max_file_size: int
+    system_config_cache_ttl: float
 
 
 def load_settings() -> Settings:
@@ -167,8 +209,50 @@ def load_settings() -> Settings:
         log_level=_get_env("LOG_LEVEL", "INFO"),
         log_enabled=_get_bool("LOG_ENABLED", True),
         llm_max_retries=_get_int("LLM_MAX_RETRIES", 3),
+        llm_http_max_connections=_get_int("LLM_HTTP_MAX_CONNECTIONS", 100),
+        llm_http_max_keepalive_connections=_get_int("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", 20),
+        llm_http_keepalive_expiry=_get_float("LLM_HTTP_KEEPALIVE_EXPIRY", 30.0),
+        llm_health_flush_interval=_get_float("LLM_HEALTH_FLUSH_INTERVAL", 5.0),
+        llm_health_ewma_alpha=_get_float("LLM_HEALTH_EWMA_ALPHA", 0.3),
+        llm_routing_mode=_get_env("LLM_ROUTING_MODE", "sequential"),
+        llm_circuit_failure_threshold=_get_int("LLM_CIRCUIT_FAILURE_THRESHOLD", 3),
+        llm_circuit_cooldown_seconds=_get_float("LLM_CIRCUIT_COOLDOWN_SECONDS", 30.0),
+        llm_hedge_pools=_get_env("LLM_HEDGE_POOLS", ""),
+        llm_hedge_percentile=_get_float("LLM_HEDGE_PERCENTILE", 95.0),
+        llm_hedge_default_delay_ms=_get_int("LLM_HEDGE_DEFAULT_DELAY_MS", 15000),
+        llm_hedge_min_delay_ms=_get_int("LLM_HEDGE_MIN_DELAY_MS", 1000),
+        llm_key_rpm=_get_int("LLM_KEY_RPM", 0),
+        llm_key_tpm=_get_int("LLM_KEY_TPM", 0),
+        llm_key_max_concurrency=_get_int("LLM_KEY_MAX_CONCURRENCY", 0),
+        llm_key_rate_limits=_get_env("LLM_KEY_RATE_LIMITS", ""),
+        llm_response_cache_pools=_get_env("LLM_RESPONSE_CACHE_POOLS", "metadata"),
+        llm_response_cache_ttl_seconds=_get_int("LLM_RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600),
+        llm_response_cache_memory_entries=_get_int("LLM_RESPONSE_CACHE_MEMORY_ENTRIES", 256),
+        llm_response_cache_max_entries=_get_int("LLM_RESPONSE_CACHE_MAX_ENTRIES", 5000),
+        analysis_context_tokens=_get_int("ANALYSIS_CONTEXT_TOKENS", 32000),
+        analysis_chunk_tokens=_get_int("ANALYSIS_CHUNK_TOKENS", 8000),
+        analysis_map_concurrency=_get_int("ANALYSIS_MAP_CONCURRENCY", 4),
+        speculative_analysis=_get_bool("SPECULATIVE_ANALYSIS", False),
+        pdf_parse_workers=_get_int("PDF_PARSE_WORKERS", 2),
+        pdf_parse_timeout_seconds=_get_float("PDF_PARSE_TIMEOUT_SECONDS", 120.0),
+        pdf_max_pages=_get_int("PDF_MAX_PAGES", 1000),
+        pdf_full_text_max_chars=_get_int("PDF_FULL_TEXT_MAX_CHARS", 0),
+        near_duplicate_threshold=_get_float("NEAR_DUPLICATE_THRESHOLD", 0.8),
+        ingestion_max_concurrent=_get_int("INGESTION_MAX_CONCURRENT", 2),
+        ingestion_retry_max=_get_int("INGESTION_RETRY_MAX", 2),
+        ingestion_retry_delay=_get_int("INGESTION_RETRY_DELAY", 30),
+        upload_stream_user_concurrency=_get_int("UPLOAD_STREAM_USER_CONCURRENCY", 3),
+        upload_stream_max_concurrent=_get_int("UPLOAD_STREAM_MAX_CONCURRENT", 8),
+        paper_chat_top_k=_get_int("PAPER_CHAT_TOP_K", 4),
+        paper_chat_chunk_tokens=_get_int("PAPER_CHAT_CHUNK_TOKENS", 400),
+        paper_chat_recent_turns=_get_int("PAPER_CHAT_RECENT_TURNS", 4),
+        paper_chat_prompt_token_budget=_get_int("PAPER_CHAT_PROMPT_TOKEN_BUDGET", 12000),
+        paper_chat_cache_threshold=_get_float("PAPER_CHAT_CACHE_THRESHOLD", 0.8),
+        paper_chat_cache_max_entries=_get_int("PAPER_CHAT_CACHE_MAX_ENTRIES", 100),
         file_storage_path=file_storage_path,
         storage_quota_mb=_get_int("STORAGE_QUOTA_MB", 2048),
+        max_file_size=_get_int("MAX_FILE_SIZE", 52428800),
+        system_config_cache_ttl=_get_float("SYSTEM_CONFIG_CACHE_TTL", 30.0),
     )
 
 
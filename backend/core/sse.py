@@ -0,0 +1,162 @@
+"""
+SSE 辅助 - 客户端断开检测与进行中任务的取消
+生成器阻塞在上游（如等待 LLM 首个 token）时无法感知客户端已断开，上游调用会一直跑完、白白消耗配额。
+这里把上游放到后台任务中消费，期间定期检查连接；断开或被新请求顶替时取消后台任务（关闭上游流）。
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Callable, Coroutine, Hashable, Optional
+
+import anyio
+
+from backend.core.log_service import get_logger
+
+logger = get_logger("sse")
+
+# 等待上游期间检查客户端连接的间隔（秒）
+DISCONNECT_POLL_SECONDS = 1.0
+
+
+class ClientDisconnectedError(Exception):
+    """SSE 客户端已断开"""
+
+
+class StreamSupersededError(Exception):
+    """同一对象的新请求取消了本次流"""
+
+
+_DONE = object()
+_SUPERSEDED = object()
+
+
+class _Raised:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def iterate_until_disconnected(request, source: AsyncIterator[Any],
+                                     poll_interval: float = DISCONNECT_POLL_SECONDS,
+                                     in_flight: Optional["InFlightRegistry"] = None,
+                                     key: Hashable = None) -> AsyncIterator[Any]:
+    """
+    在后台任务中消费 source 并逐项 yield
+
+    Raises:
+        ClientDisconnectedError: 客户端断开（后台任务已取消，上游流已关闭）
+        StreamSupersededError: 同一 key 的新请求顶替了本次流（需传入 in_flight 与 key）
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for item in source:
+                queue.put_nowait(item)
+            queue.put_nowait(_DONE)
+        except asyncio.CancelledError:
+            queue.put_nowait(_SUPERSEDED)
+            raise
+        except Exception as e:
+            queue.put_nowait(_Raised(e))
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    task = asyncio.create_task(pump())
+    if in_flight is not None:
+        in_flight.register(key, task)
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    raise ClientDisconnectedError()
+                continue
+            if item is _DONE:
+                return
+            if item is _SUPERSEDED:
+                raise StreamSupersededError()
+            if isinstance(item, _Raised):
+                raise item.error
+            yield item
+    finally:
+        if in_flight is not None:
+            in_flight.unregister(key, task)
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+class InFlightRegistry:
+    """每个 key 同时只保留一个进行中的任务，新任务登记时取消旧任务"""
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self.superseded = 0
+
+    def register(self, key: Hashable, task: asyncio.Task) -> None:
+        previous = self._tasks.get(key)
+        self._tasks[key] = task
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+            logger.info(f"新请求取消了进行中的流: {key}")
+
+    def unregister(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+
+class SSETaskStream:
+    """
+    后台任务产生事件、SSE 生成器逐条推送（如多个文件并行处理）
+
+    客户端断开时（主动检测到或 Starlette 取消整个任务组）取消全部后台任务。
+    任务组被取消后 finally 中的每个 await 都会再次被取消，因此收尾回调 on_close 在第一个 await 之前同步执行，
+    等待任务退出放在屏蔽取消的作用域中。
+    """
+
+    def __init__(self, request, poll_interval: float = DISCONNECT_POLL_SECONDS):
+        self.request = request
+        self.poll_interval = poll_interval
+        self.tasks: list[asyncio.Task] = []
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(self, payload: dict) -> None:
+        self._queue.put_nowait(f"data: {json.dumps(payload)}\n\n")
+
+    def spawn(self, coro: Coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.append(task)
+        return task
+
+    def finish(self) -> None:
+        """全部事件已产生，结束推送"""
+        self._queue.put_nowait(None)
+
+    async def events(self, on_close: Optional[Callable[[], None]] = None) -> AsyncIterator[str]:
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(self._queue.get(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    # 长时间无事件（如等待 LLM）时主动检查连接
+                    if await self.request.is_disconnected():
+                        return
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            pending = [task for task in self.tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if on_close is not None:
+                on_close()
+            if pending:
+                with anyio.CancelScope(shield=True):
+                    await asyncio.gather(*pending, return_exceptions=True)
@@ -5,17 +5,21 @@ from typing import Optional
 
 from backend.core.log_service import get_logger
 from backend.core.settings import settings
-from backend.core.db_models import SystemConfig, User, Session
+from backend.core.db_models import User, Session
+from backend.core.db_service import get_config
 
 logger = get_logger("storage")
 
+# multipart 边界与各字段头部的额外开销：Content-Length 超出剩余配额该值以上才视为必然超额
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
 
 def _get_system_quota_mb(session: Session) -> Optional[int]:
-    """读取系统默认配额（MB）"""
-    config = session.query(SystemConfig).filter_by(key="storage_quota_mb").first()
-    if config and config.value:
+    """读取系统默认配额（MB），来自进程内配置快照，不访问数据库"""
+    value = get_config("storage_quota_mb")
+    if value:
         try:
-            return int(config.value)
+            return int(value)
         except ValueError:
             return None
     return settings.storage_quota_mb
@@ -31,3 +35,30 @@ def get_user_quota_bytes(session: Session, user: User) -> Optional[int]:
     return max(0, int(quota_mb)) * 1024 * 1024
 
 
+def get_upload_limit(current_usage: int, quota_bytes: Optional[int]) -> tuple[Optional[int], str]:
+    """
+    单个上传文件允许写入的最大字节数及超限提示
+    取单文件大小上限与剩余配额中较小者；均不限制时返回 (None, "")
+    """
+    limits = []
+    if settings.max_file_size > 0:
+        limits.append((settings.max_file_size, f"文件超过大小上限（{settings.max_file_size // (1024 * 1024)}MB）"))
+    if quota_bytes is not None:
+        limits.append((max(0, quota_bytes - current_usage), "超出存储配额"))
+    if not limits:
+        return None, ""
+    return min(limits, key=lambda item: item[0])
+
+
+def request_exceeds_quota(content_length: Optional[str], current_usage: int, quota_bytes: Optional[int]) -> bool:
+    """
+    按请求头 Content-Length 判断整个上传请求是否必然超出剩余配额（读取表单前调用）
+    缺少或无法解析 Content-Length（如分块传输）时返回 False，由逐文件写入时的限额兜底
+    """
+    if quota_bytes is None or not content_length:
+        return False
+    try:
+        length = int(content_length)
+    except ValueError:
+        return False
+    return length > max(0, quota_bytes - current_usage) + MULTIPART_OVERHEAD_BYTES
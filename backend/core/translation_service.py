@@ -15,6 +15,7 @@ from backend.core.log_service import get_logger, write_translation_log
 from backend.core.db_models import Session, Paper, TranslationLLMProvider
 from backend.core.settings import settings
 from backend.core.llm_format import normalize_translation_request_format
+from backend.core.rate_governor import rate_governor
 
 logger = get_logger("translation_service")
 _pdf2zh_openai_ua_patched = False
@@ -233,6 +234,15 @@ class TranslationService:
         pool_workers = provider.pool_max_workers
         if not pool_workers:
             pool_workers = min(qps_value * 10, 1000)
+        # 与元数据/分析调用共用同一上游 Key 时，收敛到 Key 级限额内
+        qps_value, pool_workers = rate_governor.translation_budget(
+            provider.base_url, provider.api_key, qps_value, pool_workers
+        )
+        if qps_value < 1:
+            raise ValueError(
+                f"翻译提供商 {provider.name} 的 Key RPM 限额不足以支持翻译（需至少 1 QPS 且为 LLM 调用保留份额），"
+                "请调整 LLM_KEY_RATE_LIMITS 或更换翻译提供商"
+            )
         
         # 构建完整的 SettingsModel
         settings = SettingsModel(
@@ -518,7 +528,10 @@ class TranslationService:
             output_paths = self.get_output_paths(pdf_path)
             
             deepl_url = provider.base_url if provider.engine_type and provider.engine_type.lower() == "deepl" else None
-            with _patch_deepl_server_url(deepl_url):
+            # 翻译期间为该 Key 预留 RPM，LLM 调用相应让出配额
+            reserved_rpm = settings.translation.qps * 60
+            with _patch_deepl_server_url(deepl_url), \
+                    rate_governor.reserve(provider.base_url, provider.api_key, reserved_rpm):
                 async for event in self._translate_stream_main_process(settings, pdf_path):
                     event_type = event.get("type", "")
                     
@@ -7,6 +7,13 @@ import re
 _INVALID_FILENAME_CHARS_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
 
 
+def normalize_title(title) -> str:
+    """标题规范化：仅保留字母数字并转小写，用于语义查重"""
+    if not title:
+        return ""
+    return re.sub(r'[^a-zA-Z0-9]', '', title).lower()
+
+
 def calculate_md5(file_bytes: bytes) -> str:
     """计算文件的MD5哈希值"""
     return hashlib.md5(file_bytes).hexdigest()
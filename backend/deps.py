@@ -4,11 +4,13 @@
 from datetime import datetime, timedelta
 from typing import Generator, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
+from starlette.datastructures import FormData, UploadFile
 from backend.core.settings import settings
+from backend.core.storage_service import request_exceeds_quota
 from backend.services.paper_service import PaperService
 
 # 复用 db_models 中的数据库配置，确保使用同一个数据库
@@ -107,6 +109,27 @@ async def get_current_admin(current_user: User = Depends(get_current_user)) -> U
     return current_user
 
 
+# ================= 上传表单 =================
+async def read_upload_form(
+    request: Request,
+    current_usage: int,
+    quota_bytes: Optional[int],
+    field: str = "files"
+) -> tuple[FormData, list[UploadFile]]:
+    """
+    读取上传表单，返回 (表单, 文件列表)；表单由调用方在文件使用完毕后关闭
+    解析表单时文件即被写入临时文件：先按 Content-Length 与剩余配额比较，必然超额时直接返回 413，不读取请求体
+    """
+    if request_exceeds_quota(request.headers.get("content-length"), current_usage, quota_bytes):
+        raise HTTPException(status_code=413, detail="超出存储配额")
+    form = await request.form()
+    files = [item for item in form.getlist(field) if isinstance(item, UploadFile)]
+    if not files:
+        await form.close()
+        raise HTTPException(status_code=400, detail="未选择文件")
+    return form, files
+
+
 # ================= 空间权限检查 =================
 def get_workspace_member(
     workspace_id: int,
@@ -91,6 +91,18 @@ async def startup_event():
     if count > 0:
         print(f"从 llm_config.json 导入了 {count} 个 LLM 提供商")
 
+    # 补齐旧论文的规范化标题（语义查重索引列）
+    from backend.core.db_service import backfill_normalized_titles
+    backfilled = await asyncio.to_thread(backfill_normalized_titles)
+    if backfilled:
+        logger.info(f"已补齐 {backfilled} 篇论文的规范化标题")
+
+    # 清理上次异常退出遗留的上传临时文件
+    from backend.core.file_service import file_service
+    stale_uploads = file_service.cleanup_stale_uploads()
+    if stale_uploads:
+        logger.info(f"已清理 {stale_uploads} 个遗留的上传临时文件")
+
     # 恢复中断的翻译任务并自动启动翻译 worker
     from backend.core.translation_queue import translation_queue_manager
     recovery = translation_queue_manager.recover_incomplete_tasks_on_startup()
@@ -103,3 +115,34 @@ async def startup_event():
     if not translation_queue_manager.is_running:
         asyncio.create_task(translation_queue_manager.start_worker())
 
+    # 恢复中断的入库任务并启动入库 worker
+    from backend.services.ingestion_queue import ingestion_queue_manager
+    ingestion_recovery = ingestion_queue_manager.recover_incomplete_jobs_on_startup()
+    logger.info(
+        "入库任务恢复结果: recovered=%s, failed=%s",
+        ingestion_recovery.get("recovered", 0),
+        ingestion_recovery.get("failed", 0),
+    )
+    await ingestion_queue_manager.start_worker()
+
+    # 启动 Provider 健康统计批量落库任务
+    from backend.core.provider_health import provider_health
+    provider_health.ensure_worker()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时执行"""
+    # 停止入库 worker（处理中的任务下次启动时恢复）
+    from backend.services.ingestion_queue import ingestion_queue_manager
+    await ingestion_queue_manager.stop_worker()
+    # 落库剩余的 Provider 健康统计
+    from backend.core.provider_health import provider_health
+    await provider_health.stop_worker()
+    # 关闭 LLM 客户端连接
+    from backend.core.llm_pool import llm_manager
+    await llm_manager.aclose()
+    # 关闭 PDF 解析进程池
+    from backend.services.pdf_parser import pdf_parse_pool
+    pdf_parse_pool.shutdown()
+
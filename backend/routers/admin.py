@@ -7,7 +7,7 @@ import secrets
 import string
 from typing import Optional
 from concurrent.futures import ThreadPoolExecutor
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
 
 from backend.core.db_models import User, Paper, Group, LLMProvider, SystemConfig, AuditLog
@@ -32,12 +32,25 @@ from backend.core.llm_config_service import (
 from backend.core.translation_service import translation_service
 
 from backend.deps import get_db, get_current_admin
-from backend.core.llm_service import mark_provider_success, mark_provider_failure
+from backend.core.provider_health import provider_health
+from backend.core.rate_governor import rate_governor
+from backend.core.llm_cache import llm_response_cache
+from backend.core.db_service import config_cache
+from backend.core.llm_service import bump_llm_config_version
+from backend.services.paper_pipeline import speculative_analysis_stats
+from backend.services.pdf_parser import pdf_parse_pool
+from backend.services.text_cache import text_artifact_store
+from backend.services.near_duplicate import near_duplicate_index
+from backend.services.ingestion_queue import ingestion_queue_manager
+from backend.services.upload_concurrency import upload_concurrency_limiter
+from backend.services.ingest_checkpoint import ingest_checkpoints
+from backend.services.paper_retrieval import paper_retrieval_store
+from backend.services.chat_answer_cache import chat_answer_cache
 from backend.schemas import (
     DbStatsResponse, LLMProviderResponse,
     CreateLLMProviderRequest, UpdateLLMProviderRequest,
     ModelConfigCreateRequest, ModelConfigResponse, ModelConfigUpdateRequest,
-    SystemConfigRequest, UserResponse, UserQuotaRequest,
+    SystemConfigRequest, UserResponse, UserQuotaRequest, UserUploadConcurrencyRequest,
     AdminUserDetailResponse, AdminPaperDetailResponse,
     AdminGroupDetailResponse, AdminGroupPaperItem,
     AdminResetPasswordRequest, AdminResetPasswordResponse
@@ -55,14 +68,15 @@ _logger = logging.getLogger(__name__)
 def _reload_config_background():
     """后台线程中执行配置重载"""
     try:
-        llm_manager.reload_config()
-        _logger.info("✅ LLM 配置后台重载成功")
+        if llm_manager.reload_config():
+            _logger.info("✅ LLM 配置后台重载成功")
     except Exception as e:
         _logger.error(f"❌ 后台重载 LLM 配置失败: {e}")
 
 
 def trigger_reload_async():
-    """触发异步重载（非阻塞）"""
+    """更新配置版本标记并触发异步重载（非阻塞）"""
+    bump_llm_config_version()
     _executor.submit(_reload_config_background)
 
 
@@ -161,7 +175,8 @@ async def _test_provider_connectivity(provider: LLMProvider) -> dict:
                     raise
 
         latency_ms = int((time.monotonic() - start_time) * 1000)
-        mark_provider_success(provider.id, latency_ms)
+        provider_health.record_success(provider.id, latency_ms)
+        await provider_health.flush()
         content = ""
         try:
             if request_format == "openai_response":
@@ -186,7 +201,8 @@ async def _test_provider_connectivity(provider: LLMProvider) -> dict:
             status_code = getattr(getattr(e, "response", None), "status_code", None)
             if status_code:
                 error_text = f"HTTP {status_code}: {error_text}"
-        mark_provider_failure(provider.id, error_text)
+        provider_health.record_failure(provider.id, error_text)
+        await provider_health.flush()
         raise HTTPException(status_code=502, detail=f"测试失败: {error_text[:300]}")
 
 
@@ -305,6 +321,22 @@ async def set_user_quota(
     return {"message": "设置成功"}
 
 
+@router.post("/users/{user_id}/upload-concurrency")
+async def set_user_upload_concurrency(
+    user_id: int,
+    request: UserUploadConcurrencyRequest,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """设置用户流式上传的并发处理文件数（管理员），为空则使用系统默认"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    user.upload_concurrency = None if request.upload_concurrency is None else max(1, request.upload_concurrency)
+    db.commit()
+    return {"message": "设置成功"}
+
+
 @router.post("/users/{user_id}/reset-password", response_model=AdminResetPasswordResponse)
 async def reset_user_password(
     user_id: int,
@@ -664,6 +696,47 @@ async def test_llm_provider(
     return await _test_provider_connectivity(provider)
 
 
+@router.get("/llm-routing")
+async def get_llm_routing_status(
+    current_user: User = Depends(get_current_admin),
+):
+    """获取 LLM 自适应路由状态（EWMA 延迟、错误率、熔断、对冲计数、Key 级限流、响应缓存）"""
+    return {
+        "mode": llm_manager._get_routing_mode(),
+        "nodes": llm_manager.router.snapshot(),
+        "hedge": llm_manager.hedge_stats,
+        "rate_limits": rate_governor.snapshot(),
+        "cache": llm_response_cache.stats(),
+    }
+
+
+@router.get("/ingest-stats")
+async def get_ingest_stats(
+    current_user: User = Depends(get_current_admin),
+):
+    """获取论文入库流水线各组件统计"""
+    return {
+        "queue": ingestion_queue_manager.get_queue_stats(),
+        "upload_stream": upload_concurrency_limiter.stats(),
+        "speculative_analysis": dict(speculative_analysis_stats),
+        "pdf_parse": pdf_parse_pool.stats(),
+        "text_cache": text_artifact_store.stats(),
+        "near_duplicate": near_duplicate_index.stats(),
+        "retrieval": paper_retrieval_store.stats(),
+        "chat_answer_cache": chat_answer_cache.stats(),
+    }
+
+
+@router.get("/ingest-stuck")
+async def get_stuck_ingestions(
+    older_than_minutes: int = Query(30, ge=0, description="检查点超过多少分钟未推进视为卡住"),
+    user_id: Optional[int] = Query(None, description="按用户筛选"),
+    current_user: User = Depends(get_current_admin),
+):
+    """按下一个待执行阶段（extract/metadata/dedup/analysis/persist）分组列出卡住的论文入库"""
+    return ingest_checkpoints.stuck(older_than_minutes * 60, owner_id=user_id)
+
+
 # ================= 系统配置 =================
 @router.get("/config/{key}")
 async def get_config(
@@ -690,6 +763,7 @@ async def set_config(
         db.add(SystemConfig(key=request.key, value=request.value))
     
     db.commit()
+    config_cache.invalidate()
     return {"message": "设置成功"}
 
 
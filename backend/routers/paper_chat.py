@@ -2,18 +2,37 @@
 论文问答路由 - 基于 LLM 的 RAG 对话
 """
 import json
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from backend.core.db_models import Paper, PaperChatHistory, User
+from backend.core.db_models import Paper, PaperChatHistory, User, Session as DBSession
+from backend.core.file_service import file_service
 from backend.core.llm_pool import llm_manager
+from backend.core.log_service import get_logger
+from backend.core.sse import (
+    ClientDisconnectedError,
+    InFlightRegistry,
+    StreamSupersededError,
+    iterate_until_disconnected,
+)
 from backend.deps import get_current_user, get_db
+from backend.services.chat_answer_cache import chat_answer_cache, paper_fingerprint
+from backend.services.chat_memory import chat_memory
+from backend.services.paper_retrieval import paper_retrieval_store
 from backend.services.paper_service import PaperService
-from backend.schemas import ChatRequest, ChatMessageResponse
+from backend.schemas import ChatCacheRequest, ChatRequest, ChatMessageResponse
 
 router = APIRouter(prefix="/api/papers/{paper_id}/chat", tags=["论文问答"])
+logger = get_logger("paper_chat")
+
+# 深度分析注入的字符上限（无原文片段 / 有原文片段时）
+ANALYSIS_CHARS = 8000
+ANALYSIS_CHARS_WITH_PASSAGES = 3000
+
+# 每个 (用户, 论文) 同时只保留一个生成中的回答，新提问取消旧回答
+_chat_in_flight = InFlightRegistry()
 
 
 def _check_paper_access(paper_id: int, user: User, db: Session):
@@ -23,6 +42,25 @@ def _check_paper_access(paper_id: int, user: User, db: Session):
     return paper
 
 
+def _save_assistant_message(paper_id: int, user_id: int, content: str, partial: bool = False) -> None:
+    """写入助手回答（使用独立会话：客户端断开时请求会话可能已关闭）"""
+    if partial:
+        content += "\n\n（回答未完成）"
+    session = DBSession()
+    try:
+        session.add(PaperChatHistory(
+            paper_id=paper_id, user_id=user_id,
+            role="assistant", content=content,
+            created_at=datetime.now().isoformat()
+        ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"保存问答回答失败: paper_id={paper_id}, {e}")
+    finally:
+        session.close()
+
+
 @router.get("/history", response_model=list[ChatMessageResponse])
 async def get_chat_history(
     paper_id: int,
@@ -51,14 +89,45 @@ async def clear_chat_history(
         PaperChatHistory.paper_id == paper_id,
         PaperChatHistory.user_id == current_user.id
     ).delete()
+    chat_memory.clear(db, paper_id, current_user.id)
     db.commit()
     return {"message": "清除成功"}
 
 
+@router.get("/cache")
+async def get_chat_cache(
+    paper_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    paper = _check_paper_access(paper_id, current_user, db)
+    return {"enabled": bool(paper.chat_cache_enabled), "entries": chat_answer_cache.count(db, paper_id)}
+
+
+@router.put("/cache")
+async def update_chat_cache(
+    paper_id: int,
+    req: ChatCacheRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """开启/关闭论文的问答缓存（关闭时清空已缓存的回答），仅论文所有者或管理员可修改"""
+    paper = _check_paper_access(paper_id, current_user, db)
+    # 缓存的回答会提供给所有能访问该论文的用户，开关不随读取权限放开
+    if current_user.role != "admin" and paper.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="只有论文所有者或管理员可以修改问答缓存设置")
+    paper.chat_cache_enabled = req.enabled
+    if not req.enabled:
+        chat_answer_cache.clear(db, paper_id)
+    db.commit()
+    return {"message": "问答缓存已开启" if req.enabled else "问答缓存已关闭", "enabled": req.enabled}
+
+
 @router.post("")
 async def chat_with_paper(
     paper_id: int,
     req: ChatRequest,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -72,22 +141,54 @@ async def chat_with_paper(
     db.add(user_msg)
     db.commit()
 
+    # 依赖前文的提问（指代词、追问标记）由缓存自行跳过
+    cached = chat_answer_cache.lookup(db, paper, req.question)
+    if cached is not None:
+        logger.info(f"💾 问答缓存命中: paper_id={paper_id}, 相似度 {cached['similarity']}")
+        _save_assistant_message(paper_id, current_user.id, cached["answer"])
+        chat_memory.schedule_refresh(paper_id, current_user.id)
+
+        async def generate_cached():
+            yield f"data: {json.dumps({'content': cached['answer'], 'cached': True})}\n\n"
+            yield f"data: {json.dumps({'done': True, 'cached': True})}\n\n"
+
+        return StreamingResponse(
+            generate_cached(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    cache_fingerprint = paper_fingerprint(paper) if paper.chat_cache_enabled else None
+
+    # 从全文片段索引中检索与问题最相关的原文（失败时退化为只用摘要与深度分析）
+    passages = []
+    try:
+        pdf_path = file_service.resolve_paper_file_path(
+            relative_path=paper.file_path,
+            user_id=paper.owner_id,
+            md5_hash=paper.md5_hash,
+        )
+        passages = await paper_retrieval_store.search(paper.md5_hash, pdf_path, req.question)
+    except Exception as e:
+        logger.warning(f"⚠️ 论文片段检索失败，仅使用摘要与分析: paper_id={paper_id}, {e}")
+
     paper_context = ""
     if paper.abstract:
         paper_context += f"摘要: {paper.abstract}\n\n"
     if paper.abstract_en:
         paper_context += f"Abstract: {paper.abstract_en}\n\n"
     if paper.detailed_analysis:
-        analysis_trunc = paper.detailed_analysis[:8000]
+        # 有原文片段时深度分析只作概览，缩短以控制提示词体积
+        analysis_limit = ANALYSIS_CHARS_WITH_PASSAGES if passages else ANALYSIS_CHARS
+        analysis_trunc = paper.detailed_analysis[:analysis_limit]
         paper_context += f"深度分析:\n{analysis_trunc}\n\n"
-
-    history_messages = db.query(PaperChatHistory).filter(
-        PaperChatHistory.paper_id == paper_id,
-        PaperChatHistory.user_id == current_user.id
-    ).order_by(PaperChatHistory.created_at.asc()).limit(20).all()
+    if passages:
+        paper_context += "原文相关片段:\n"
+        for passage in passages:
+            paper_context += f"[{passage['section'] or '正文'}]\n{passage['text']}\n\n"
 
     system_prompt = (
-        "你是一个学术论文研究助手。根据以下论文内容回答用户的问题。"
+        "你是一个学术论文研究助手。根据以下论文内容回答用户的问题，涉及细节时优先依据原文相关片段。"
         "如果论文内容不足以回答问题，请基于你的知识补充，但要明确说明。"
         "使用中文回答，学术表达要准确。\n\n"
         f"论文标题: {paper.title or ''}\n"
@@ -97,35 +198,43 @@ async def chat_with_paper(
         f"{paper_context}"
     )
 
-    chat_messages = [{"role": "system", "content": system_prompt}]
-    for m in history_messages:
-        chat_messages.append({"role": m.role, "content": m.content})
+    # 最近几轮原文 + 更早对话的摘要，按 token 预算组装
+    chat_messages = chat_memory.build_messages(db, paper_id, current_user.id, system_prompt)
 
     async def generate():
-        full_response = ""
+        parts = []
+        error = None
+        finished = False
+        stream = llm_manager.iter_chat_stream(pool_name="analysis", messages=chat_messages)
         try:
-            response = await llm_manager.chat(
-                pool_name="analysis",
-                messages=chat_messages
-            )
-            if hasattr(response, 'choices') and response.choices:
-                full_response = response.choices[0].message.content or ""
-            elif isinstance(response, str):
-                full_response = response
-            if full_response:
-                yield f"data: {json.dumps({'content': full_response})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            # 客户端断开或同一论文的新提问到来时取消上游生成
+            async for piece in iterate_until_disconnected(
+                request, stream, in_flight=_chat_in_flight, key=(current_user.id, paper_id)
+            ):
+                parts.append(piece)
+                yield f"data: {json.dumps({'content': piece})}\n\n"
+            finished = True
+        except ClientDisconnectedError:
+            logger.info(f"客户端已断开，取消问答生成: paper_id={paper_id}, user_id={current_user.id}")
             return
-
-        if full_response:
-            assistant_msg = PaperChatHistory(
-                paper_id=paper_id, user_id=current_user.id,
-                role="assistant", content=full_response,
-                created_at=datetime.now().isoformat()
-            )
-            db.add(assistant_msg)
-            db.commit()
+        except StreamSupersededError:
+            error = "已被新的提问取消"
+        except Exception as e:
+            error = str(e)
+        finally:
+            await stream.aclose()
+            # 回答只在结束时写入一次；出错或客户端中途断开时保留已生成的部分内容
+            full_response = "".join(parts)
+            if full_response:
+                _save_assistant_message(paper_id, current_user.id, full_response, partial=not finished)
+                chat_memory.schedule_refresh(paper_id, current_user.id)
+                if finished and cache_fingerprint:
+                    chat_answer_cache.store(paper_id, cache_fingerprint, req.question, full_response)
+
+        if error is not None:
+            yield f"data: {json.dumps({'error': error})}\n\n"
+        else:
+            yield f"data: {json.dumps({'done': True})}\n\n"
 
     return StreamingResponse(
         generate(),
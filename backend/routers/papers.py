@@ -7,7 +7,7 @@ from typing import Optional
 from sqlalchemy.orm import Session
 from urllib.parse import quote
 
-from backend.core.db_models import Paper, User, PaperStar
+from backend.core.db_models import Paper, User, PaperStar, PaperMinHash
 from backend.core.file_service import file_service
 from backend.core.audit_service import log_audit_event
 from backend.core.log_service import get_logger
@@ -16,10 +16,12 @@ from backend.core.utils import sanitize_filename
 
 from backend.deps import get_current_user, get_paper_service, get_db
 from backend.services.paper_service import PaperService
+from backend.services.near_duplicate import near_duplicate_index
 from backend.schemas import (
     PaperResponse, PaperListResponse, UpdatePaperGroupsRequest, GroupInfo,
     BatchDeleteRequest, BatchDeleteResponse, BatchGroupRequest, BatchGroupResponse,
-    FilterOptionsResponse, JournalOption
+    FilterOptionsResponse, JournalOption, NearDuplicateClustersResponse, NearDuplicateCluster,
+    NearDuplicatePaper
 )
 
 router = APIRouter(prefix="/api/papers", tags=["论文"])
@@ -101,6 +103,28 @@ async def get_papers(
     )
 
 
+@router.get("/near-duplicates", response_model=NearDuplicateClustersResponse)
+async def get_near_duplicate_clusters(
+    threshold: Optional[float] = Query(None, ge=0.3, le=1.0, description="Jaccard 相似度阈值，默认使用系统配置"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """报告当前用户库中的近似重复簇（预印本/正式版、v1/v2 等）"""
+    threshold = threshold or near_duplicate_index.threshold or 0.8
+    clusters = near_duplicate_index.clusters(db, owner_id=current_user.id, threshold=threshold)
+    indexed_count = db.query(PaperMinHash.paper_id).filter(PaperMinHash.owner_id == current_user.id).count()
+    total_count = db.query(Paper.id).filter(Paper.owner_id == current_user.id).count()
+    return NearDuplicateClustersResponse(
+        clusters=[
+            NearDuplicateCluster(papers=[NearDuplicatePaper(**paper) for paper in cluster])
+            for cluster in clusters
+        ],
+        threshold=threshold,
+        indexed_count=indexed_count,
+        total_count=total_count,
+    )
+
+
 @router.get("/{paper_id}", response_model=PaperResponse)
 async def get_paper(
     paper_id: int,
@@ -1,38 +1,55 @@
 """
-上传路由 - PDF 文件上传和处理
+上传路由 - PDF 文件上传与入库任务查询
 """
-from fastapi import APIRouter, Depends, UploadFile, File
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Optional
 
 from backend.core.db_models import Paper, User
-from backend.core.utils import calculate_md5
-from backend.core.file_service import file_service
-from backend.core.audit_service import log_audit_event
-from backend.core.storage_service import get_user_quota_bytes
+from backend.core.file_service import file_service, UploadTooLargeError
+from backend.core.storage_service import get_user_quota_bytes, get_upload_limit
+from backend.services.ingestion_queue import ingestion_queue_manager, FINAL_STATUSES
 
-from backend.deps import get_db, get_current_user
+from backend.deps import get_db, get_current_user, get_user_from_token, read_upload_form
 
 router = APIRouter(prefix="/api/upload", tags=["上传"])
 
 
 @router.post("")
 async def upload_papers(
-    files: List[UploadFile] = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    上传 PDF 文件并处理
-    注意：这是一个同步处理端点，会等待所有文件处理完成
+    上传 PDF 文件并创建入库任务
+    文件持久化后立即返回任务 ID，解析与 LLM 分析由后台队列执行，
+    可通过 /api/upload/jobs/{job_id}（或 /stream）查询进度
+    表单字段 files（可多个）；请求体必然超出剩余配额时返回 413，不写入任何数据
     """
-    # 延迟导入处理函数，避免启动阶段额外开销
-    from backend.services.paper_pipeline import process_workflow
-    
     results = []
     current_usage = file_service.get_user_storage_stats(current_user.id)["total_size"]
     quota_bytes = get_user_quota_bytes(db, current_user)
+    form, files = await read_upload_form(request, current_usage, quota_bytes)
+    try:
+        await _stage_and_enqueue(files, current_user, db, current_usage, quota_bytes, results)
+    finally:
+        await form.close()
     
+    success_count = sum(1 for r in results if r["success"])
+    return {
+        "message": f"已提交: {success_count}/{len(files)}",
+        "results": results,
+        "job_ids": [r["job_id"] for r in results if r.get("job_id")]
+    }
+
+
+async def _stage_and_enqueue(files: list, current_user: User, db: Session, current_usage: int,
+                             quota_bytes: Optional[int], results: list) -> None:
+    """逐个落盘并创建入库任务，结果追加到 results"""
     for file in files:
         if not file.filename.lower().endswith('.pdf'):
             results.append({
@@ -42,19 +59,30 @@ async def upload_papers(
             })
             continue
         
-        try:
-            # 读取文件内容
-            content = await file.read()
-            md5 = calculate_md5(content)
-            file_size = len(content)
+        max_bytes, limit_message = get_upload_limit(current_usage, quota_bytes)
+        # 大小已知时先行拒绝，不写入任何数据
+        if max_bytes is not None and file.size is not None and file.size > max_bytes:
+            results.append({
+                "filename": file.filename,
+                "success": False,
+                "message": limit_message
+            })
+            continue
 
-            if quota_bytes is not None and current_usage + file_size > quota_bytes:
+        staged = None
+        try:
+            # 分块写入临时文件并计算 MD5，超限立即中止
+            try:
+                staged = await file_service.stage_upload(file, current_user.id, max_bytes)
+            except UploadTooLargeError:
                 results.append({
                     "filename": file.filename,
                     "success": False,
-                    "message": "超出存储配额"
+                    "message": limit_message
                 })
                 continue
+            md5 = staged.md5_hash
+            file_size = staged.file_size
             
             # 检查当前用户是否已有此 MD5 的文件（用户范围去重）
             existing = db.query(Paper.id).filter(
@@ -62,6 +90,7 @@ async def upload_papers(
                 Paper.owner_id == current_user.id
             ).first()
             if existing:
+                file_service.discard_upload(staged)
                 results.append({
                     "filename": file.filename,
                     "success": False,
@@ -69,116 +98,116 @@ async def upload_papers(
                 })
                 continue
             
-            # 保存文件到用户目录（持久化存储）
-            file_info = file_service.save_file(
-                content=content,
-                user_id=current_user.id,
-                md5_hash=md5,
-                original_filename=file.filename
-            )
-            current_usage += file_size
-            
-            # 保存临时文件用于 LLM 处理
-            temp_path = file_service.get_temp_path(file.filename)
-            with open(temp_path, "wb") as f:
-                f.write(content)
-            
+            # 原子重命名到用户目录（持久化存储），后台任务直接处理该文件
+            file_info = file_service.commit_upload(staged, current_user.id, file.filename)
+
             try:
-                # 处理文件（LLM 分析）
-                await process_workflow(
-                    temp_path, md5, current_user.id,
-                    file_info=file_info  # 传递文件信息
-                )
-                results.append({
-                    "filename": file.filename,
-                    "success": True,
-                    "message": "处理成功"
-                })
-                log_audit_event(
-                    action="upload_paper",
-                    resource_type="paper",
-                    resource_id=md5,
-                    user_id=current_user.id,
-                    details={"filename": file.filename, "file_size": file_size}
-                )
-            except FileExistsError as e:
-                # 语义重复，删除已保存的文件
-                file_service.delete_file(current_user.id, md5)
-                current_usage = max(0, current_usage - file_size)
+                job = ingestion_queue_manager.enqueue(current_user.id, md5, file_info)
+            except ValueError as e:
+                # 同一文件已有进行中的任务，文件与其共用，不删除
                 results.append({
                     "filename": file.filename,
                     "success": False,
                     "message": str(e)
                 })
-            except Exception as e:
-                # 处理失败：保留已上传文件，并写入占位记录，便于后续在列表中重新分析
-                safe_error = (str(e) or "未知错误").replace("\r", " ").replace("\n", " ").strip()
-                if len(safe_error) > 300:
-                    safe_error = safe_error[:300] + "..."
-
-                try:
-                    existing_paper = db.query(Paper.id).filter(
-                        Paper.md5_hash == md5,
-                        Paper.owner_id == current_user.id
-                    ).first()
-
-                    if not existing_paper:
-                        paper = Paper(
-                            md5_hash=md5,
-                            title=file.filename,
-                            detailed_analysis=f"分析失败：{safe_error}",
-                            owner_id=current_user.id,
-                            # 文件存储信息
-                            file_path=file_info.get('file_path') if file_info else None,
-                            file_size=file_info.get('file_size') if file_info else None,
-                            original_filename=file_info.get('original_filename') if file_info else file.filename,
-                            uploaded_at=file_info.get('uploaded_at') if file_info else None
-                        )
-                        db.add(paper)
-                        db.commit()
-
-                    log_audit_event(
-                        action="upload_paper",
-                        resource_type="paper",
-                        resource_id=md5,
-                        user_id=current_user.id,
-                        details={
-                            "filename": file.filename,
-                            "file_size": file_size,
-                            "analysis_failed": True,
-                            "error": safe_error[:120],
-                        }
-                    )
-
-                    results.append({
-                        "filename": file.filename,
-                        "success": True,
-                        "message": f"上传成功，但分析失败（可在列表中点击重新分析）：{safe_error[:120]}"
-                    })
-                except Exception as db_error:
-                    db.rollback()
-                    # 连占位记录都写不进去时，为避免产生无法管理的孤儿文件，回滚并删除物理文件
-                    file_service.delete_file(current_user.id, md5)
-                    current_usage = max(0, current_usage - file_size)
-                    results.append({
-                        "filename": file.filename,
-                        "success": False,
-                        "message": f"处理失败: {str(db_error)[:100]}"
-                    })
-            finally:
-                # 删除临时文件
-                file_service.cleanup_temp(file.filename)
+                continue
+
+            current_usage += file_size
+            results.append({
+                "filename": file.filename,
+                "success": True,
+                "message": "已加入处理队列",
+                "job_id": job["id"]
+            })
                     
         except Exception as e:
+            if staged:
+                file_service.discard_upload(staged)
             results.append({
                 "filename": file.filename,
                 "success": False,
                 "message": f"上传失败: {str(e)[:100]}"
             })
-    
-    success_count = sum(1 for r in results if r["success"])
-    return {
-        "message": f"处理完成: {success_count}/{len(files)} 成功",
-        "results": results
-    }
 
+
+# ================= 入库任务 API =================
+
+def _get_owned_job(job_id: int, user: User) -> dict:
+    job = ingestion_queue_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if user.role != "admin" and job["user_id"] != user.id:
+        raise HTTPException(status_code=403, detail="无权查看此任务")
+    return job
+
+
+@router.get("/jobs")
+async def list_ingestion_jobs(
+    status: Optional[str] = Query(None, description="按状态筛选"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user)
+):
+    """获取当前用户的入库任务列表"""
+    return {"jobs": ingestion_queue_manager.list_jobs(current_user.id, status, limit)}
+
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """获取入库任务状态"""
+    return _get_owned_job(job_id, current_user)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_ingestion_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """取消排队中的入库任务"""
+    _get_owned_job(job_id, current_user)
+    if not ingestion_queue_manager.cancel_job(job_id):
+        raise HTTPException(status_code=400, detail="只能取消排队中的任务")
+    return {"message": "任务已取消"}
+
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_ingestion_job(
+    job_id: int,
+    request: Request,
+    token: Optional[str] = Query(None, description="SSE token"),
+    db: Session = Depends(get_db)
+):
+    """SSE 流式获取入库任务进度（状态或阶段变化时推送，任务结束后关闭）"""
+    auth_header = request.headers.get("authorization", "")
+    header_token = auth_header.replace("Bearer ", "", 1).strip() if auth_header else None
+    raw_token = token or header_token
+    if not raw_token:
+        raise HTTPException(status_code=401, detail="缺少认证凭据")
+
+    current_user = get_user_from_token(raw_token, db)
+    _get_owned_job(job_id, current_user)
+
+    async def event_generator():
+        last_state = None
+        while True:
+            job = ingestion_queue_manager.get_job(job_id)
+            if not job:
+                break
+            state = (job["status"], job["stage"], job["retry_count"])
+            if state != last_state:
+                last_state = state
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in FINAL_STATUSES:
+                break
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
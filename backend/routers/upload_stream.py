@@ -2,172 +2,199 @@
 上传进度路由 - 使用 SSE 推送处理进度
 """
 import asyncio
-import hashlib
-from datetime import datetime
-from fastapi import APIRouter, Depends, UploadFile, File
+import anyio
+from fastapi import APIRouter, Depends, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
 import json
 
-from backend.core.db_models import Paper, User
-from backend.core.utils import calculate_md5
-from backend.core.file_service import file_service
-from backend.services.paper_pipeline import (
-    extract_pdf_content,
-    task_extract_metadata,
-    task_analyze_paper,
-    normalize_title,
-)
+from backend.core.db_models import Paper, User, Session as DBSession
+from backend.core.log_service import get_logger
+from backend.core.sse import SSETaskStream
+from backend.core.file_service import file_service, UploadTooLargeError
+from backend.core.storage_service import get_user_quota_bytes, get_upload_limit
+from backend.core.llm_pool import llm_manager
+from backend.services.ingestion_queue import delete_unreferenced_file, ingestion_queue_manager
+from backend.services.upload_concurrency import upload_concurrency_limiter, get_user_upload_concurrency
+from backend.services.paper_pipeline import process_workflow
 
-from backend.deps import get_db, get_current_user
+from backend.deps import get_db, get_current_user, read_upload_form
 
 router = APIRouter(prefix="/api/upload-stream", tags=["上传流"])
+logger = get_logger("upload_stream")
 
 
-async def process_with_progress(file_content: bytes, filename: str, md5: str, owner_id: int, db: Session, file_info: dict = None):
-    """处理文件并 yield 进度更新"""
-    # 获取 llm_manager 并刷新配置
-    from backend.core.llm_pool import llm_manager
-    
-    # 步骤 1: 保存临时文件用于处理
-    yield {"step": 1, "total": 4, "message": "保存文件...", "status": "processing"}
-    
-    temp_path = file_service.get_temp_path(filename)
-    
-    with open(temp_path, "wb") as f:
-        f.write(file_content)
-    
+# 入库阶段 → (步骤, 进度文案)
+STAGE_PROGRESS = {
+    "extract": (2, "解析 PDF 内容..."),
+    "metadata": (3, "提取元数据 (调用 LLM)..."),
+    "dedup": (3, "语义查重..."),
+    "analysis": (4, "深度分析 (调用 LLM, 流式模式)..."),
+    "persist": (4, "写入数据库..."),
+}
+
+
+def _hand_off_to_queue(user_id: int, md5: str, file_info: dict) -> bool:
+    """
+    未入库的文件转入后台入库队列，从检查点继续
+    论文已写入（如断开发生在构建检索索引期间）时不再入队，避免重跑流水线被判为重复
+    """
+    session = DBSession()
     try:
-        # 确保使用最新的 LLM 配置
-        llm_manager.reload_config()
-        
-        # 步骤 2: 解析 PDF
-        yield {"step": 2, "total": 4, "message": "解析 PDF 内容...", "status": "processing"}
-        head_text, full_text = extract_pdf_content(temp_path)
-        
-        if not head_text:
-            yield {"step": 2, "total": 4, "message": "PDF 解析失败", "status": "error"}
-            return
-        
-        # 步骤 3: 提取元数据
-        yield {"step": 3, "total": 4, "message": "提取元数据 (调用 LLM)...", "status": "processing"}
-        metadata = await task_extract_metadata(head_text)
-        
-        if not metadata or not metadata.get('title'):
-            yield {"step": 3, "total": 4, "message": "元数据提取失败", "status": "error"}
-            return
-        
-        title = metadata.get('title', filename)
-        yield {"step": 3, "total": 4, "message": f"元数据提取成功: {title[:30]}...", "status": "processing"}
-        
-        # 检查语义重复（用户范围内）
-        normalized_current = normalize_title(title)
-        existing_papers = db.query(Paper.title).filter(Paper.owner_id == owner_id).all()
-        for (db_title,) in existing_papers:
-            if normalize_title(db_title) == normalized_current:
-                yield {"step": 3, "total": 4, "message": f"语义重复: {title[:30]}...", "status": "error"}
-                return
-        
-        # 步骤 4: 深度分析 - 使用流式响应以提高稳定性
-        yield {"step": 4, "total": 4, "message": "深度分析 (调用 LLM, 流式模式)...", "status": "processing"}
-        analysis = await task_analyze_paper(full_text, use_stream=True)
-        
-        # 写入数据库（包含文件信息）
-        yield {"step": 4, "total": 4, "message": "写入数据库...", "status": "processing"}
-        new_paper = Paper(
-            md5_hash=md5,
-            title=metadata.get('title'),
-            title_cn=metadata.get('title_cn'),
-            journal=metadata.get('journal'),
-            year=str(metadata.get('year')),
-            authors=metadata.get('authors'),
-            abstract_en=metadata.get('abstract_en'),
-            abstract=metadata.get('abstract'),
-            detailed_analysis=analysis,
-            owner_id=owner_id,
-            # 文件存储信息
-            file_path=file_info.get('file_path') if file_info else None,
-            file_size=file_info.get('file_size') if file_info else None,
-            original_filename=file_info.get('original_filename') if file_info else None,
-            uploaded_at=file_info.get('uploaded_at') if file_info else None
-        )
-        db.add(new_paper)
-        db.commit()
-        
-        yield {"step": 4, "total": 4, "message": f"处理完成: {title[:30]}...", "status": "success"}
-        
-    except TimeoutError as e:
-        yield {"step": 0, "total": 4, "message": f"请求超时: {str(e)[:80]}", "status": "error"}
-    except Exception as e:
-        error_msg = str(e)
-        # 提供更详细的错误信息
-        if "timeout" in error_msg.lower():
-            yield {"step": 0, "total": 4, "message": f"请求超时: {error_msg[:80]}", "status": "error"}
-        else:
-            yield {"step": 0, "total": 4, "message": f"处理失败: {error_msg[:80]}", "status": "error"}
+        if session.query(Paper.id).filter(Paper.owner_id == user_id, Paper.md5_hash == md5).first():
+            return False
     finally:
-        # 清理临时文件
-        file_service.cleanup_temp(filename)
+        session.close()
+    try:
+        ingestion_queue_manager.enqueue(user_id, md5, file_info)
+    except ValueError:
+        pass  # 已在队列中
+    return True
+
+
+def _failure_message(error: Exception) -> str:
+    error_msg = str(error)
+    if isinstance(error, TimeoutError) or "timeout" in error_msg.lower():
+        return f"请求超时: {error_msg[:80]}"
+    return f"处理失败: {error_msg[:80]}"
 
 
 @router.post("")
 async def upload_with_stream(
-    files: List[UploadFile] = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """上传 PDF 并通过 SSE 返回处理进度"""
+    """
+    上传 PDF 并通过 SSE 返回处理进度
+    文件按顺序落盘，随后在用户/全局并发上限内并行处理，各文件的进度事件以 fileIndex 区分、交错推送
+    客户端断开时取消未完成的处理（停止 LLM 调用），已落盘的文件转入后台入库队列，从检查点继续
+    表单字段 files（可多个）；请求体必然超出剩余配额时返回 413，不写入任何数据
+    """
+    user_id = current_user.id
+    user_limit = get_user_upload_concurrency(current_user)
+    current_usage = file_service.get_user_storage_stats(user_id)["total_size"]
+    quota_bytes = get_user_quota_bytes(db, current_user)
+    form, files = await read_upload_form(request, current_usage, quota_bytes)
     
     async def generate():
         total_files = len(files)
-        
-        for file_index, file in enumerate(files):
-            base_info = {
-                'filename': file.filename,
-                'fileIndex': file_index,
-                'totalFiles': total_files
-            }
-            
-            if not file.filename.lower().endswith('.pdf'):
-                yield f"data: {json.dumps({**base_info, 'step': 0, 'total': 4, 'message': '不是 PDF 文件', 'status': 'error'})}\n\n"
-                continue
-            
-            content = await file.read()
-            md5 = calculate_md5(content)
-            
-            # 检查当前用户是否已有此 MD5 的文件（用户范围去重）
-            existing = db.query(Paper.id).filter(
-                Paper.md5_hash == md5,
-                Paper.owner_id == current_user.id
-            ).first()
-            if existing:
-                yield f"data: {json.dumps({**base_info, 'step': 0, 'total': 4, 'message': '文件已存在 (MD5 重复)', 'status': 'error'})}\n\n"
-                continue
-            
-            yield f"data: {json.dumps({**base_info, 'step': 0, 'total': 4, 'message': '开始处理...', 'status': 'processing'})}\n\n"
-            
-            # 保存文件到用户目录（持久化存储）
-            file_info = file_service.save_file(
-                content=content,
-                user_id=current_user.id,
-                md5_hash=md5,
-                original_filename=file.filename
-            )
-            
-            # 标记是否处理成功
-            process_success = False
-            
-            async for progress in process_with_progress(content, file.filename, md5, current_user.id, db, file_info):
-                progress.update(base_info)
-                yield f"data: {json.dumps(progress)}\n\n"
+        stream = SSETaskStream(request)
+        emit = stream.emit
+        # 已落盘的文件（md5 → 文件信息）与已有处理结果的文件：断开时未处理完的统一转入后台队列
+        committed: dict[str, dict] = {}
+        settled: set[str] = set()
+
+        async def process_file(base_info: dict, md5: str, pdf_path: str, file_info: dict, file_size: int):
+            nonlocal current_usage
+
+            def report(stage: str):
+                step, message = STAGE_PROGRESS[stage]
+                emit({**base_info, 'step': step, 'total': 4, 'message': message, 'status': 'processing'})
+
+            try:
+                async with upload_concurrency_limiter.slot(user_id, user_limit):
+                    emit({**base_info, 'step': 1, 'total': 4, 'message': '文件已保存', 'status': 'processing'})
+                    # 确保使用最新的 LLM 配置（版本标记未变化时不重载）
+                    llm_manager.reload_if_changed()
+                    # 与入库队列共用同一条流水线：各阶段写入检查点，重试时从第一个未完成的阶段继续
+                    paper_id = await process_workflow(
+                        pdf_path, md5, user_id, file_info=file_info, on_stage=report, use_stream=True
+                    )
+            except FileExistsError as e:
+                # 近似/语义重复：删除已保存的文件（检查点已由流水线丢弃）
+                settled.add(md5)
+                if delete_unreferenced_file(user_id, md5):
+                    current_usage -= file_size
+                emit({**base_info, 'step': 0, 'total': 4, 'message': str(e)[:80], 'status': 'error'})
+                return
+            except Exception as e:
+                # 保留文件与检查点，由后台队列按退避策略重试（失败占位论文可重新分析）
+                settled.add(md5)
+                _hand_off_to_queue(user_id, md5, file_info)
+                emit({**base_info, 'step': 0, 'total': 4,
+                      'message': f"{_failure_message(e)}（已转入后台队列重试）", 'status': 'error'})
+                return
+
+            settled.add(md5)
+            session = DBSession()
+            try:
+                title = session.query(Paper.title).filter(Paper.id == paper_id).scalar() or base_info['filename']
+            finally:
+                session.close()
+            emit({**base_info, 'step': 4, 'total': 4, 'message': f"处理完成: {title[:30]}...", 'status': 'success'})
+
+        async def stage_and_dispatch():
+            nonlocal current_usage
+            staged_md5 = set()
+            tasks = []
+            for file_index, file in enumerate(files):
+                base_info = {
+                    'filename': file.filename,
+                    'fileIndex': file_index,
+                    'totalFiles': total_files
+                }
+                
+                if not file.filename.lower().endswith('.pdf'):
+                    emit({**base_info, 'step': 0, 'total': 4, 'message': '不是 PDF 文件', 'status': 'error'})
+                    continue
+
+                max_bytes, limit_message = get_upload_limit(current_usage, quota_bytes)
+                # 大小已知时先行拒绝，不写入任何数据
+                if max_bytes is not None and file.size is not None and file.size > max_bytes:
+                    emit({**base_info, 'step': 0, 'total': 4, 'message': limit_message, 'status': 'error'})
+                    continue
+                
+                # 分块写入临时文件并计算 MD5，超限立即中止
+                try:
+                    staged = await file_service.stage_upload(file, user_id, max_bytes)
+                except UploadTooLargeError:
+                    emit({**base_info, 'step': 0, 'total': 4, 'message': limit_message, 'status': 'error'})
+                    continue
+                md5 = staged.md5_hash
+                
+                # 检查当前用户是否已有此 MD5 的文件（用户范围去重，含本次请求中并行处理的文件）
+                existing = md5 in staged_md5 or db.query(Paper.id).filter(
+                    Paper.md5_hash == md5,
+                    Paper.owner_id == user_id
+                ).first()
+                if existing:
+                    file_service.discard_upload(staged)
+                    emit({**base_info, 'step': 0, 'total': 4, 'message': '文件已存在 (MD5 重复)', 'status': 'error'})
+                    continue
+                staged_md5.add(md5)
                 
-                # 检查是否处理成功
-                if progress.get('status') == 'success':
-                    process_success = True
-                elif progress.get('status') == 'error':
-                    # 处理失败，删除已保存的文件
-                    file_service.delete_file(current_user.id, md5)
+                emit({**base_info, 'step': 0, 'total': 4, 'message': '开始处理...', 'status': 'processing'})
+                
+                # 原子重命名到用户目录（持久化存储），后续解析直接读取该文件
+                file_info = file_service.commit_upload(staged, user_id, file.filename)
+                pdf_path = file_service.get_file_path(user_id, md5)
+                committed[md5] = file_info
+                current_usage += staged.file_size
+                
+                tasks.append(stream.spawn(
+                    process_file(base_info, md5, pdf_path, file_info, staged.file_size)
+                ))
+            
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            stream.finish()
+
+        def hand_off_unsettled():
+            # 被取消的文件（处理中、仍在等待并发名额或尚未开始）：保留文件，交给后台队列从已完成的阶段继续
+            for md5, file_info in committed.items():
+                if md5 not in settled and _hand_off_to_queue(user_id, md5, file_info):
+                    logger.info(f"🔌 客户端断开，转入后台入库: {file_info.get('original_filename')}")
+
+        stream.spawn(stage_and_dispatch())
+        try:
+            # 客户端断开时取消尚未完成的处理任务；未处理完的文件在第一个 await 之前同步转入后台队列
+            async for event in stream.events(on_close=hand_off_unsettled):
+                yield event
+        finally:
+            # 表单中的文件在整个流式响应期间保持可读，结束后关闭临时文件
+            with anyio.CancelScope(shield=True):
+                await form.close()
         
         yield f"data: {json.dumps({'done': True})}\n\n"
     
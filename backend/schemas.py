@@ -225,6 +225,10 @@ class UserQuotaRequest(BaseModel):
     storage_quota_mb: int
 
 
+class UserUploadConcurrencyRequest(BaseModel):
+    upload_concurrency: Optional[int] = None  # 为空则恢复系统默认
+
+
 # ================= Batch Operations =================
 class BatchDeleteRequest(BaseModel):
     paper_ids: list[int]
@@ -252,6 +256,22 @@ class BatchExportRequest(BaseModel):
     format: str  # csv, bibtex, markdown, json
 
 
+class NearDuplicatePaper(BaseModel):
+    paper_id: int
+    title: Optional[str] = None
+
+
+class NearDuplicateCluster(BaseModel):
+    papers: list[NearDuplicatePaper]
+
+
+class NearDuplicateClustersResponse(BaseModel):
+    clusters: list[NearDuplicateCluster]
+    threshold: float
+    indexed_count: int  # 已建立签名的论文数
+    total_count: int    # 论文总数（差值为尚未回填签名的论文）
+
+
 # ================= Workspace（团队空间）=================
 class CreateWorkspaceRequest(BaseModel):
     """创建空间请求"""
@@ -537,6 +557,10 @@ class ChatRequest(BaseModel):
     question: str
 
 
+class ChatCacheRequest(BaseModel):
+    enabled: bool
+
+
 class ChatMessageResponse(BaseModel):
     id: int
     role: str
@@ -597,4 +621,6 @@ class ModelConfigResponse(BaseModel):
     last_failure_at: Optional[str] = None
     last_error: Optional[str] = None
     avg_latency_ms: Optional[int] = None
+    success_count: Optional[int] = None
+    failure_count: Optional[int] = None
     created_at: Optional[str] = None
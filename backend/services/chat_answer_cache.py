@@ -0,0 +1,171 @@
+"""
+论文问答回答缓存 - 同一篇论文上近似相同的问题直接返回已有回答
+团队空间中的共享论文常被反复问到同样的问题（“用了什么数据集”“总结一下方法”），每次都是一次完整的 analysis 池调用。
+论文开启问答缓存后：
+  - 问题规范化（NFKC、小写、去空白与标点）后按字符二元组的 Dice 系数匹配，超过阈值即命中
+  - 按问题本身判断是否依赖上下文（指代词、“继续”“展开讲讲”等追问标记）：依赖上下文的提问不查询、不写入缓存，
+    其余提问无论对话中是否已有前文都参与缓存（追问不会拿到脱离上下文的回答）
+  - 条目记录论文内容指纹（MD5 + 摘要 + 深度分析），重新分析或文件变化后查询时自动删除旧条目
+  - 每篇论文最多保留 PAPER_CHAT_CACHE_MAX_ENTRIES 条，超出时淘汰最久未使用的条目
+"""
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from backend.core.db_models import Paper, PaperChatAnswerCache, Session as DBSession
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+
+logger = get_logger("chat_answer_cache")
+
+# 规范化后短于此长度的问题（如“继续”“为什么”）通常依赖上下文，不参与缓存
+MIN_QUESTION_CHARS = 4
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+# 指代前文的代词与追问标记（“他们/they”通常指论文作者，“这篇论文/this paper”指论文本身，不视为依赖上下文）
+_CONTEXT_MARKERS_RE = re.compile(
+    r"它|这个|那个|这些|那些|这一点|这里|那里|上面|上述|刚才|之前|前面|你说|你提到|继续|展开|再详细|详细一点|"
+    r"还有呢|然后呢|为什么呢|第[一二三四五六七八九十\d]+(?:点|条|个|部分)|"
+    r"\b(?:it|its|that|these|those|above|previous|previously|earlier|continue|elaborate|again|"
+    r"you said|you mentioned|what about|how about)\b|"
+    r"\bthis\b(?!\s+(?:paper|work|study|article))"
+)
+
+
+def normalize_question(question: str) -> str:
+    return _NON_WORD_RE.sub("", unicodedata.normalize("NFKC", question or "").lower())
+
+
+def depends_on_context(question: str) -> bool:
+    """问题是否引用了前文（指代词或追问标记），这类问题的回答不能脱离对话复用"""
+    return bool(_CONTEXT_MARKERS_RE.search(unicodedata.normalize("NFKC", question or "").lower()))
+
+
+def _bigrams(text: str) -> Counter:
+    if len(text) < 2:
+        return Counter([text]) if text else Counter()
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def question_similarity(a: str, b: str) -> float:
+    """两个规范化问题的字符二元组 Dice 系数（0~1）"""
+    grams_a, grams_b = _bigrams(a), _bigrams(b)
+    total = sum(grams_a.values()) + sum(grams_b.values())
+    if not total:
+        return 0.0
+    return 2 * sum((grams_a & grams_b).values()) / total
+
+
+def paper_fingerprint(paper: Paper) -> str:
+    """论文内容指纹：文件、摘要或深度分析变化后缓存的回答失效"""
+    parts = [paper.md5_hash, paper.abstract, paper.abstract_en, paper.detailed_analysis]
+    return hashlib.sha256("\x1f".join(part or "" for part in parts).encode("utf-8")).hexdigest()
+
+
+class ChatAnswerCache:
+    """按论文存储的问答回答缓存"""
+
+    def __init__(self, threshold: float = None, max_entries: int = None):
+        self.threshold = settings.paper_chat_cache_threshold if threshold is None else threshold
+        self.max_entries = max_entries or settings.paper_chat_cache_max_entries
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0, "evicted": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def lookup(self, session, paper: Paper, question: str) -> Optional[dict]:
+        """查找近似相同问题的回答，返回 {question, answer, similarity}；论文未开启缓存时返回 None"""
+        if not paper.chat_cache_enabled:
+            return None
+        normalized = normalize_question(question)
+        if len(normalized) < MIN_QUESTION_CHARS or depends_on_context(question):
+            return None
+
+        fingerprint = paper_fingerprint(paper)
+        entries = session.query(PaperChatAnswerCache).filter(PaperChatAnswerCache.paper_id == paper.id).all()
+        stale = [entry for entry in entries if entry.fingerprint != fingerprint]
+        if stale:
+            for entry in stale:
+                session.delete(entry)
+            self._count("invalidated", len(stale))
+            logger.info(f"🧹 论文内容已变化，删除 {len(stale)} 条问答缓存: paper_id={paper.id}")
+
+        best, best_score = None, 0.0
+        for entry in entries:
+            if entry.fingerprint != fingerprint:
+                continue
+            score = question_similarity(normalized, entry.normalized_question)
+            if score > best_score:
+                best, best_score = entry, score
+
+        if best is None or best_score < self.threshold:
+            if stale:
+                session.commit()
+            self._count("misses")
+            return None
+
+        best.hits = (best.hits or 0) + 1
+        best.last_used_at = datetime.now().isoformat()
+        session.commit()
+        self._count("hits")
+        return {"question": best.question, "answer": best.answer, "similarity": round(best_score, 3)}
+
+    def store(self, paper_id: int, fingerprint: str, question: str, answer: str) -> None:
+        """写入回答并按最近使用时间淘汰超出上限的条目（使用独立会话，失败只记录日志）"""
+        normalized = normalize_question(question)
+        if len(normalized) < MIN_QUESTION_CHARS or depends_on_context(question) or not answer:
+            return
+        session = DBSession()
+        try:
+            query = session.query(PaperChatAnswerCache).filter(PaperChatAnswerCache.paper_id == paper_id)
+            if query.filter(
+                PaperChatAnswerCache.normalized_question == normalized,
+                PaperChatAnswerCache.fingerprint == fingerprint,
+            ).first():
+                return
+            now = datetime.now().isoformat()
+            session.add(PaperChatAnswerCache(
+                paper_id=paper_id, question=question, normalized_question=normalized,
+                answer=answer, fingerprint=fingerprint, hits=0, created_at=now, last_used_at=now,
+            ))
+            session.flush()
+            overflow = query.count() - self.max_entries
+            if overflow > 0:
+                evicted = (
+                    query.order_by(PaperChatAnswerCache.last_used_at.asc(), PaperChatAnswerCache.id.asc())
+                    .limit(overflow)
+                    .all()
+                )
+                for entry in evicted:
+                    session.delete(entry)
+                self._count("evicted", len(evicted))
+            session.commit()
+            self._count("stores")
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"⚠️ 问答缓存写入失败: paper_id={paper_id}, {e}")
+        finally:
+            session.close()
+
+    def count(self, session, paper_id: int) -> int:
+        return session.query(PaperChatAnswerCache).filter(PaperChatAnswerCache.paper_id == paper_id).count()
+
+    def clear(self, session, paper_id: int) -> int:
+        """删除论文的全部缓存条目（由调用方提交）"""
+        return session.query(PaperChatAnswerCache).filter(
+            PaperChatAnswerCache.paper_id == paper_id
+        ).delete(synchronize_session=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+# 全局实例
+chat_answer_cache = ChatAnswerCache()
@@ -0,0 +1,221 @@
+"""
+论文问答对话记忆 - 最近几轮保留原文，更早的对话折叠为滚动摘要
+每轮问答只发送：系统提示词（论文上下文 + 摘要）+ 最近 K 轮原文 + 当前问题，提示词体积不随对话变长而增长。
+回答写入后在后台把超出最近 K 轮的消息折叠进 paper_chat_summaries（记录已折叠到的消息 ID），
+组装提示词时按 token 预算依次舍弃较早的对话、摘要，最后截断论文上下文。
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from backend.core.db_models import PaperChatHistory, PaperChatSummary, Session as DBSession
+from backend.core.llm_pool import llm_manager
+from backend.core.log_service import get_logger
+from backend.core.rate_governor import estimate_tokens
+from backend.core.settings import settings
+from backend.services.paper_pipeline import strip_think_tags
+
+logger = get_logger("chat_memory")
+
+# 单次折叠的消息数与单条消息的字符上限（首次为长对话生成摘要时分批进行）
+FOLD_BATCH_MESSAGES = 20
+FOLD_MESSAGE_CHARS = 1500
+# 摘要的字符上限
+SUMMARY_MAX_CHARS = 2000
+
+SUMMARY_PROMPT = """你负责维护一段关于某篇学术论文的问答对话摘要。
+请把【已有摘要】与【新增对话】合并为一份新的摘要：保留用户关心的问题、已得出的结论、涉及的具体数据/方法/术语，以及尚未解决的疑问；
+省略寒暄与重复内容。使用中文，不超过 600 字，只输出摘要正文。
+
+【已有摘要】：
+{summary}
+
+【新增对话】：
+{dialogue}
+"""
+
+
+def _turn_messages(recent_turns: int) -> int:
+    """最近 K 轮对应的消息数（一问一答为一轮）"""
+    return max(0, recent_turns) * 2
+
+
+def assemble_messages(system_prompt: str, summary: Optional[str], history: list[dict],
+                      token_budget: int) -> list[dict]:
+    """
+    按 token 预算组装消息：history 按时间顺序排列，最后一条为当前问题
+
+    优先级：当前问题 > 系统提示词 > 最近的对话（由新到旧） > 摘要；系统提示词超出预算时截断尾部
+    """
+    question, earlier = history[-1], history[:-1]
+    remaining = token_budget - estimate_tokens([question])
+
+    system_tokens = estimate_tokens([system_prompt])
+    if system_tokens > remaining:
+        # 估算规则下每个字符至少 1/4 token、至多 1 token，按字符数截断可保证不超出
+        system_prompt = system_prompt[:max(0, remaining)]
+        remaining = 0
+    else:
+        remaining -= system_tokens
+
+    kept = []
+    for message in reversed(earlier):
+        tokens = estimate_tokens([message])
+        if tokens > remaining:
+            break
+        kept.append(message)
+        remaining -= tokens
+    kept.reverse()
+    # 保证对话以用户提问开头
+    while kept and kept[0]["role"] != "user":
+        kept.pop(0)
+
+    if summary:
+        block = f"\n\n此前对话摘要:\n{summary}"
+        if estimate_tokens([block]) <= remaining:
+            system_prompt += block
+
+    return [{"role": "system", "content": system_prompt}, *kept, question]
+
+
+class ChatMemory:
+    """论文问答对话记忆"""
+
+    def __init__(self, recent_turns: int = None, token_budget: int = None):
+        self.recent_turns = settings.paper_chat_recent_turns if recent_turns is None else recent_turns
+        self.token_budget = token_budget or settings.paper_chat_prompt_token_budget
+        self._refreshing: dict[tuple[int, int], asyncio.Task] = {}
+
+    def _summary_row(self, session, paper_id: int, user_id: int) -> Optional[PaperChatSummary]:
+        return session.query(PaperChatSummary).filter(
+            PaperChatSummary.paper_id == paper_id,
+            PaperChatSummary.user_id == user_id,
+        ).first()
+
+    def _history_query(self, session, paper_id: int, user_id: int, after_id: int):
+        return session.query(PaperChatHistory).filter(
+            PaperChatHistory.paper_id == paper_id,
+            PaperChatHistory.user_id == user_id,
+            PaperChatHistory.id > after_id,
+        )
+
+    def build_messages(self, session, paper_id: int, user_id: int, system_prompt: str) -> list[dict]:
+        """组装本轮的消息列表（当前问题需已写入历史）"""
+        row = self._summary_row(session, paper_id, user_id)
+        covered_until = row.covered_until_id if row else 0
+        # 按 ID 倒序取最近的消息（created_at 为字符串，ID 才是可靠的写入顺序）
+        recent = (
+            self._history_query(session, paper_id, user_id, covered_until or 0)
+            .order_by(PaperChatHistory.id.desc())
+            .limit(_turn_messages(self.recent_turns) + 1)
+            .all()
+        )
+        history = [{"role": m.role, "content": m.content} for m in reversed(recent)]
+        if not history:
+            return [{"role": "system", "content": system_prompt}]
+        return assemble_messages(system_prompt, row.summary if row else None, history, self.token_budget)
+
+    def schedule_refresh(self, paper_id: int, user_id: int) -> None:
+        """在后台折叠超出最近 K 轮的消息；同一对话已有刷新在进行时跳过"""
+        key = (paper_id, user_id)
+        task = self._refreshing.get(key)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self.refresh(paper_id, user_id))
+        self._refreshing[key] = task
+
+        def _forget(done: asyncio.Task):
+            if self._refreshing.get(key) is done:
+                del self._refreshing[key]
+
+        task.add_done_callback(_forget)
+
+    async def refresh(self, paper_id: int, user_id: int) -> bool:
+        """把尚未折叠、且不在最近 K 轮内的消息合并进摘要；返回是否更新了摘要"""
+        session = DBSession()
+        try:
+            row = self._summary_row(session, paper_id, user_id)
+            summary = row.summary if row else ""
+            covered_until = row.covered_until_id if row else 0
+            covered_messages = row.covered_messages if row else 0
+            pending = (
+                self._history_query(session, paper_id, user_id, covered_until or 0)
+                .order_by(PaperChatHistory.id.asc())
+                .all()
+            )
+            keep = _turn_messages(self.recent_turns)
+            to_fold = pending[:len(pending) - keep] if keep else pending
+            if not to_fold:
+                return False
+
+            for start in range(0, len(to_fold), FOLD_BATCH_MESSAGES):
+                batch = to_fold[start:start + FOLD_BATCH_MESSAGES]
+                summary = await self._summarize(summary, batch)
+                covered_until = batch[-1].id
+                covered_messages = (covered_messages or 0) + len(batch)
+            self._save(session, paper_id, user_id, summary, covered_until, covered_messages)
+            logger.info(f"💬 问答摘要已更新: paper_id={paper_id}, user_id={user_id}, 折叠 {len(to_fold)} 条消息")
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"⚠️ 问答摘要更新失败: paper_id={paper_id}, user_id={user_id}, {e}")
+            return False
+        finally:
+            session.close()
+
+    async def _summarize(self, summary: str, messages: list[PaperChatHistory]) -> str:
+        dialogue = "\n".join(
+            f"{'用户' if m.role == 'user' else '助手'}: {m.content[:FOLD_MESSAGE_CHARS]}"
+            for m in messages
+        )
+        response = await llm_manager.chat(
+            pool_name="analysis",
+            messages=[{"role": "user", "content": SUMMARY_PROMPT.format(summary=summary or "（无）", dialogue=dialogue)}],
+            temperature=0.3,
+            cache=False,
+        )
+        content = strip_think_tags(response.choices[0].message.content or "").strip()
+        if not content:
+            raise ValueError("摘要为空")
+        return content[:SUMMARY_MAX_CHARS]
+
+    def _save(self, session, paper_id: int, user_id: int, summary: str,
+              covered_until: int, covered_messages: int) -> None:
+        values = {
+            "summary": summary,
+            "covered_until_id": covered_until,
+            "covered_messages": covered_messages,
+            "updated_at": datetime.now().isoformat(),
+        }
+        row = self._summary_row(session, paper_id, user_id)
+        if row is None:
+            session.add(PaperChatSummary(paper_id=paper_id, user_id=user_id, **values))
+        else:
+            for name, value in values.items():
+                setattr(row, name, value)
+        try:
+            session.commit()
+        except IntegrityError:
+            # 并发创建同一行：回滚后按已存在的行更新
+            session.rollback()
+            session.query(PaperChatSummary).filter(
+                PaperChatSummary.paper_id == paper_id,
+                PaperChatSummary.user_id == user_id,
+            ).update(values, synchronize_session=False)
+            session.commit()
+
+    def clear(self, session, paper_id: int, user_id: int) -> None:
+        """清空对话历史时一并删除摘要（由调用方提交）"""
+        task = self._refreshing.pop((paper_id, user_id), None)
+        if task is not None and not task.done():
+            task.cancel()
+        session.query(PaperChatSummary).filter(
+            PaperChatSummary.paper_id == paper_id,
+            PaperChatSummary.user_id == user_id,
+        ).delete(synchronize_session=False)
+
+
+# 全局实例
+chat_memory = ChatMemory()
@@ -0,0 +1,189 @@
+"""
+论文入库阶段检查点
+入库流程拆为 extract → metadata → dedup → analysis → persist 五个阶段，每完成一个阶段就把结果写入
+ingest_checkpoints（按 owner + 文件 MD5 一行）：
+  - extract：提取文本已由文本缓存按 MD5 持久化（近似查重也在此阶段完成），这里只记录阶段
+  - metadata：元数据 JSON
+  - dedup：语义查重通过
+  - analysis：深度分析结果
+  - persist：论文写入后在同一事务中删除检查点
+失败重试、服务重启以及失败占位论文的重新分析都从第一个未完成的阶段继续，已完成的 LLM 调用不再重复。
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from backend.core.db_models import IngestCheckpoint, IngestionJob, Paper, Session
+from backend.core.log_service import get_logger
+
+logger = get_logger("ingest_checkpoint")
+
+INGEST_STAGES = ("extract", "metadata", "dedup", "analysis", "persist")
+
+
+def stage_reached(completed: Optional[str], stage: str) -> bool:
+    """已完成的阶段是否已覆盖 stage"""
+    if completed not in INGEST_STAGES:
+        return False
+    return INGEST_STAGES.index(completed) >= INGEST_STAGES.index(stage)
+
+
+def next_stage(completed: Optional[str]) -> str:
+    """第一个未完成的阶段"""
+    if completed not in INGEST_STAGES:
+        return INGEST_STAGES[0]
+    return INGEST_STAGES[min(INGEST_STAGES.index(completed) + 1, len(INGEST_STAGES) - 1)]
+
+
+def checkpoint_to_dict(checkpoint: IngestCheckpoint) -> Dict[str, Any]:
+    return {
+        "owner_id": checkpoint.owner_id,
+        "md5_hash": checkpoint.md5_hash,
+        "stage": checkpoint.stage,
+        "next_stage": next_stage(checkpoint.stage),
+        "paper_metadata": checkpoint.paper_metadata,
+        "analysis": checkpoint.analysis,
+        "error_message": checkpoint.error_message,
+        "attempts": checkpoint.attempts or 0,
+        "created_at": checkpoint.created_at,
+        "updated_at": checkpoint.updated_at,
+    }
+
+
+class IngestCheckpointStore:
+    """入库检查点读写；缺少 MD5 时不记录检查点（所有方法退化为空操作）"""
+
+    def _query(self, session, owner_id: Optional[int], md5_hash: str):
+        return session.query(IngestCheckpoint).filter(
+            IngestCheckpoint.owner_id == owner_id,
+            IngestCheckpoint.md5_hash == md5_hash,
+        )
+
+    def load(self, owner_id: Optional[int], md5_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not md5_hash:
+            return None
+        session = Session()
+        try:
+            checkpoint = self._query(session, owner_id, md5_hash).first()
+            return checkpoint_to_dict(checkpoint) if checkpoint else None
+        finally:
+            session.close()
+
+    def save(self, owner_id: Optional[int], md5_hash: Optional[str], stage: str, **fields) -> None:
+        """记录阶段完成（fields 为该阶段的结果：paper_metadata / analysis）"""
+        if not md5_hash:
+            return
+        session = Session()
+        try:
+            checkpoint = self._query(session, owner_id, md5_hash).first()
+            if checkpoint is None:
+                checkpoint = IngestCheckpoint(owner_id=owner_id, md5_hash=md5_hash, attempts=0)
+                session.add(checkpoint)
+            checkpoint.stage = stage
+            for name, value in fields.items():
+                setattr(checkpoint, name, value)
+            checkpoint.updated_at = datetime.now().isoformat()
+            try:
+                session.commit()
+            except IntegrityError:
+                # 并发创建同一检查点：回滚后按已存在的行更新
+                session.rollback()
+                self._query(session, owner_id, md5_hash).update(
+                    {"stage": stage, "updated_at": datetime.now().isoformat(), **fields},
+                    synchronize_session=False,
+                )
+                session.commit()
+        finally:
+            session.close()
+
+    def record_error(self, owner_id: Optional[int], md5_hash: Optional[str], error: str) -> None:
+        """记录失败原因与次数（保留已完成阶段的结果）"""
+        if not md5_hash:
+            return
+        session = Session()
+        try:
+            checkpoint = self._query(session, owner_id, md5_hash).first()
+            if checkpoint is None:
+                checkpoint = IngestCheckpoint(owner_id=owner_id, md5_hash=md5_hash, attempts=0)
+                session.add(checkpoint)
+            checkpoint.error_message = error
+            checkpoint.attempts = (checkpoint.attempts or 0) + 1
+            checkpoint.updated_at = datetime.now().isoformat()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"⚠️ 入库检查点错误记录失败: {e}")
+        finally:
+            session.close()
+
+    def clear(self, owner_id: Optional[int], md5_hash: Optional[str], session=None) -> None:
+        """删除检查点；传入 session 时由调用方提交（与论文写入同一事务）"""
+        if not md5_hash:
+            return
+        if session is not None:
+            self._query(session, owner_id, md5_hash).delete(synchronize_session=False)
+            return
+        session = Session()
+        try:
+            self._query(session, owner_id, md5_hash).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def stuck(self, older_than_seconds: float = 0, owner_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        按下一个待执行阶段分组列出卡住的入库（检查点超过指定时间未更新）
+        附带最近一次入库任务状态与失败占位论文 ID
+        """
+        cutoff = (datetime.now() - timedelta(seconds=older_than_seconds)).isoformat()
+        session = Session()
+        try:
+            query = session.query(IngestCheckpoint).filter(IngestCheckpoint.updated_at <= cutoff)
+            if owner_id is not None:
+                query = query.filter(IngestCheckpoint.owner_id == owner_id)
+            checkpoints = query.order_by(IngestCheckpoint.updated_at).all()
+
+            md5_hashes = {checkpoint.md5_hash for checkpoint in checkpoints}
+            jobs = {}
+            papers = {}
+            if md5_hashes:
+                for job in (
+                    session.query(IngestionJob)
+                    .filter(IngestionJob.md5_hash.in_(md5_hashes))
+                    .order_by(IngestionJob.id)
+                ):
+                    jobs[(job.user_id, job.md5_hash)] = job
+                for paper_id, paper_owner, paper_md5 in (
+                    session.query(Paper.id, Paper.owner_id, Paper.md5_hash)
+                    .filter(Paper.md5_hash.in_(md5_hashes))
+                ):
+                    papers[(paper_owner, paper_md5)] = paper_id
+
+            stages = {stage: [] for stage in INGEST_STAGES}
+            for checkpoint in checkpoints:
+                key = (checkpoint.owner_id, checkpoint.md5_hash)
+                job = jobs.get(key)
+                metadata = checkpoint.paper_metadata or {}
+                item = checkpoint_to_dict(checkpoint)
+                item.pop("analysis")
+                item.pop("paper_metadata")
+                item.update({
+                    "title": metadata.get("title") or (job.original_filename if job else None),
+                    "job_id": job.id if job else None,
+                    "job_status": job.status if job else None,
+                    "paper_id": papers.get(key),
+                })
+                stages[item["next_stage"]].append(item)
+        finally:
+            session.close()
+
+        return {
+            "total": sum(len(items) for items in stages.values()),
+            "counts": {stage: len(items) for stage, items in stages.items()},
+            "stages": stages,
+        }
+
+
+# 全局实例
+ingest_checkpoints = IngestCheckpointStore()
@@ -0,0 +1,440 @@
+"""
+论文入库队列管理模块
+/api/upload 只负责持久化文件并创建任务，解析、元数据、查重、深度分析与入库由后台 worker 执行。
+任务状态落库：服务重启后中断的任务自动恢复，失败任务按指数退避重试；
+各阶段结果写入入库检查点（见 ingest_checkpoint），重试时从第一个未完成的阶段继续。
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import or_
+
+from backend.core.audit_service import log_audit_event
+from backend.core.db_models import IngestCheckpoint, IngestionJob, Paper, Session
+from backend.core.file_service import file_service
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+
+logger = get_logger("ingestion_queue")
+
+ACTIVE_STATUSES = ("pending", "processing")
+FINAL_STATUSES = ("completed", "duplicate", "failed", "cancelled")
+RETRY_BACKOFF = 2.0
+
+
+def _safe_error(error: Exception) -> str:
+    message = (str(error) or type(error).__name__).replace("\r", " ").replace("\n", " ").strip()
+    return message[:300] + "..." if len(message) > 300 else message
+
+
+def delete_unreferenced_file(user_id: int, md5_hash: str) -> bool:
+    """删除用户目录中的文件；仍有论文引用该文件（同一用户 + MD5）时保留"""
+    session = Session()
+    try:
+        referenced = session.query(Paper.id).filter(
+            Paper.owner_id == user_id,
+            Paper.md5_hash == md5_hash,
+        ).first()
+    finally:
+        session.close()
+    if referenced:
+        logger.warning(f"⚠️ 文件仍被论文引用，保留: user_id={user_id}, md5={md5_hash}")
+        return False
+    return file_service.delete_file(user_id, md5_hash)
+
+
+def job_to_dict(job: IngestionJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "user_id": job.user_id,
+        "md5_hash": job.md5_hash,
+        "filename": job.original_filename,
+        "file_size": job.file_size,
+        "status": job.status,
+        "stage": job.stage,
+        "error_message": job.error_message,
+        "retry_count": job.retry_count or 0,
+        "paper_id": job.paper_id,
+        "created_at": job.created_at,
+        "next_attempt_at": job.next_attempt_at,
+        "started_at": job.started_at,
+        "completed_at": job.completed_at,
+    }
+
+
+class IngestionQueueManager:
+    """论文入库队列管理器（多个 worker 协程并发领取任务）"""
+
+    def __init__(self):
+        self._is_running = False
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._active_jobs: Dict[int, str] = {}
+        self._load_config()
+
+    def _load_config(self):
+        """加载配置"""
+        self.max_concurrent = max(1, settings.ingestion_max_concurrent)
+        self.retry_max = settings.ingestion_retry_max
+        self.retry_delay = settings.ingestion_retry_delay
+
+    @property
+    def is_running(self) -> bool:
+        return self._is_running
+
+    # ================= 任务管理 =================
+
+    def enqueue(self, user_id: int, md5_hash: str, file_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        创建入库任务（文件需已持久化到用户目录）
+
+        Raises:
+            ValueError: 同一用户的同一文件已有进行中的任务
+        """
+        session = Session()
+        try:
+            existing = session.query(IngestionJob.id).filter(
+                IngestionJob.user_id == user_id,
+                IngestionJob.md5_hash == md5_hash,
+                IngestionJob.status.in_(ACTIVE_STATUSES),
+            ).first()
+            if existing:
+                raise ValueError("文件已在处理队列中")
+
+            job = IngestionJob(
+                user_id=user_id,
+                md5_hash=md5_hash,
+                original_filename=file_info.get("original_filename"),
+                file_path=file_info.get("file_path"),
+                file_size=file_info.get("file_size"),
+                uploaded_at=file_info.get("uploaded_at"),
+                status="pending",
+                retry_count=0,
+                created_at=datetime.now().isoformat(),
+            )
+            session.add(job)
+            session.commit()
+            logger.info(f"创建入库任务: job_id={job.id}, file={job.original_filename}")
+            result = job_to_dict(job)
+        finally:
+            session.close()
+
+        self.notify()
+        return result
+
+    def notify(self):
+        """唤醒空闲 worker（入队后立即领取，无需等待轮询）"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        session = Session()
+        try:
+            job = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            return job_to_dict(job) if job else None
+        finally:
+            session.close()
+
+    def list_jobs(self, user_id: Optional[int] = None, status: Optional[str] = None,
+                  limit: int = 50) -> List[Dict[str, Any]]:
+        session = Session()
+        try:
+            query = session.query(IngestionJob).order_by(IngestionJob.created_at.desc(), IngestionJob.id.desc())
+            if user_id is not None:
+                query = query.filter(IngestionJob.user_id == user_id)
+            if status:
+                query = query.filter(IngestionJob.status == status)
+            return [job_to_dict(job) for job in query.limit(limit).all()]
+        finally:
+            session.close()
+
+    def cancel_job(self, job_id: int) -> bool:
+        """取消排队中的任务并删除已保存的文件（处理中的任务不可取消）"""
+        session = Session()
+        try:
+            job = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if not job or job.status != "pending":
+                return False
+            job.status = "cancelled"
+            job.completed_at = datetime.now().isoformat()
+            session.query(IngestCheckpoint).filter(
+                IngestCheckpoint.owner_id == job.user_id,
+                IngestCheckpoint.md5_hash == job.md5_hash,
+            ).delete(synchronize_session=False)
+            session.commit()
+            delete_unreferenced_file(job.user_id, job.md5_hash)
+            logger.info(f"取消入库任务: job_id={job_id}")
+            return True
+        finally:
+            session.close()
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        session = Session()
+        try:
+            stats = {
+                status: session.query(IngestionJob).filter(IngestionJob.status == status).count()
+                for status in ACTIVE_STATUSES + FINAL_STATUSES
+            }
+        finally:
+            session.close()
+        stats["is_running"] = self._is_running
+        stats["workers"] = self.max_concurrent
+        stats["active_jobs"] = dict(self._active_jobs)
+        return stats
+
+    def recover_incomplete_jobs_on_startup(self) -> Dict[str, int]:
+        """
+        启动时恢复异常中断的任务：
+        - 未超过重试上限：重置为 pending
+        - 超过重试上限：标记 failed 并写入失败占位论文
+        """
+        session = Session()
+        recovered = 0
+        marked_failed = 0
+        try:
+            stuck_jobs = session.query(IngestionJob).filter(IngestionJob.status == "processing").all()
+            for job in stuck_jobs:
+                if (job.retry_count or 0) < self.retry_max:
+                    job.retry_count = (job.retry_count or 0) + 1
+                    job.status = "pending"
+                    job.started_at = None
+                    job.next_attempt_at = None
+                    job.error_message = f"服务重启后自动恢复，重试 {job.retry_count}/{self.retry_max}"
+                    recovered += 1
+                else:
+                    self._mark_failed(session, job, "服务重启后恢复失败：超过最大重试次数")
+                    marked_failed += 1
+            session.commit()
+        finally:
+            session.close()
+
+        if recovered or marked_failed:
+            logger.info(f"入库任务恢复完成: recovered={recovered}, failed={marked_failed}")
+        return {"recovered": recovered, "failed": marked_failed}
+
+    # ================= Worker =================
+
+    async def start_worker(self):
+        """启动入库 worker（并发数由 INGESTION_MAX_CONCURRENT 控制）"""
+        if self._is_running:
+            logger.warning("入库 worker 已在运行")
+            return
+        self._is_running = True
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker_loop(index)) for index in range(self.max_concurrent)
+        ]
+        logger.info(f"入库 worker 已启动: concurrency={self.max_concurrent}")
+
+    async def stop_worker(self):
+        """停止 worker；处理中的任务保持 processing，下次启动时自动恢复"""
+        self._is_running = False
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+        logger.info("入库 worker 已停止")
+
+    async def _worker_loop(self, index: int):
+        while self._is_running:
+            try:
+                job_id = self._claim_next()
+            except Exception as e:
+                logger.error(f"领取入库任务失败: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"处理入库任务时出错: job_id={job_id}, error={e}")
+            finally:
+                self._active_jobs.pop(job_id, None)
+
+    def _claim_next(self) -> Optional[int]:
+        """原子领取一个到期的 pending 任务（条件更新，多个 worker/进程不会重复领取）"""
+        now = datetime.now().isoformat()
+        session = Session()
+        try:
+            candidates = (
+                session.query(IngestionJob.id)
+                .filter(
+                    IngestionJob.status == "pending",
+                    or_(IngestionJob.next_attempt_at.is_(None), IngestionJob.next_attempt_at <= now),
+                )
+                .order_by(IngestionJob.created_at, IngestionJob.id)
+                .limit(self.max_concurrent + 1)
+                .all()
+            )
+            for (job_id,) in candidates:
+                claimed = (
+                    session.query(IngestionJob)
+                    .filter(IngestionJob.id == job_id, IngestionJob.status == "pending")
+                    .update({"status": "processing", "started_at": now, "stage": None},
+                            synchronize_session=False)
+                )
+                session.commit()
+                if claimed:
+                    return job_id
+            return None
+        finally:
+            session.close()
+
+    def _set_stage(self, job_id: int, stage: str):
+        self._active_jobs[job_id] = stage
+        session = Session()
+        try:
+            session.query(IngestionJob).filter(IngestionJob.id == job_id).update(
+                {"stage": stage}, synchronize_session=False
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    async def _run_job(self, job_id: int):
+        from backend.services.paper_pipeline import process_workflow
+
+        job = self.get_job(job_id)
+        if not job:
+            return
+        self._active_jobs[job_id] = "queued"
+        logger.info(f"开始处理入库任务: job_id={job_id}, file={job['filename']}")
+
+        file_path = None
+        session = Session()
+        try:
+            record = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if record.file_path:
+                file_path = file_service.get_file_path_by_relative(record.file_path)
+            if not file_path:
+                file_path = file_service.get_file_path(job["user_id"], job["md5_hash"])
+            file_info = {
+                "file_path": record.file_path,
+                "file_size": record.file_size,
+                "original_filename": record.original_filename,
+                "uploaded_at": record.uploaded_at,
+            }
+        finally:
+            session.close()
+
+        if not file_path:
+            self._finish(job_id, "failed", error="PDF 文件不存在")
+            return
+
+        try:
+            paper_id = await process_workflow(
+                file_path, job["md5_hash"], job["user_id"],
+                file_info=file_info,
+                on_stage=lambda stage: self._set_stage(job_id, stage),
+            )
+        except FileExistsError as e:
+            # 语义/近似重复：删除已保存的文件（已入库的论文仍引用时保留）
+            delete_unreferenced_file(job["user_id"], job["md5_hash"])
+            self._finish(job_id, "duplicate", error=str(e))
+            logger.info(f"入库任务重复: job_id={job_id}, {e}")
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._handle_failure(job_id, e)
+            return
+
+        self._finish(job_id, "completed", paper_id=paper_id)
+        log_audit_event(
+            action="upload_paper",
+            resource_type="paper",
+            resource_id=job["md5_hash"],
+            user_id=job["user_id"],
+            details={"filename": job["filename"], "file_size": job["file_size"], "job_id": job_id},
+        )
+        logger.info(f"入库任务完成: job_id={job_id}, paper_id={paper_id}")
+
+    def _finish(self, job_id: int, status: str, paper_id: Optional[int] = None, error: Optional[str] = None):
+        session = Session()
+        try:
+            job = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if not job:
+                return
+            job.status = status
+            job.completed_at = datetime.now().isoformat()
+            job.error_message = error
+            if paper_id is not None:
+                job.paper_id = paper_id
+            session.commit()
+        finally:
+            session.close()
+
+    def _handle_failure(self, job_id: int, error: Exception):
+        """失败处理：未超过重试上限则退避后重试，否则写入失败占位论文（可在列表中重新分析）"""
+        message = _safe_error(error)
+        session = Session()
+        try:
+            job = session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if not job:
+                return
+            if (job.retry_count or 0) < self.retry_max:
+                job.retry_count = (job.retry_count or 0) + 1
+                delay = self.retry_delay * (RETRY_BACKOFF ** (job.retry_count - 1))
+                job.status = "pending"
+                job.next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+                job.error_message = f"重试 {job.retry_count}/{self.retry_max}: {message}"
+                logger.warning(f"入库任务失败，{delay:.0f} 秒后重试: job_id={job_id}, error={message}")
+            else:
+                self._mark_failed(session, job, message)
+                logger.error(f"入库任务最终失败: job_id={job_id}, error={message}")
+            session.commit()
+        finally:
+            session.close()
+        self.notify()
+
+    def _mark_failed(self, session, job: IngestionJob, message: str):
+        """标记最终失败并写入占位论文（重新分析时从入库检查点续跑）"""
+        job.status = "failed"
+        job.error_message = message
+        job.completed_at = datetime.now().isoformat()
+        paper = session.query(Paper).filter(
+            Paper.md5_hash == job.md5_hash,
+            Paper.owner_id == job.user_id,
+        ).first()
+        if not paper:
+            # 保留检查点供重新分析续跑；已提取的元数据直接用于占位论文
+            checkpoint = session.query(IngestCheckpoint).filter(
+                IngestCheckpoint.owner_id == job.user_id,
+                IngestCheckpoint.md5_hash == job.md5_hash,
+            ).first()
+            metadata = (checkpoint.paper_metadata if checkpoint else None) or {}
+            paper = Paper(
+                md5_hash=job.md5_hash,
+                title=metadata.get("title") or job.original_filename,
+                title_cn=metadata.get("title_cn"),
+                journal=metadata.get("journal"),
+                year=str(metadata["year"]) if metadata.get("year") is not None else None,
+                authors=metadata.get("authors"),
+                abstract_en=metadata.get("abstract_en"),
+                abstract=metadata.get("abstract"),
+                detailed_analysis=f"分析失败：{message}",
+                owner_id=job.user_id,
+                file_path=job.file_path,
+                file_size=job.file_size,
+                original_filename=job.original_filename,
+                uploaded_at=job.uploaded_at,
+            )
+            session.add(paper)
+            session.flush()
+        job.paper_id = paper.id
+
+
+# 全局入库队列管理器实例
+ingestion_queue_manager = IngestionQueueManager()
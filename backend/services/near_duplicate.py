@@ -0,0 +1,238 @@
+"""
+论文近似查重 - MinHash 签名 + LSH 分桶
+规范化标题只能识别标题完全一致的重复；预印本与正式版、v1/v2 往往标题略有改动但正文开头高度相似。
+这里对开头几页文本做词级 shingle，计算 MinHash 签名估算 Jaccard 相似度：
+  - 签名按 band 切分后写入桶表，查询时只比对至少共享一个桶的候选（索引查询，毫秒级）
+  - 候选再用完整签名估算相似度，达到阈值才判定为重复
+"""
+import asyncio
+import hashlib
+import random
+import re
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from backend.core.db_models import Paper, PaperLSHBucket, PaperMinHash
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+
+logger = get_logger("near_duplicate")
+
+NUM_PERM = 128
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5
+# shingle 太少时签名不可靠（几乎没有文字的页面），不参与查重
+MIN_SHINGLES = 20
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 固定种子：签名需要跨进程、跨重启可比
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+_SIGNATURE_FORMAT = f"<{NUM_PERM}I"
+_BAND_FORMAT = f"<{LSH_ROWS}I"
+
+# 英文按单词、中文按单字切分
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]")
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+    """词级 shingle 的 32 位哈希集合"""
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    if len(tokens) < size:
+        grams = [" ".join(tokens)] if tokens else []
+    else:
+        grams = (" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1))
+    return {
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little")
+        for gram in grams
+    }
+
+
+def minhash_signature(text: str) -> Optional[list[int]]:
+    """计算 MinHash 签名；文本过短返回 None"""
+    hashes = shingle_hashes(text)
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_jaccard(left: list[int], right: list[int]) -> float:
+    return sum(1 for x, y in zip(left, right) if x == y) / NUM_PERM
+
+
+def pack_signature(signature: list[int]) -> bytes:
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data: bytes) -> list[int]:
+    return list(struct.unpack(_SIGNATURE_FORMAT, data))
+
+
+def band_keys(signature: list[int]) -> list[str]:
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(struct.pack(_BAND_FORMAT, *rows), digest_size=8).hexdigest()
+        keys.append(f"{band:02d}:{digest}")
+    return keys
+
+
+class NearDuplicateIndex:
+    """基于数据库桶表的 LSH 近似查重索引（按 owner 隔离，与语义查重范围一致）"""
+
+    def __init__(self, threshold: float = None):
+        self.threshold = settings.near_duplicate_threshold if threshold is None else threshold
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "matches": 0, "indexed": 0, "total_lookup_ms": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def _count(self, name: str, amount=1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    async def signature_async(self, text: str) -> Optional[list[int]]:
+        """在线程中计算签名（纯 CPU，避免阻塞事件循环）；未启用时返回 None"""
+        if not self.enabled or not text:
+            return None
+        return await asyncio.to_thread(minhash_signature, text)
+
+    def find(self, session: Session, signature: list[int], owner_id: int = None,
+             exclude_paper_id: int = None, threshold: float = None) -> list[dict]:
+        """返回相似度达到阈值的已有论文 [{paper_id, title, similarity}]，按相似度降序"""
+        if not signature:
+            return []
+        threshold = self.threshold if threshold is None else threshold
+        started = time.perf_counter()
+
+        candidate_query = session.query(PaperLSHBucket.paper_id).filter(
+            PaperLSHBucket.bucket_key.in_(band_keys(signature))
+        )
+        if owner_id:
+            candidate_query = candidate_query.filter(PaperLSHBucket.owner_id == owner_id)
+        candidate_ids = {paper_id for (paper_id,) in candidate_query.distinct()}
+        candidate_ids.discard(exclude_paper_id)
+
+        matches = []
+        if candidate_ids:
+            rows = (
+                session.query(PaperMinHash.paper_id, PaperMinHash.signature, Paper.title)
+                .join(Paper, Paper.id == PaperMinHash.paper_id)
+                .filter(PaperMinHash.paper_id.in_(candidate_ids))
+                .all()
+            )
+            for paper_id, packed, title in rows:
+                similarity = estimate_jaccard(signature, unpack_signature(packed))
+                if similarity >= threshold:
+                    matches.append({"paper_id": paper_id, "title": title, "similarity": round(similarity, 3)})
+            matches.sort(key=lambda m: m["similarity"], reverse=True)
+
+        self._count("lookups")
+        self._count("total_lookup_ms", (time.perf_counter() - started) * 1000)
+        if matches:
+            self._count("matches")
+        return matches
+
+    def add(self, session: Session, paper_id: int, owner_id: Optional[int], signature: list[int]) -> None:
+        """写入（或替换）论文签名与桶键，由调用方提交事务"""
+        if not signature:
+            return
+        self.remove(session, paper_id)
+        session.add(PaperMinHash(paper_id=paper_id, owner_id=owner_id, signature=pack_signature(signature)))
+        session.add_all([
+            PaperLSHBucket(paper_id=paper_id, owner_id=owner_id, bucket_key=key)
+            for key in band_keys(signature)
+        ])
+        self._count("indexed")
+
+    def remove(self, session: Session, paper_id: int) -> None:
+        session.query(PaperLSHBucket).filter(PaperLSHBucket.paper_id == paper_id).delete(synchronize_session=False)
+        session.query(PaperMinHash).filter(PaperMinHash.paper_id == paper_id).delete(synchronize_session=False)
+
+    def clusters(self, session: Session, owner_id: int = None, threshold: float = None) -> list[list[dict]]:
+        """
+        批量找出库中的近似重复簇（并查集合并共享桶且相似度达标的论文对）
+        返回 [[{paper_id, title}...]]，按簇大小降序
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature_query = (
+            session.query(PaperMinHash.paper_id, PaperMinHash.signature, Paper.title)
+            .join(Paper, Paper.id == PaperMinHash.paper_id)
+        )
+        bucket_query = session.query(PaperLSHBucket.bucket_key, PaperLSHBucket.paper_id)
+        if owner_id:
+            signature_query = signature_query.filter(PaperMinHash.owner_id == owner_id)
+            bucket_query = bucket_query.filter(PaperLSHBucket.owner_id == owner_id)
+
+        signatures = {}
+        titles = {}
+        for paper_id, packed, title in signature_query.all():
+            signatures[paper_id] = unpack_signature(packed)
+            titles[paper_id] = title
+
+        buckets = defaultdict(list)
+        for bucket_key, paper_id in bucket_query.all():
+            if paper_id in signatures:
+                buckets[bucket_key].append(paper_id)
+
+        parent = {paper_id: paper_id for paper_id in signatures}
+
+        def find_root(paper_id):
+            while parent[paper_id] != paper_id:
+                parent[paper_id] = parent[parent[paper_id]]
+                paper_id = parent[paper_id]
+            return paper_id
+
+        compared = set()
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            for i, left in enumerate(members):
+                for right in members[i + 1:]:
+                    pair = (left, right) if left < right else (right, left)
+                    if pair in compared:
+                        continue
+                    compared.add(pair)
+                    left_root, right_root = find_root(left), find_root(right)
+                    if left_root == right_root:
+                        continue
+                    if estimate_jaccard(signatures[left], signatures[right]) >= threshold:
+                        parent[right_root] = left_root
+
+        groups = defaultdict(list)
+        for paper_id in signatures:
+            groups[find_root(paper_id)].append(paper_id)
+        result = [
+            [{"paper_id": paper_id, "title": titles[paper_id]} for paper_id in sorted(members)]
+            for members in groups.values() if len(members) > 1
+        ]
+        result.sort(key=len, reverse=True)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["lookups"]
+        stats["avg_lookup_ms"] = round(stats["total_lookup_ms"] / lookups, 2) if lookups else 0.0
+        stats["total_lookup_ms"] = round(stats["total_lookup_ms"], 2)
+        stats["threshold"] = self.threshold
+        return stats
+
+
+# 全局实例
+near_duplicate_index = NearDuplicateIndex()
@@ -0,0 +1,137 @@
+"""
+论文文本分块 - 按章节标题切分，再打包为不超过 token 预算的片段
+"""
+import re
+from dataclasses import dataclass
+
+from backend.core.rate_governor import estimate_tokens
+
+# 常见章节标题：编号标题（1 Introduction / 2.1 Method / IV. Results）、英文常见章节名、Chapter、中文章/节
+_HEADING_RE = re.compile(
+    r"^[ \t]*(?:"
+    r"(?:\d{1,2}(?:\.\d{1,2}){0,2}\.?|[IVX]{1,5}\.)[ \t]+[A-Z][^\n]{0,80}"
+    r"|(?:abstract|introduction|related work|background|preliminaries|method(?:s|ology)?|approach"
+    r"|experiments?|evaluation|results?|discussion|conclusions?|limitations|future work|appendix"
+    r"|acknowledge?ments?|references|bibliography)(?:[ \t][^\n]{0,40})?"
+    r"|chapter[ \t]+\d+[^\n]{0,80}"
+    r"|第[一二三四五六七八九十百\d]+[章节][^\n]{0,40}"
+    r"|摘[ \t]*要|引[ \t]*言|结[ \t]*论|参考文献|致[ \t]*谢"
+    r")[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# 参考文献等对分析无用的章节
+_SKIP_SECTION_RE = re.compile(r"^\s*(?:[\dIVX.]+\s*)?(references|bibliography|参考文献)\s*$", re.IGNORECASE)
+
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+@dataclass
+class TextChunk:
+    """一个待处理的文本片段"""
+    index: int
+    section: str
+    text: str
+    tokens: int
+
+
+def estimate_text_tokens(text: str) -> int:
+    return estimate_tokens([text])
+
+
+def split_sections(text: str) -> list[tuple[str, str]]:
+    """按章节标题切分，返回 [(标题, 正文)]；标题前的内容归入“开头”"""
+    sections = []
+    title = "开头"
+    last_end = 0
+    for match in _HEADING_RE.finditer(text):
+        body = text[last_end:match.start()]
+        if body.strip():
+            sections.append((title, body))
+        title = match.group(0).strip()
+        last_end = match.end()
+    tail = text[last_end:]
+    if tail.strip():
+        sections.append((title, tail))
+    return sections
+
+
+def _split_oversized(text: str, max_tokens: int) -> list[str]:
+    """将超出预算的章节按段落、行、字符逐级切开"""
+    pieces = []
+    for separator_re in (_PARAGRAPH_SPLIT_RE, re.compile(r"\n")):
+        parts = [p for p in separator_re.split(text) if p.strip()]
+        if len(parts) > 1:
+            break
+    else:
+        parts = [text]
+
+    buffer, buffer_tokens = [], 0
+    for part in parts:
+        part_tokens = estimate_text_tokens(part)
+        if part_tokens > max_tokens:
+            if buffer:
+                pieces.append("\n\n".join(buffer))
+                buffer, buffer_tokens = [], 0
+            if len(parts) > 1:
+                pieces.extend(_split_oversized(part, max_tokens))
+            else:
+                # 无法再按结构切分：按字符硬切（字符数 ≥ token 数，保守）
+                step = max(1, max_tokens)
+                pieces.extend(part[i:i + step] for i in range(0, len(part), step))
+            continue
+        if buffer and buffer_tokens + part_tokens > max_tokens:
+            pieces.append("\n\n".join(buffer))
+            buffer, buffer_tokens = [], 0
+        buffer.append(part)
+        buffer_tokens += part_tokens
+    if buffer:
+        pieces.append("\n\n".join(buffer))
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int, skip_references: bool = True) -> list[TextChunk]:
+    """
+    章节感知分块：相邻的小章节合并到同一片段，超长章节在段落边界处拆开
+
+    Args:
+        text: 论文全文
+        max_tokens: 单个片段的 token 上限（估算值）
+        skip_references: 是否丢弃参考文献章节
+    """
+    chunks: list[TextChunk] = []
+    titles: list[str] = []
+    buffer: list[str] = []
+    buffer_tokens = 0
+
+    def flush():
+        nonlocal buffer, buffer_tokens, titles
+        if buffer:
+            chunks.append(TextChunk(
+                index=len(chunks),
+                section=" / ".join(dict.fromkeys(titles)),
+                text="\n\n".join(buffer),
+                tokens=buffer_tokens,
+            ))
+        buffer, buffer_tokens, titles = [], 0, []
+
+    for title, body in split_sections(text):
+        if skip_references and _SKIP_SECTION_RE.match(title):
+            continue
+        section_text = f"{title}\n{body.strip()}" if title != "开头" else body.strip()
+        section_tokens = estimate_text_tokens(section_text)
+        if section_tokens > max_tokens:
+            flush()
+            for piece in _split_oversized(section_text, max_tokens):
+                titles = [title]
+                buffer = [piece]
+                buffer_tokens = estimate_text_tokens(piece)
+                flush()
+            continue
+        if buffer and buffer_tokens + section_tokens > max_tokens:
+            flush()
+        titles.append(title)
+        buffer.append(section_text)
+        buffer_tokens += section_tokens
+    flush()
+    return chunks
@@ -1,30 +1,24 @@
 import os
 import json
 import re
-import fitz  # PyMuPDF
 import asyncio
 from sqlalchemy.orm import Session
 from backend.core.db_models import Paper, Session as DBSession
 from json_repair import repair_json
 from backend.core.llm_pool import llm_manager
 from backend.core.log_service import workflow_logger, get_logger
+from backend.core.settings import settings
+from backend.core.utils import normalize_title
+from backend.services.paper_chunking import TextChunk, chunk_text, estimate_text_tokens
+from backend.services.near_duplicate import near_duplicate_index
+from backend.services.ingest_checkpoint import ingest_checkpoints, next_stage, stage_reached
+from backend.services.paper_retrieval import paper_retrieval_store
+from backend.services.pdf_parser import extract_pdf_content_async, extract_pdf_head_async, sanitize_text_for_llm
 logger = get_logger("main")
 
 
 # ================= 工具函数 =================
 
-def normalize_title(title):
-    if not title: return ""
-    return re.sub(r'[^a-zA-Z0-9]', '', title).lower()
-
-_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
-
-def sanitize_text_for_llm(text: str) -> str:
-    """移除控制字符，降低上游接口误拦截概率"""
-    if not text:
-        return ""
-    return _CONTROL_CHARS_RE.sub("", text)
-
 _THINK_TAGS_RE = re.compile(r'<think[^>]*>[\s\S]*?</think>', re.IGNORECASE)
 _THINKING_TAGS_RE = re.compile(r'<thinking[^>]*>[\s\S]*?</thinking>', re.IGNORECASE)
 
@@ -36,45 +30,20 @@ def strip_think_tags(text: str) -> str:
     text = _THINKING_TAGS_RE.sub("", text)
     return text.strip()
 
-def extract_pdf_content(file_path):
-    logger.debug(f"正在读取 PDF: {file_path}")
-    try:
-        # 元数据提取只需要前几页（标题/作者/摘要通常都在首页），避免输入过长或包含无关内容
-        head_pages = 2
-        head_max_chars = 8000
-
-        full_text_parts = []
-        head_text_parts = []
-
-        with fitz.open(file_path) as doc:
-            for page_index, page in enumerate(doc):
-                page_text = page.get_text()
-                full_text_parts.append(page_text)
-                if page_index < head_pages and len("".join(head_text_parts)) < head_max_chars:
-                    head_text_parts.append(page_text)
-
-        full_text = sanitize_text_for_llm("".join(full_text_parts))
-        head_text = sanitize_text_for_llm("".join(head_text_parts))[:head_max_chars]
-        if not head_text and full_text:
-            head_text = full_text[:head_max_chars]
-        
-        if len(full_text) < 100:
-            logger.warning("提取内容过少，可能是扫描件")
-            return None, None
-
-        return head_text, full_text
-    except Exception as e:
-        logger.error(f"PDF 读取失败: {e}")
-        return None, None
-
 # ================= LLM 任务 =================
 
-async def task_extract_metadata(text):
+async def task_extract_metadata(text, cache: bool | None = None):
+    """cache=False 时绕过 LLM 响应缓存（重新分析需要重新生成）"""
     if not text: return None
     logger.info("请求元数据提取 (Pool: Metadata)")
     
     def validate_json(content):
-        return "title" in content and len(content) > 20
+        # 只有能解析为带标题的 JSON 对象才算通过；未通过质检的响应不会写入（或从中命中）响应缓存
+        try:
+            parsed = json.loads(repair_json(strip_think_tags(content or "")))
+        except Exception:
+            return False
+        return isinstance(parsed, dict) and bool(parsed.get("title"))
 
     safe_text = sanitize_text_for_llm(text)
     prompt = f"""
@@ -105,7 +74,8 @@ async def task_extract_metadata(text):
             messages=[{"role": "user", "content": prompt}],
             response_format={"type": "json_object"},
             temperature=0.1,
-            validator=validate_json
+            validator=validate_json,
+            cache=cache
         )
         content = strip_think_tags(response.choices[0].message.content)
         parsed_json = json.loads(repair_json(content))
@@ -165,7 +135,8 @@ async def task_extract_metadata(text):
                     pool_name="metadata",
                     messages=[{"role": "user", "content": fallback_prompt}],
                     temperature=0.1,
-                    validator=validate_json
+                    validator=validate_json,
+                    cache=cache
                 )
                 content = strip_think_tags(response.choices[0].message.content)
                 parsed_json = json.loads(repair_json(content))
@@ -281,25 +252,205 @@ def _get_analysis_prompts(input_text: str) -> tuple[str, str]:
     return system_prompt, user_prompt
 
 
+def _looks_like_gateway_error(content: str) -> bool:
+    """是否为网关/上游错误页而非模型输出"""
+    bad_words = ["Bad Gateway", "upstream connect error", "Service Unavailable", "<html>"]
+    lowered = content.lower()
+    return any(w.lower() in lowered for w in bad_words)
+
+
 def _validate_analysis(content: str) -> bool:
     """验证分析内容是否有效"""
     if len(content) < 100:
         return False
-    bad_words = ["Bad Gateway", "upstream connect error", "Service Unavailable", "<html>"]
-    for w in bad_words:
-        if w.lower() in content.lower():
-            return False
-    return True
+    return not _looks_like_gateway_error(content)
+
+
+# ================= 长论文分析（分段提炼 + 汇总）=================
+
+# 常见模型的上下文窗口（token），按名称包含关系匹配，靠前的规则优先
+_MODEL_CONTEXT_TOKENS = (
+    ("gemini", 1_000_000),
+    ("gpt-4.1", 1_000_000),
+    ("gpt-5", 400_000),
+    ("claude", 200_000),
+    ("o1", 200_000),
+    ("o3", 200_000),
+    ("o4", 200_000),
+    ("gpt-4o", 128_000),
+    ("gpt-4-turbo", 128_000),
+    ("gpt-4", 8_000),
+    ("gpt-3.5", 16_000),
+    ("deepseek", 64_000),
+    ("qwen", 128_000),
+    ("glm-4", 128_000),
+    ("moonshot", 128_000),
+    ("kimi", 128_000),
+    ("llama", 128_000),
+)
+
+# 正文可占用的上下文比例（其余留给报告模板与输出）
+_CONTEXT_INPUT_RATIO = 0.6
+
+# 分段笔记仍超预算时的最大再汇总轮数
+_MAX_REDUCE_ROUNDS = 3
+
+
+def model_context_tokens(model: str) -> int:
+    """估算模型上下文窗口，未知模型使用 ANALYSIS_CONTEXT_TOKENS"""
+    name = (model or "").lower()
+    for pattern, tokens in _MODEL_CONTEXT_TOKENS:
+        if pattern in name:
+            return tokens
+    return settings.analysis_context_tokens
+
+
+def _analysis_input_budget() -> int:
+    """analysis 池正文 token 预算：按池内上下文最小的模型计算（故障转移可能落到任一模型）"""
+    models = {node["model"] for node in llm_manager.pools.get("analysis", ())}
+    window = min((model_context_tokens(m) for m in models), default=settings.analysis_context_tokens)
+    return int(window * _CONTEXT_INPUT_RATIO)
+
+
+def _get_chunk_prompts(chunk: TextChunk, total: int, note_chars: int) -> tuple[str, str]:
+    """单个分段的提炼 prompt"""
+    system_prompt = """
+    你是一位严谨的学术研究员，正在分段阅读一篇长论文，为最终的完整分析报告整理笔记。
+    只依据给定片段作答，不要编造片段中没有的信息；笔记使用中文，必要的术语可保留英文。
+    """
+    user_prompt = f"""
+    以下是论文的第 {chunk.index + 1}/{total} 个片段（章节：{chunk.section}）。
+    请提炼该片段的要点，按需覆盖：研究问题与动机、方法与关键公式（LaTeX）、实验设置与关键数字结果、作者结论、局限性。
+    使用 Markdown 列表输出，控制在 {note_chars} 字以内。
+
+    【片段内容】：
+    {chunk.text}
+    """
+    return system_prompt, user_prompt
+
+
+def _validate_chunk_note(content: str) -> bool:
+    """分段笔记质检：允许较短，但同样拦截网关错误页"""
+    return len(content.strip()) >= 20 and not _looks_like_gateway_error(content)
+
+
+async def _summarize_chunks(chunks: list[TextChunk], timeout_seconds: float, note_chars: int) -> list[str]:
+    """并发提炼各分段（并发数受 ANALYSIS_MAP_CONCURRENCY 限制），按原顺序返回笔记"""
+    semaphore = asyncio.Semaphore(max(1, settings.analysis_map_concurrency))
+
+    async def summarize(chunk: TextChunk) -> str:
+        system_prompt, user_prompt = _get_chunk_prompts(chunk, len(chunks), note_chars)
+        async with semaphore:
+            response = await asyncio.wait_for(
+                llm_manager.chat(
+                    pool_name="analysis",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    temperature=0.2,
+                    response_format={"type": "text"},
+                    validator=_validate_chunk_note,
+                ),
+                timeout=timeout_seconds,
+            )
+        logger.debug(f"分段 {chunk.index + 1}/{len(chunks)} 提炼完成")
+        return strip_think_tags(response.choices[0].message.content)
+
+    tasks = [asyncio.ensure_future(summarize(chunk)) for chunk in chunks]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        # 任一分段失败（或整体被取消）时取消其余分段，避免继续消耗配额
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _analyze_long_paper(full_text: str, budget: int, timeout_seconds: float, use_stream: bool) -> str:
+    """
+    长论文分析：章节感知分块 → 并发提炼分段笔记 → 笔记仍超预算时再汇总 → 按原模板生成最终报告
+    """
+    chunk_tokens = max(1000, min(settings.analysis_chunk_tokens, budget // 2))
+    chunks = chunk_text(full_text, chunk_tokens)
+    # 笔记总量控制在预算内：每段笔记的字数按分段数均分
+    note_chars = max(300, min(1500, budget // max(1, len(chunks))))
+    logger.info(f"长论文模式: {len(chunks)} 个分段，单段上限 {chunk_tokens} tokens，并发 {settings.analysis_map_concurrency}")
+
+    notes = await _summarize_chunks(chunks, timeout_seconds, note_chars)
+    labeled = [f"### 片段 {c.index + 1}：{c.section}\n{note}" for c, note in zip(chunks, notes)]
+    notes_text = "\n\n".join(labeled)
+
+    for round_index in range(_MAX_REDUCE_ROUNDS):
+        if estimate_text_tokens(notes_text) <= budget:
+            break
+        # 笔记仍过长：把笔记当作新的文本再提炼一轮
+        logger.info(f"分段笔记超出预算，进行第 {round_index + 1} 轮再汇总")
+        note_chunks = chunk_text(notes_text, chunk_tokens, skip_references=False)
+        notes = await _summarize_chunks(note_chunks, timeout_seconds, note_chars)
+        notes_text = "\n\n".join(f"### 笔记 {i + 1}\n{note}" for i, note in enumerate(notes))
+
+    synthesis_input = (
+        "【说明】原文过长，以下为按章节顺序整理的分段要点笔记，请基于这些笔记撰写完整报告。\n\n"
+        + notes_text
+    )
+    return await _run_analysis_prompt(synthesis_input, timeout_seconds, use_stream)
+
+
+async def _run_analysis_prompt(input_text: str, timeout_seconds: float, use_stream: bool) -> str:
+    """按报告模板调用 analysis 池生成最终报告"""
+    system_prompt, user_prompt = _get_analysis_prompts(input_text)
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+    if use_stream:
+        # 使用流式响应 - 更稳定，可以更早发现问题
+        logger.info("使用流式响应模式")
+        content = await asyncio.wait_for(
+            llm_manager.chat_stream(
+                pool_name="analysis",
+                messages=messages,
+                temperature=0.2,
+                response_format={"type": "text"}
+            ),
+            timeout=timeout_seconds
+        )
+        
+        # 验证内容
+        if not _validate_analysis(content):
+            raise ValueError(f"内容质检未通过: {content[:50]}...")
+        
+        logger.info("详细报告生成成功 (流式)")
+        return strip_think_tags(content)
+
+    # 使用普通响应
+    response = await asyncio.wait_for(
+        llm_manager.chat(
+            pool_name="analysis",
+            messages=messages,
+            temperature=0.2,
+            response_format={"type": "text"},
+            validator=_validate_analysis
+        ),
+        timeout=timeout_seconds
+    )
+    logger.info("详细报告生成成功")
+    return strip_think_tags(response.choices[0].message.content)
 
 
 async def task_analyze_paper(full_text, timeout_seconds: float = 300.0, use_stream: bool = False):
     """
     深度分析论文内容
     
+    正文估算 token 超出 analysis 池模型上下文预算时，自动切换为长论文模式（分段提炼 + 汇总）。
+    
     Args:
         full_text: 论文全文
-        timeout_seconds: 超时时间（秒），默认5分钟
-        use_stream: 是否使用流式响应，默认 False
+        timeout_seconds: 单次 LLM 请求的超时时间（秒），默认5分钟
+        use_stream: 是否使用流式响应（长论文模式下用于最终汇总），默认 False
     
     Returns:
         分析报告内容
@@ -310,47 +461,15 @@ async def task_analyze_paper(full_text, timeout_seconds: float = 300.0, use_stre
     """
     if not full_text: return "无内容"
     logger.info(f"请求深度分析 (Pool: Analysis, 超时: {timeout_seconds}秒, 流式: {use_stream})")
-    
-    system_prompt, user_prompt = _get_analysis_prompts(full_text)
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt}
-    ]
+
+    budget = _analysis_input_budget()
+    input_tokens = estimate_text_tokens(full_text)
 
     try:
-        if use_stream:
-            # 使用流式响应 - 更稳定，可以更早发现问题
-            logger.info("使用流式响应模式")
-            content = await asyncio.wait_for(
-                llm_manager.chat_stream(
-                    pool_name="analysis",
-                    messages=messages,
-                    temperature=0.2,
-                    response_format={"type": "text"}
-                ),
-                timeout=timeout_seconds
-            )
-            
-            # 验证内容
-            if not _validate_analysis(content):
-                raise ValueError(f"内容质检未通过: {content[:50]}...")
-            
-            logger.info("详细报告生成成功 (流式)")
-            return strip_think_tags(content)
-        else:
-            # 使用普通响应
-            response = await asyncio.wait_for(
-                llm_manager.chat(
-                    pool_name="analysis",
-                    messages=messages,
-                    temperature=0.2,
-                    response_format={"type": "text"},
-                    validator=_validate_analysis
-                ),
-                timeout=timeout_seconds
-            )
-            logger.info("详细报告生成成功")
-            return strip_think_tags(response.choices[0].message.content)
+        if input_tokens > budget:
+            logger.info(f"正文约 {input_tokens} tokens，超出上下文预算 {budget}，启用长论文模式")
+            return await _analyze_long_paper(full_text, budget, timeout_seconds, use_stream)
+        return await _run_analysis_prompt(full_text, timeout_seconds, use_stream)
             
     except asyncio.TimeoutError:
         logger.error(f"Analysis 任务超时 (超过 {timeout_seconds} 秒)")
@@ -359,56 +478,215 @@ async def task_analyze_paper(full_text, timeout_seconds: float = 300.0, use_stre
         logger.error(f"Analysis 任务失败: {e}")
         raise e
 
+# ================= 投机执行 =================
+
+# 投机分析计数：started=启动数，used=结果被采用，wasted=被丢弃（其中 wasted_duplicates 因查重命中）
+speculative_analysis_stats = {"started": 0, "used": 0, "wasted": 0, "wasted_duplicates": 0}
+
+
+class SpeculativeAnalysis:
+    """
+    与元数据提取并行启动的深度分析（SPECULATIVE_ANALYSIS=true 时生效）
+
+    用法：
+        async with SpeculativeAnalysis(full_text) as speculative:
+            metadata = ...; 查重 ...
+            analysis = await speculative.result()
+
+    在 result() 之前退出（查重命中、元数据失败、客户端断开）时取消分析并计入浪费次数。
+    未开启时 result() 退化为顺序调用 task_analyze_paper。
+    full_text 也可以是解析全文的 Task（全文与元数据提取并行解析，解析完成后分析才开始）。
+    """
+
+    def __init__(self, full_text, **analyze_kwargs):
+        self.full_text = full_text
+        self.analyze_kwargs = analyze_kwargs
+        self.task: asyncio.Task | None = None
+        self._consumed = False
+        self._duplicate = False
+
+    async def __aenter__(self):
+        if settings.speculative_analysis:
+            self.task = asyncio.create_task(self._analyze())
+            speculative_analysis_stats["started"] += 1
+            logger.info("投机执行：深度分析与元数据提取并行启动")
+        return self
+
+    async def _analyze(self) -> str:
+        full_text = self.full_text
+        if isinstance(full_text, asyncio.Future):
+            full_text = await full_text
+        return await task_analyze_paper(full_text, **self.analyze_kwargs)
+
+    def mark_duplicate(self) -> None:
+        """标记查重命中（不通过异常退出时使用）"""
+        self._duplicate = True
+
+    async def result(self) -> str:
+        """获取分析结果（未开启投机执行时在此处才开始分析）"""
+        self._consumed = True
+        if self.task is None:
+            return await self._analyze()
+        speculative_analysis_stats["used"] += 1
+        return await self.task
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.task is None or self._consumed:
+            return False
+        self.task.cancel()
+        try:
+            await self.task
+        except BaseException:
+            pass
+        speculative_analysis_stats["wasted"] += 1
+        if self._duplicate or exc_type is FileExistsError:
+            speculative_analysis_stats["wasted_duplicates"] += 1
+        logger.info(f"投机执行：已取消深度分析（{exc_type.__name__ if exc_type else '未采用'}）")
+        return False
+
+
+def find_semantic_duplicate(session: Session, title: str, owner_id: int = None) -> str | None:
+    """查找标题规范化后相同的已有论文（用户范围内），返回已有标题（走 owner_id + normalized_title 索引）"""
+    normalized_current = normalize_title(title)
+    if not normalized_current:
+        return None
+    query = session.query(Paper.title).filter(Paper.normalized_title == normalized_current)
+    if owner_id:
+        query = query.filter(Paper.owner_id == owner_id)
+    row = query.first()
+    return row[0] if row else None
+
+
+def find_near_duplicate(session: Session, signature: list[int] | None, owner_id: int = None) -> dict | None:
+    """近似查重（开头几页文本的 MinHash + LSH，用户范围内），返回最相似的已有论文"""
+    if not signature:
+        return None
+    matches = near_duplicate_index.find(session, signature, owner_id)
+    return matches[0] if matches else None
+
+
 # ================= 核心编排 =================
 
-async def process_workflow(pdf_path, file_md5=None, owner_id=None, file_info=None):
+async def process_workflow(pdf_path, file_md5=None, owner_id=None, file_info=None, on_stage=None,
+                           use_stream: bool = False):
     """
-    处理 PDF 文件的完整工作流
+    处理 PDF 文件的完整工作流：extract → metadata → dedup → analysis → persist
+    每个阶段完成后写入入库检查点（owner + MD5），重试或服务重启后从第一个未完成的阶段继续
     
     Args:
         pdf_path: PDF 文件路径
-        file_md5: 文件 MD5 哈希值
+        file_md5: 文件 MD5 哈希值（为空时不记录检查点）
         owner_id: 当前上传用户的 ID
         file_info: 文件存储信息（可选），包含 file_path, file_size, original_filename, uploaded_at
+        on_stage: 阶段回调（可选），实际执行 extract/metadata/dedup/analysis/persist 各阶段时以阶段名调用
+        use_stream: 深度分析是否使用流式响应
+
+    Returns:
+        新建论文的 ID
     """
-    # 1. 解析 PDF
-    workflow_logger.log_start(pdf_path)
-    head_text, full_text = extract_pdf_content(pdf_path)
-    if not head_text: raise ValueError("PDF解析为空")
-
-    # 2. 提取元数据 (Metadata)
-    workflow_logger.log_step(1, 4, "提取元数据以查重")
-    metadata = await task_extract_metadata(head_text)
-    
-    if not metadata or not metadata.get('title'):
-        raise ValueError("元数据提取失败，无法查重")
+    def report(stage: str):
+        if on_stage:
+            on_stage(stage)
+
+    checkpoint = ingest_checkpoints.load(owner_id, file_md5) or {}
+    completed = checkpoint.get("stage")
+    metadata = checkpoint.get("paper_metadata")
+    analysis = checkpoint.get("analysis")
+    if completed:
+        logger.info(f"从入库检查点恢复: 已完成 {completed}，继续 {next_stage(completed)}")
+
+    def save_checkpoint(stage: str, **fields):
+        nonlocal completed
+        ingest_checkpoints.save(owner_id, file_md5, stage, **fields)
+        completed = stage
+
+    async def load_full_text() -> str:
+        _, text = await extract_pdf_content_async(pdf_path, file_md5)
+        if not text: raise ValueError("PDF解析为空")
+        return text
 
-    # === 🛑 语义查重（用户范围内）===
-    current_title = metadata.get('title')
-    normalized_current = normalize_title(current_title)
-    
-    session = DBSession()
+    full_text_task = None
     try:
-        # 只查询当前用户的论文进行语义去重
-        if owner_id:
-            existing_papers = session.query(Paper.title).filter(Paper.owner_id == owner_id).all()
-        else:
-            existing_papers = session.query(Paper.title).all()
-        
-        for (db_title,) in existing_papers:
-            if normalize_title(db_title) == normalized_current:
-                workflow_logger.log_skip(pdf_path, f"语义重复: {current_title}")
-                raise FileExistsError(f"语义重复: {current_title}")
+        # 1. extract：只解析元数据与近似查重所需的开头几页（文本按 MD5 缓存，恢复时直接命中缓存）
+        report("extract")
+        workflow_logger.log_start(pdf_path)
+        head_text = await extract_pdf_head_async(pdf_path, file_md5)
+        if not head_text: raise ValueError("PDF解析为空")
+        signature = await near_duplicate_index.signature_async(head_text)
+
+        if not stage_reached(completed, "extract"):
+            # 近似查重：预印本/正式版等标题不同但开头几页高度相似的重复，在调用 LLM 之前拦截
+            if signature:
+                session = DBSession()
+                try:
+                    near = find_near_duplicate(session, signature, owner_id)
+                finally:
+                    session.close()
+                if near:
+                    workflow_logger.log_skip(pdf_path, f"近似重复: {near['title']}")
+                    raise FileExistsError(f"近似重复: {near['title']}（相似度 {near['similarity']:.0%}）")
+            save_checkpoint("extract")
+
+        # 全文只在深度分析需要时解析，与元数据提取并行进行
+        if not stage_reached(completed, "analysis"):
+            full_text_task = asyncio.create_task(load_full_text())
+
+        if not stage_reached(completed, "dedup"):
+            async with SpeculativeAnalysis(full_text_task, use_stream=use_stream) as speculative:
+                # 2. metadata：提取元数据
+                if not stage_reached(completed, "metadata"):
+                    report("metadata")
+                    workflow_logger.log_step(1, 4, "提取元数据以查重")
+                    metadata = await task_extract_metadata(head_text)
+                    
+                    if not metadata or not metadata.get('title'):
+                        raise ValueError("元数据提取失败，无法查重")
+                    save_checkpoint("metadata", paper_metadata=metadata)
+
+                # 3. dedup：语义查重（用户范围内）
+                report("dedup")
+                current_title = metadata.get('title')
+                
+                session = DBSession()
+                try:
+                    # 只查询当前用户的论文进行语义去重
+                    if find_semantic_duplicate(session, current_title, owner_id):
+                        workflow_logger.log_skip(pdf_path, f"语义重复: {current_title}")
+                        raise FileExistsError(f"语义重复: {current_title}")
+                finally:
+                    session.close()
+                save_checkpoint("dedup")
+
+                logger.info("通过查重，开始深度分析")
+                
+                # 4. analysis：深度分析（投机执行时已与元数据提取并行启动）
+                report("analysis")
+                workflow_logger.log_step(2, 4, "深度分析")
+                analysis = await speculative.result()
+                save_checkpoint("analysis", analysis=analysis)
+
+        elif not stage_reached(completed, "analysis"):
+            report("analysis")
+            workflow_logger.log_step(2, 4, "深度分析")
+            analysis = await task_analyze_paper(await full_text_task, use_stream=use_stream)
+            save_checkpoint("analysis", analysis=analysis)
+
+    except FileExistsError:
+        # 重复文件不会再入库，丢弃检查点
+        ingest_checkpoints.clear(owner_id, file_md5)
+        raise
+    except Exception as e:
+        ingest_checkpoints.record_error(owner_id, file_md5, str(e)[:500])
+        raise
     finally:
-        session.close()
-
-    logger.info("通过查重，开始深度分析")
-    
-    # 3. 深度分析 (Analysis)
-    workflow_logger.log_step(2, 4, "深度分析")
-    analysis = await task_analyze_paper(full_text)
-
-    # 4. 入库 (关联 Owner 和文件信息)
+        if full_text_task is not None:
+            if not full_text_task.done():
+                full_text_task.cancel()
+            elif not full_text_task.cancelled():
+                full_text_task.exception()  # 已由分析处理，避免未读取异常的告警
+
+    # 5. persist：入库（关联 Owner 和文件信息），与删除检查点同一事务
+    report("persist")
     workflow_logger.log_step(3, 4, "写入数据库")
     session = DBSession()
     try:
@@ -430,15 +708,25 @@ async def process_workflow(pdf_path, file_md5=None, owner_id=None, file_info=Non
             uploaded_at=file_info.get('uploaded_at') if file_info else None
         )
         session.add(new_paper)
+        session.flush()
+        near_duplicate_index.add(session, new_paper.id, owner_id, signature)
+        ingest_checkpoints.clear(owner_id, file_md5, session=session)
         session.commit()
         workflow_logger.log_complete(pdf_path, metadata.get('title', ''))
+        paper_id = new_paper.id
         
     except Exception as e:
         session.rollback()
+        ingest_checkpoints.record_error(owner_id, file_md5, str(e)[:500])
         raise e
     finally:
         session.close()
 
+    # 问答检索索引（失败不影响入库；本次未解析全文时由问答按需重建）
+    if full_text_task is not None:
+        await paper_retrieval_store.build_async(file_md5, full_text_task.result())
+    return paper_id
+
 
 async def reanalyze_paper(paper_id: int, owner_id: int = None):
     """
@@ -478,23 +766,35 @@ async def reanalyze_paper(paper_id: int, owner_id: int = None):
         if not file_path or not os.path.exists(file_path):
             raise FileNotFoundError("PDF 文件不存在，无法重新分析")
         
-        # 重新提取 PDF 内容
         logger.info(f"开始重新分析论文: {paper.title}")
-        head_text, full_text = extract_pdf_content(file_path)
-        
-        if not full_text:
-            raise ValueError("PDF 内容提取失败")
+
+        # 入库未完成的论文（失败占位）：复用检查点中已完成阶段的结果
+        checkpoint = ingest_checkpoints.load(paper.owner_id, paper.md5_hash) or {}
+        metadata = checkpoint.get("paper_metadata")
+        analysis = checkpoint.get("analysis")
+        if checkpoint:
+            logger.info(f"重新分析：从入库检查点恢复，已完成 {checkpoint.get('stage')}")
+
+        # 重新提取 PDF 内容：需要深度分析时解析全文，否则只读开头几页
+        if analysis:
+            head_text, full_text = await extract_pdf_head_async(file_path, paper.md5_hash), None
+        else:
+            head_text, full_text = await extract_pdf_content_async(file_path, paper.md5_hash)
+            if not full_text:
+                raise ValueError("PDF 内容提取失败")
 
         # 尝试重新提取元数据（可选，失败不影响继续生成分析）
-        metadata = None
-        try:
-            if head_text:
-                metadata = await task_extract_metadata(head_text)
-        except Exception as meta_error:
-            logger.warning(f"重新分析：元数据提取失败，跳过更新元数据: {meta_error}")
+        if not metadata:
+            try:
+                if head_text:
+                    # 重新分析意在重新生成，不复用缓存的元数据响应
+                    metadata = await task_extract_metadata(head_text, cache=False)
+            except Exception as meta_error:
+                logger.warning(f"重新分析：元数据提取失败，跳过更新元数据: {meta_error}")
         
         # 重新进行深度分析
-        analysis = await task_analyze_paper(full_text)
+        if not analysis:
+            analysis = await task_analyze_paper(full_text)
         
         # 更新数据库
         paper.detailed_analysis = analysis
@@ -506,7 +806,12 @@ async def reanalyze_paper(paper_id: int, owner_id: int = None):
             paper.authors = metadata.get("authors")
             paper.abstract_en = metadata.get("abstract_en")
             paper.abstract = metadata.get("abstract")
+        near_duplicate_index.add(
+            session, paper.id, paper.owner_id, await near_duplicate_index.signature_async(head_text)
+        )
+        ingest_checkpoints.clear(paper.owner_id, paper.md5_hash, session=session)
         session.commit()
+        await paper_retrieval_store.build_async(paper.md5_hash, full_text)
         
         logger.info(f"论文重新分析完成: {paper.title}")
         return analysis
@@ -0,0 +1,235 @@
+"""
+论文问答检索 - 每篇论文一份离线 BM25 片段索引
+全文按章节分块后建立倒排表（词 → [(片段, 词频)]），入库时构建一次，按文件 MD5 存为 gzip 压缩产物。
+问答时只把与问题最相关的 top-k 片段放入提示词：提示词保持小体积，回答仍能引用正文细节。
+分词不依赖外部模型：英文按单词（去停用词）、中文按相邻两字，中文问题中的英文术语/缩写同样可以命中英文正文。
+"""
+import asyncio
+import gzip
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+from backend.services.paper_chunking import chunk_text
+from backend.services.pdf_parser import extract_pdf_content_async
+from backend.services.text_cache import text_artifact_store, write_artifact
+
+logger = get_logger("paper_retrieval")
+
+# 分块或分词规则变化时递增，使旧索引失效
+RETRIEVAL_INDEX_VERSION = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 内存中保留的已加载索引数（同一篇论文的连续多轮问答无需重复解压）
+MEMORY_ENTRIES = 32
+
+_MD5_RE = re.compile(r"^[a-f0-9]{32}$")
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9\-]*[a-z0-9]|[a-z0-9]|[\u4e00-\u9fff]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how in into is it its of on or our "
+    "that the their there these this those to was we were what when which who why will with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """英文单词（去停用词）+ 中文相邻两字"""
+    tokens = []
+    for word in _WORD_RE.findall((text or "").lower()):
+        if "\u4e00" <= word[0] <= "\u9fff":
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        elif word not in _STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+
+def build_index(md5_hash: str, full_text: str, chunk_tokens: int) -> dict:
+    """分块并建立倒排表"""
+    chunks = chunk_text(full_text or "", chunk_tokens)
+    postings: dict[str, list[int]] = {}
+    lengths = []
+    for chunk in chunks:
+        terms = Counter(tokenize(chunk.text))
+        lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            # 扁平存储 [片段序号, 词频, 片段序号, 词频, ...]，压缩后体积更小
+            postings.setdefault(term, []).extend((chunk.index, tf))
+    return {
+        "version": RETRIEVAL_INDEX_VERSION,
+        "md5": md5_hash,
+        "chunk_tokens": chunk_tokens,
+        "chunks": [{"section": chunk.section, "text": chunk.text} for chunk in chunks],
+        "lengths": lengths,
+        "postings": postings,
+        "created_at": datetime.now().isoformat(),
+    }
+
+
+def search_index(index: dict, query: str, top_k: int) -> list[dict]:
+    """BM25 打分，返回得分大于 0 的前 top_k 个片段 [{index, section, text, score}]（按原文顺序）"""
+    chunks = index.get("chunks") or []
+    lengths = index.get("lengths") or []
+    postings = index.get("postings") or {}
+    if not chunks or top_k <= 0:
+        return []
+    total = len(chunks)
+    avg_length = (sum(lengths) / total) or 1.0
+
+    scores: dict[int, float] = {}
+    for term in set(tokenize(query)):
+        flat = postings.get(term)
+        if not flat:
+            continue
+        df = len(flat) // 2
+        idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for position in range(0, len(flat), 2):
+            chunk_index, tf = flat[position], flat[position + 1]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[chunk_index] / avg_length)
+            scores[chunk_index] = scores.get(chunk_index, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [
+        {
+            "index": chunk_index,
+            "section": chunks[chunk_index]["section"],
+            "text": chunks[chunk_index]["text"],
+            "score": round(score, 3),
+        }
+        for chunk_index, score in sorted(best)
+    ]
+
+
+class PaperRetrievalStore:
+    """检索索引存储：<存储根>/retrieval_index/<md5 前两位>/<md5>.json.gz"""
+
+    def __init__(self, root: str = None, chunk_tokens: int = None):
+        self.root = root or os.path.join(settings.file_storage_path, "retrieval_index")
+        self.chunk_tokens = chunk_tokens or settings.paper_chat_chunk_tokens
+        self._memory: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"builds": 0, "hits": 0, "misses": 0, "searches": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def path_for(self, md5_hash: str) -> Optional[str]:
+        if not md5_hash or not _MD5_RE.match(md5_hash):
+            return None
+        return os.path.join(self.root, md5_hash[:2], f"{md5_hash}.json.gz")
+
+    def _remember(self, md5_hash: str, index: dict) -> None:
+        with self._lock:
+            self._memory[md5_hash] = index
+            self._memory.move_to_end(md5_hash)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def load(self, md5_hash: str) -> Optional[dict]:
+        """读取有效索引；不存在、损坏或版本/分块大小不一致时返回 None"""
+        with self._lock:
+            index = self._memory.get(md5_hash)
+            if index is not None:
+                self._memory.move_to_end(md5_hash)
+        if index is None:
+            path = self.path_for(md5_hash)
+            if not path:
+                return None
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                index = None
+            except Exception as e:
+                logger.warning(f"⚠️ 检索索引损坏，忽略: {path} ({e})")
+                index = None
+            if index is not None:
+                self._remember(md5_hash, index)
+        if (
+            index is None
+            or index.get("version") != RETRIEVAL_INDEX_VERSION
+            or index.get("chunk_tokens") != self.chunk_tokens
+        ):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return index
+
+    def build(self, md5_hash: str, full_text: str) -> Optional[dict]:
+        """为全文建立索引并落盘（CPU 密集，调用方应放在线程中执行）"""
+        path = self.path_for(md5_hash)
+        if not path or not full_text:
+            return None
+        index = build_index(md5_hash, full_text, self.chunk_tokens)
+        try:
+            write_artifact(path, index)
+        except OSError as e:
+            logger.warning(f"⚠️ 检索索引写入失败: {e}")
+        self._remember(md5_hash, index)
+        self._count("builds")
+        return index
+
+    async def build_async(self, md5_hash: Optional[str], full_text: Optional[str]) -> None:
+        """入库/重新分析时构建索引；失败只记录日志，不影响入库"""
+        if not md5_hash or not full_text:
+            return
+        try:
+            await asyncio.to_thread(self.build, md5_hash, full_text)
+        except Exception as e:
+            logger.warning(f"⚠️ 检索索引构建失败: {md5_hash} ({e})")
+
+    async def search(self, md5_hash: Optional[str], pdf_path: Optional[str], query: str,
+                     top_k: int = None) -> list[dict]:
+        """
+        检索与问题最相关的片段；索引缺失时（旧论文）依次从提取文本缓存、PDF 文件重建
+        """
+        top_k = settings.paper_chat_top_k if top_k is None else top_k
+        if not md5_hash or top_k <= 0:
+            return []
+        index = self.load(md5_hash)
+        if index is None:
+            full_text = None
+            cached = text_artifact_store.load_text(md5_hash, settings.pdf_full_text_max_chars)
+            if cached:
+                full_text = cached[1]
+            elif pdf_path and os.path.exists(pdf_path):
+                _, full_text = await extract_pdf_content_async(pdf_path, md5_hash)
+            if not full_text:
+                return []
+            index = await asyncio.to_thread(self.build, md5_hash, full_text)
+            if index is None:
+                return []
+        self._count("searches")
+        return search_index(index, query, top_k)
+
+    def delete(self, md5_hash: str) -> bool:
+        with self._lock:
+            self._memory.pop(md5_hash, None)
+        path = self.path_for(md5_hash)
+        if not path:
+            return False
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        stats["index_version"] = RETRIEVAL_INDEX_VERSION
+        return stats
+
+
+# 全局实例
+paper_retrieval_store = PaperRetrievalStore()
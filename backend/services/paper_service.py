@@ -8,6 +8,8 @@ from typing import Optional
 
 from backend.core.db_models import Paper, User, Group, PaperStar, ReadingHistory
 from backend.core.file_service import file_service
+from backend.services.paper_retrieval import paper_retrieval_store
+from backend.services.text_cache import text_artifact_store
 
 
 class PaperService:
@@ -136,6 +138,15 @@ class PaperService:
         if paper.translated_dual_path:
             file_service.delete_file_by_absolute_path(paper.translated_dual_path)
 
+        # 提取文本缓存与检索索引按 MD5 共享：最后一篇使用该 MD5 的论文删除时一并清理
+        if paper.md5_hash and not (
+            self.db.query(Paper.id)
+            .filter(Paper.md5_hash == paper.md5_hash, Paper.id != paper.id)
+            .first()
+        ):
+            text_artifact_store.delete(paper.md5_hash)
+            paper_retrieval_store.delete(paper.md5_hash)
+
     def update_groups(self, paper: Paper, group_names: list[str]) -> list[Group]:
         """更新论文分组"""
         groups = self.db.query(Group).filter(Group.name.in_(group_names)).all()
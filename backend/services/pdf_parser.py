@@ -0,0 +1,330 @@
+"""
+PDF 文本提取 - PyMuPDF 解析放到独立进程池中执行
+fitz 的 get_text 是纯 CPU 的同步调用，大文档可能占用数秒，直接在协程里执行会阻塞整个事件循环。
+这里的工作函数只依赖 fitz，可在 spawn 出的子进程中导入而不牵连数据库与 LLM 池。
+"""
+import asyncio
+import faulthandler
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+from backend.services.text_cache import build_payload, text_artifact_store, write_artifact
+
+logger = get_logger("main")
+
+# 元数据提取只需要前几页（标题/作者/摘要通常都在首页），避免输入过长或包含无关内容
+HEAD_PAGES = 2
+HEAD_MAX_CHARS = 8000
+# 少于该字符数视为扫描件（无文字层）
+MIN_TEXT_CHARS = 100
+# 单页解析卡死（无法在页间检查超时）时，超时后再等待该秒数由看门狗强制结束工作进程
+WORKER_KILL_GRACE_SECONDS = 30.0
+
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def sanitize_text_for_llm(text: str) -> str:
+    """移除控制字符，降低上游接口误拦截概率"""
+    if not text:
+        return ""
+    return _CONTROL_CHARS_RE.sub("", text)
+
+
+class PDFTooLargeError(ValueError):
+    """PDF 页数超出上限"""
+
+
+class PDFParseTimeoutError(ValueError):
+    """单个文档解析超时"""
+
+
+class TextBuilder:
+    """有界文本拼接：O(1) 维护累计长度，达到字符上限后截断并拒绝后续内容"""
+
+    def __init__(self, max_chars: int = 0):
+        self.max_chars = max_chars
+        self._parts: list[str] = []
+        self.length = 0
+        self.truncated = False
+
+    @property
+    def full(self) -> bool:
+        return bool(self.max_chars) and self.length >= self.max_chars
+
+    def append(self, text: str) -> bool:
+        """追加文本，返回是否还能继续接收"""
+        if self.full:
+            self.truncated = self.truncated or bool(text)
+            return False
+        if self.max_chars and self.length + len(text) > self.max_chars:
+            text = text[:self.max_chars - self.length]
+            self.truncated = True
+        self._parts.append(text)
+        self.length += len(text)
+        return not self.full
+
+    def getvalue(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def parts(self) -> list[str]:
+        return list(self._parts)
+
+
+def iter_pdf_pages(doc, max_pages: int = 0):
+    """
+    逐页惰性产出 (页码, 已清洗文本)，调用方可随时停止迭代，未读取的页不会被解码
+    页数超出 max_pages 时在读取任何文本前抛出 PDFTooLargeError
+    """
+    page_count = doc.page_count
+    if max_pages and page_count > max_pages:
+        raise PDFTooLargeError(f"PDF 页数 {page_count} 超过上限 {max_pages}")
+    for page_index in range(page_count):
+        yield page_index, sanitize_text_for_llm(doc.load_page(page_index).get_text())
+
+
+def _parse_pdf(file_path: str, max_pages: int = 0, max_chars: int = 0, head_only: bool = False,
+               md5_hash: str = None, cache_path: str = None, timeout_seconds: float = 0) -> tuple:
+    """
+    解析 PDF 文本，返回 (head_text, full_text, 已读取页数)
+    - head_only: 仅读取元数据所需的开头几页，达到字符预算即停止；
+      开头几页没有文字层（图片封面、扫描标题页、空白页）时继续用后续页面补足开头文本
+    - max_chars: 全文字符上限（0 不限制），达到上限后不再解码后续页面
+    - cache_path: 提供时把逐页文本写入提取文本缓存（仅全文解析）
+    - timeout_seconds: 从开始解析计时（不含排队时间），每读完一页检查一次，超时抛出 PDFParseTimeoutError
+    扫描件返回 (None, None, 已读取页数)；页数超限抛出 PDFTooLargeError
+    """
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+    head = TextBuilder(HEAD_MAX_CHARS)
+    full = None if head_only else TextBuilder(max_chars)
+    pages_read = 0
+    extend_head = False
+
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+        for page_index, page_text in iter_pdf_pages(doc, max_pages):
+            pages_read += 1
+            if deadline is not None and time.monotonic() > deadline:
+                raise PDFParseTimeoutError(f"PDF 解析超时（超过 {timeout_seconds:.0f} 秒）")
+            if page_index == HEAD_PAGES and head.length < MIN_TEXT_CHARS:
+                # 开头几页几乎没有文字：后续页面继续写入开头文本，直到字符预算用完
+                extend_head = True
+            if (page_index < HEAD_PAGES or extend_head) and not head.full:
+                head.append(page_text)
+            if full is None:
+                if head.full or (page_index + 1 >= HEAD_PAGES and not extend_head
+                                 and head.length >= MIN_TEXT_CHARS):
+                    break
+            elif not full.append(page_text):
+                break
+
+    head_text = head.getvalue()
+    # 扫描件判断以全文为准；只读开头时，文字不足意味着已读到文档末尾仍没有足够文字
+    full_text = full.getvalue() if full is not None else head_text
+    if len(full_text) < MIN_TEXT_CHARS:
+        return None, None, pages_read
+    if cache_path and full is not None:
+        try:
+            write_artifact(cache_path, build_payload(md5_hash, head_text, full.parts, page_count, max_chars))
+        except OSError:
+            pass  # 缓存写入失败不影响本次解析结果
+    return head_text, (None if head_only else full_text), pages_read
+
+
+def _parse_in_worker(file_path: str, max_pages: int, max_chars: int, head_only: bool,
+                     md5_hash: str = None, cache_path: str = None, timeout_seconds: float = 0,
+                     watchdog: bool = False) -> tuple:
+    """
+    进程池工作函数：返回解析结果与纯解析耗时（不含排队时间）
+    watchdog: 在独立工作进程中运行时，单页卡死超过超时 + 宽限期后由 faulthandler 强制结束本进程
+    （看门狗线程不依赖 GIL，卡在 MuPDF 的 C 代码中也能生效；线程池模式下不能启用）
+    """
+    if watchdog and timeout_seconds:
+        faulthandler.dump_traceback_later(timeout_seconds + WORKER_KILL_GRACE_SECONDS, exit=True)
+    started = time.perf_counter()
+    try:
+        result = _parse_pdf(file_path, max_pages, max_chars, head_only, md5_hash, cache_path, timeout_seconds)
+    finally:
+        if watchdog and timeout_seconds:
+            faulthandler.cancel_dump_traceback_later()
+    return result, time.perf_counter() - started
+
+
+def extract_pdf_content(file_path):
+    """同步解析 PDF，返回 (head_text, full_text)；失败或扫描件返回 (None, None)"""
+    logger.debug(f"正在读取 PDF: {file_path}")
+    try:
+        head_text, full_text, _ = _parse_pdf(file_path, settings.pdf_max_pages, settings.pdf_full_text_max_chars)
+    except Exception as e:
+        logger.error(f"PDF 读取失败: {e}")
+        return None, None
+    if not full_text:
+        logger.warning("提取内容过少，可能是扫描件")
+        return None, None
+    return head_text, full_text
+
+
+class PDFParsePool:
+    """
+    PDF 解析进程池
+    - 进程池懒创建，使用 spawn 启动方式（避免 fork 带着事件循环与线程状态进入子进程）
+    - 超时由工作函数从开始解析时计时、逐页检查，排队等待空闲进程的文档不会因前面的文档而超时
+    - 单页卡死时工作进程由看门狗强制退出，进程池失效后重建，受牵连的在途任务自动重试一次
+    - workers=0 时退化为默认线程池执行（同样逐页检查超时，但单页卡死无法终止）
+    """
+
+    def __init__(self, workers: int = None, timeout_seconds: float = None, max_pages: int = None,
+                 max_chars: int = None):
+        self.workers = settings.pdf_parse_workers if workers is None else workers
+        self.timeout_seconds = settings.pdf_parse_timeout_seconds if timeout_seconds is None else timeout_seconds
+        self.max_pages = settings.pdf_max_pages if max_pages is None else max_pages
+        self.max_chars = settings.pdf_full_text_max_chars if max_chars is None else max_chars
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.counters = {
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "pool_restarts": 0,
+            "cache_hits": 0,
+            "pages": 0,
+            "total_parse_seconds": 0.0,
+            "max_parse_seconds": 0.0,
+            "total_wait_seconds": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor | None:
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _recycle(self, executor: ProcessPoolExecutor | None) -> None:
+        """丢弃已失效的进程池，下次解析时重建"""
+        if executor is None:
+            return
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.counters["pool_restarts"] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, parse_seconds: float, wait_seconds: float, pages: int) -> None:
+        self.counters["completed"] += 1
+        self.counters["pages"] += pages
+        self.counters["total_parse_seconds"] += parse_seconds
+        self.counters["max_parse_seconds"] = max(self.counters["max_parse_seconds"], parse_seconds)
+        self.counters["total_wait_seconds"] += max(0.0, wait_seconds)
+
+    async def _run_once(self, file_path: str, head_only: bool, md5_hash: str = None) -> tuple:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        cache_path = text_artifact_store.path_for(md5_hash) if md5_hash and not head_only else None
+        try:
+            return await loop.run_in_executor(
+                executor, _parse_in_worker, file_path, self.max_pages, self.max_chars, head_only,
+                md5_hash, cache_path, self.timeout_seconds, executor is not None,
+            )
+        except PDFParseTimeoutError:
+            self.counters["timeouts"] += 1
+            raise
+        except BrokenProcessPool:
+            self._recycle(executor)
+            raise
+
+    async def extract(self, file_path: str, head_only: bool = False, md5_hash: str = None) -> tuple:
+        """
+        在进程池中解析 PDF，返回 (head_text, full_text)；head_only 时只读开头几页，full_text 为 None
+        提供 md5_hash 时优先读取提取文本缓存，未命中则解析并写入缓存
+        扫描件/损坏文件返回 (None, None)；页数超限或解析超时抛出 ValueError
+        """
+        if md5_hash:
+            cached = await asyncio.to_thread(text_artifact_store.load_text, md5_hash, self.max_chars)
+            if cached is not None:
+                self.counters["cache_hits"] += 1
+                logger.debug(f"命中提取文本缓存: {md5_hash}")
+                head_text, full_text = cached
+                return head_text, (None if head_only else full_text)
+
+        logger.debug(f"正在读取 PDF: {file_path}")
+        started = time.perf_counter()
+        self.in_flight += 1
+        try:
+            try:
+                result, parse_seconds = await self._run_once(file_path, head_only, md5_hash)
+            except BrokenProcessPool:
+                # 工作进程异常退出（如看门狗终止了卡死的解析）：重建后重试一次
+                logger.warning("⚠️ PDF 解析进程池已失效，重建后重试")
+                result, parse_seconds = await self._run_once(file_path, head_only, md5_hash)
+        except PDFTooLargeError as e:
+            self.counters["rejected"] += 1
+            logger.warning(f"⚠️ 拒绝解析: {e}")
+            raise
+        except PDFParseTimeoutError as e:
+            self.counters["failed"] += 1
+            logger.error(f"❌ {e}: {file_path}")
+            raise
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.error(f"PDF 读取失败: {e}")
+            return None, None
+        finally:
+            self.in_flight -= 1
+
+        head_text, full_text, page_count = result
+        self._record(parse_seconds, time.perf_counter() - started - parse_seconds, page_count)
+        if not head_text:
+            logger.warning("提取内容过少，可能是扫描件")
+            return None, None
+        return head_text, full_text
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        completed = stats["completed"]
+        stats["workers"] = self.workers
+        stats["in_flight"] = self.in_flight
+        # 超出工作进程数的在途请求即为排队中的文档
+        stats["queue_depth"] = max(0, self.in_flight - max(self.workers, 1))
+        stats["avg_parse_seconds"] = round(stats["total_parse_seconds"] / completed, 3) if completed else 0.0
+        stats["avg_wait_seconds"] = round(stats["total_wait_seconds"] / completed, 3) if completed else 0.0
+        stats["total_parse_seconds"] = round(stats["total_parse_seconds"], 3)
+        stats["max_parse_seconds"] = round(stats["max_parse_seconds"], 3)
+        stats["total_wait_seconds"] = round(stats["total_wait_seconds"], 3)
+        return stats
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局实例
+pdf_parse_pool = PDFParsePool()
+
+
+async def extract_pdf_content_async(file_path, md5_hash: str = None) -> tuple:
+    """异步解析 PDF（进程池执行，不阻塞事件循环），返回 (head_text, full_text)；提供 MD5 时读写提取文本缓存"""
+    return await pdf_parse_pool.extract(file_path, md5_hash=md5_hash)
+
+
+async def extract_pdf_head_async(file_path, md5_hash: str = None) -> str | None:
+    """只解析元数据所需的开头几页（达到字符预算即停止），扫描件返回 None"""
+    head_text, _ = await pdf_parse_pool.extract(file_path, head_only=True, md5_hash=md5_hash)
+    return head_text
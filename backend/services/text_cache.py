@@ -0,0 +1,142 @@
+"""
+PDF 提取文本缓存 - 按文件 MD5 寻址的 gzip 压缩文本产物
+入库时由解析进程顺手写入一次，重新分析、失败重传等场景直接读取，无需再次调用 PyMuPDF。
+产物记录提取器版本与全文字符上限，任一不一致即视为过期并重新解析。
+仅依赖标准库与配置，可在 PDF 解析子进程中导入。
+"""
+import gzip
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Optional
+
+from backend.core.log_service import get_logger
+from backend.core.settings import settings
+
+logger = get_logger("text_cache")
+
+# 解析逻辑（分页、清洗、开头页规则）变化时递增，使旧产物全部失效
+EXTRACTOR_VERSION = 1
+
+_MD5_RE = re.compile(r"^[a-f0-9]{32}$")
+
+
+def write_artifact(path: str, payload: dict) -> None:
+    """原子写入压缩产物（先写临时文件再 rename，避免读到半截文件）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_payload(md5_hash: str, head_text: str, pages: list[str], page_count: int, max_chars: int) -> dict:
+    return {
+        "version": EXTRACTOR_VERSION,
+        "md5": md5_hash,
+        "max_chars": max_chars,
+        "page_count": page_count,
+        "head_text": head_text,
+        "pages": pages,
+        "created_at": datetime.now().isoformat(),
+    }
+
+
+class TextArtifactStore:
+    """提取文本产物存储：<存储根>/text_cache/<md5 前两位>/<md5>.json.gz"""
+
+    def __init__(self, root: str = None):
+        self.root = root or os.path.join(settings.file_storage_path, "text_cache")
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "writes": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def path_for(self, md5_hash: str) -> Optional[str]:
+        if not md5_hash or not _MD5_RE.match(md5_hash):
+            return None
+        return os.path.join(self.root, md5_hash[:2], f"{md5_hash}.json.gz")
+
+    def exists(self, md5_hash: str) -> bool:
+        path = self.path_for(md5_hash)
+        return bool(path) and os.path.exists(path)
+
+    def _read(self, path: str) -> Optional[dict]:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ 提取文本缓存损坏，忽略: {path} ({e})")
+            return None
+
+    def load(self, md5_hash: str, max_chars: int = 0) -> Optional[dict]:
+        """读取有效产物；不存在、损坏或版本/字符上限不一致时返回 None（过期产物会被删除）"""
+        path = self.path_for(md5_hash)
+        if not path:
+            return None
+        payload = self._read(path)
+        if payload is None:
+            self._count("misses")
+            return None
+        if payload.get("version") != EXTRACTOR_VERSION or payload.get("max_chars", 0) != max_chars:
+            self._count("stale")
+            self.delete(md5_hash)
+            return None
+        self._count("hits")
+        return payload
+
+    def load_text(self, md5_hash: str, max_chars: int = 0) -> Optional[tuple[str, str]]:
+        """读取 (head_text, full_text)"""
+        payload = self.load(md5_hash, max_chars)
+        if payload is None:
+            return None
+        return payload.get("head_text") or "", "".join(payload.get("pages") or [])
+
+    def save(self, md5_hash: str, head_text: str, pages: list[str], page_count: int, max_chars: int = 0) -> bool:
+        path = self.path_for(md5_hash)
+        if not path:
+            return False
+        try:
+            write_artifact(path, build_payload(md5_hash, head_text, pages, page_count, max_chars))
+        except OSError as e:
+            logger.warning(f"⚠️ 提取文本缓存写入失败: {e}")
+            return False
+        self._count("writes")
+        return True
+
+    def delete(self, md5_hash: str) -> bool:
+        path = self.path_for(md5_hash)
+        if not path:
+            return False
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_md5(self):
+        """遍历已存储产物的 MD5"""
+        if not os.path.isdir(self.root):
+            return
+        for _, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith(".json.gz"):
+                    yield filename[:-len(".json.gz")]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"] + stats["stale"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["extractor_version"] = EXTRACTOR_VERSION
+        return stats
+
+
+# 全局实例
+text_artifact_store = TextArtifactStore()
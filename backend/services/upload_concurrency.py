@@ -0,0 +1,79 @@
+"""
+流式上传并发控制 - 同一请求内的多个文件并行处理
+每个文件依次占用「用户槽位」与「全局槽位」：
+  - 用户槽位限制单个用户（跨请求）同时处理的文件数，避免一次拖入几十个文件占满 LLM 池
+  - 全局槽位限制全站同时处理的文件数
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from backend.core.db_models import User
+from backend.core.settings import settings
+
+
+def get_user_upload_concurrency(user: User) -> int:
+    """用户的流式上传并发数（用户覆盖值优先，至少为 1）"""
+    if user.upload_concurrency is not None:
+        return max(1, int(user.upload_concurrency))
+    return max(1, settings.upload_stream_user_concurrency)
+
+
+class UploadConcurrencyLimiter:
+    """按用户 + 全局两级信号量限制文件处理并发"""
+
+    def __init__(self, max_concurrent: int = None):
+        self.max_concurrent = max(1, max_concurrent or settings.upload_stream_max_concurrent)
+        self._global: Optional[asyncio.Semaphore] = None
+        self._users: dict[int, tuple[int, asyncio.Semaphore]] = {}
+        self._lock = threading.Lock()
+        self.counters = {"started": 0, "completed": 0, "in_flight": 0, "waiting": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _user_semaphore(self, user_id: int, limit: int) -> asyncio.Semaphore:
+        entry = self._users.get(user_id)
+        # 管理员修改并发数后按新值重建；旧信号量由仍在运行的任务自然释放
+        if entry is None or entry[0] != limit:
+            entry = (limit, asyncio.Semaphore(limit))
+            self._users[user_id] = entry
+        return entry[1]
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, user_limit: int):
+        """占用一个处理槽位（先用户后全局，避免单个用户的排队任务占住全局槽位）"""
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrent)
+        user_semaphore = self._user_semaphore(user_id, max(1, user_limit))
+        self._count("waiting")
+        acquired = False
+        try:
+            async with user_semaphore:
+                async with self._global:
+                    acquired = True
+                    self._count("waiting", -1)
+                    self._count("in_flight")
+                    self._count("started")
+                    try:
+                        yield
+                    finally:
+                        self._count("in_flight", -1)
+                        self._count("completed")
+        finally:
+            # 排队期间被取消（客户端断开）时补回等待计数
+            if not acquired:
+                self._count("waiting", -1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        stats["max_concurrent"] = self.max_concurrent
+        stats["default_user_concurrency"] = settings.upload_stream_user_concurrency
+        return stats
+
+
+# 全局实例
+upload_concurrency_limiter = UploadConcurrencyLimiter()
@@ -163,7 +163,8 @@ function PapersContent() {
         setUploadProgress(null);
         setUploadLogs([]);
 
-        let lastSuccessIndex = -1;
+        // 多个文件并行处理，成功事件可能乱序到达
+        const succeededIndexes = new Set<number>();
 
         try {
             await uploadPapersWithProgress(Array.from(files), async (progress) => {
@@ -173,8 +174,8 @@ function PapersContent() {
                     ...progress
                 }]);
 
-                if (progress.status === 'success' && progress.fileIndex !== undefined && progress.fileIndex > lastSuccessIndex) {
-                    lastSuccessIndex = progress.fileIndex;
+                if (progress.status === 'success' && progress.fileIndex !== undefined && !succeededIndexes.has(progress.fileIndex)) {
+                    succeededIndexes.add(progress.fileIndex);
                     await loadData();
                 }
             });
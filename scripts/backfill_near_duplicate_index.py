@@ -0,0 +1,69 @@
+"""
+回填近似查重索引脚本：为尚未建立 MinHash 签名的论文计算签名并写入 LSH 桶表
+优先读取提取文本缓存，缺失时只解析 PDF 开头几页
+"""
+import argparse
+import os
+
+from backend.core.db_models import Session, Paper, PaperMinHash
+from backend.core.file_service import file_service
+from backend.core.settings import settings
+from backend.services.near_duplicate import minhash_signature, near_duplicate_index
+from backend.services.pdf_parser import _parse_pdf
+from backend.services.text_cache import text_artifact_store
+
+
+def _load_head_text(paper: Paper) -> str | None:
+    if paper.md5_hash:
+        cached = text_artifact_store.load_text(paper.md5_hash, settings.pdf_full_text_max_chars)
+        if cached and cached[0]:
+            return cached[0]
+    file_path = file_service.resolve_paper_file_path(
+        relative_path=paper.file_path,
+        user_id=paper.owner_id,
+        md5_hash=paper.md5_hash,
+    )
+    if not file_path or not os.path.exists(file_path):
+        return None
+    head_text, _, _ = _parse_pdf(file_path, settings.pdf_max_pages, head_only=True)
+    return head_text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--force', action='store_true', help='为所有论文重新计算签名')
+    parser.add_argument('--batch-size', type=int, default=200, help='每批提交的论文数')
+    args = parser.parse_args()
+
+    session = Session()
+    try:
+        query = session.query(Paper)
+        if not args.force:
+            indexed_ids = session.query(PaperMinHash.paper_id)
+            query = query.filter(~Paper.id.in_(indexed_ids))
+        papers = query.order_by(Paper.id).all()
+
+        indexed = skipped = failed = 0
+        for index, paper in enumerate(papers, start=1):
+            try:
+                signature = minhash_signature(_load_head_text(paper) or "")
+            except Exception as e:
+                print(f"[FAILED] paper {paper.id}: {e}")
+                failed += 1
+                continue
+            if not signature:
+                skipped += 1
+                continue
+            near_duplicate_index.add(session, paper.id, paper.owner_id, signature)
+            indexed += 1
+            if index % max(args.batch_size, 1) == 0:
+                session.commit()
+        session.commit()
+    finally:
+        session.close()
+
+    print(f"待处理: {len(papers)}, 建立索引: {indexed}, 无可用文本: {skipped}, 失败: {failed}")
+
+
+if __name__ == '__main__':
+    main()
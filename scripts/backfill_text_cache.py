@@ -0,0 +1,76 @@
+"""
+回填提取文本缓存脚本：为已入库论文生成（或按需重建）按 MD5 寻址的提取文本产物
+"""
+import argparse
+import os
+
+from backend.core.db_models import Session, Paper
+from backend.core.file_service import file_service
+from backend.core.settings import settings
+from backend.services.pdf_parser import _parse_pdf
+from backend.services.text_cache import text_artifact_store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--force', action='store_true', help='忽略已有产物，全部重新解析')
+    parser.add_argument('--prune', action='store_true', help='删除不再被任何论文引用的产物')
+    parser.add_argument('--limit', type=int, default=0, help='最多处理的论文数（0 表示不限制）')
+    args = parser.parse_args()
+
+    session = Session()
+    try:
+        papers = (
+            session.query(Paper.md5_hash, Paper.file_path, Paper.owner_id)
+            .filter(Paper.md5_hash.isnot(None))
+            .all()
+        )
+    finally:
+        session.close()
+
+    max_chars = settings.pdf_full_text_max_chars
+    known_md5 = set()
+    written = skipped = missing = failed = 0
+    for md5_hash, relative_path, owner_id in papers:
+        if md5_hash in known_md5:
+            continue
+        known_md5.add(md5_hash)
+        if args.limit and written >= args.limit:
+            continue
+        if not args.force and text_artifact_store.load(md5_hash, max_chars) is not None:
+            skipped += 1
+            continue
+
+        file_path = file_service.resolve_paper_file_path(
+            relative_path=relative_path,
+            user_id=owner_id,
+            md5_hash=md5_hash,
+        )
+        if not file_path or not os.path.exists(file_path):
+            missing += 1
+            continue
+        try:
+            head_text, _, _ = _parse_pdf(
+                file_path, settings.pdf_max_pages, max_chars,
+                md5_hash=md5_hash, cache_path=text_artifact_store.path_for(md5_hash),
+            )
+        except Exception as e:
+            print(f"[FAILED] {md5_hash}: {e}")
+            failed += 1
+            continue
+        if head_text:
+            written += 1
+        else:
+            print(f"[SKIP] {md5_hash}: 提取内容过少，可能是扫描件")
+
+    pruned = 0
+    if args.prune:
+        for md5_hash in list(text_artifact_store.iter_md5()):
+            if md5_hash not in known_md5 and text_artifact_store.delete(md5_hash):
+                pruned += 1
+
+    print(f"论文: {len(known_md5)}, 写入: {written}, 已是最新: {skipped}, 文件缺失: {missing}, 失败: {failed}, 清理: {pruned}")
+
+
+if __name__ == '__main__':
+    main()
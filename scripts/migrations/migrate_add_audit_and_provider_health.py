@@ -29,6 +29,8 @@ def run():
     _add_column_if_missing("llm_providers", "last_error", "TEXT")
     _add_column_if_missing("llm_providers", "avg_latency_ms", "INTEGER")
     _add_column_if_missing("llm_providers", "proxy", "VARCHAR(500)")
+    _add_column_if_missing("llm_providers", "success_count", "INTEGER DEFAULT 0")
+    _add_column_if_missing("llm_providers", "failure_count", "INTEGER DEFAULT 0")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+"""
+为 papers 表新增 normalized_title 列与 (owner_id, normalized_title) 复合索引，并回填已有数据
+语义查重改为单次索引查询；应用启动时也会自动执行同样的补齐，本脚本用于离线批量升级
+"""
+from sqlalchemy import inspect, text
+
+from backend.core.db_models import engine
+from backend.core.db_service import backfill_normalized_titles
+
+
+def _add_column_if_missing(table: str, column: str, column_type: str):
+    inspector = inspect(engine)
+    columns = [c["name"] for c in inspector.get_columns(table)]
+    if column in columns:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+
+
+def run():
+    _add_column_if_missing("papers", "normalized_title", "TEXT")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_papers_owner_normalized_title ON papers (owner_id, normalized_title)"
+        ))
+    updated = backfill_normalized_titles()
+    print(f"已回填 {updated} 篇论文的规范化标题")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,65 @@
+import uuid
+
+from backend.core.db_models import Paper, PaperChatAnswerCache, Session as DBSession
+from backend.services.chat_answer_cache import (
+    ChatAnswerCache,
+    depends_on_context,
+    normalize_question,
+    paper_fingerprint,
+    question_similarity,
+)
+
+
+def test_near_identical_questions_match_after_normalization():
+    a = normalize_question("他们用了什么数据集？")
+    b = normalize_question("他们 使用了什么数据集")
+    assert a == "他们用了什么数据集"
+    assert question_similarity(a, b) >= 0.8
+    assert question_similarity(a, normalize_question("总结一下论文的方法")) < 0.3
+    assert question_similarity(normalize_question("What dataset did they use?"),
+                               normalize_question("what dataset did they use")) == 1.0
+
+
+def test_context_dependence_is_decided_per_question():
+    for question in ["他们用了什么数据集？", "这篇论文的主要贡献是什么", "What does this paper propose?",
+                     "Which datasets did they evaluate on?"]:
+        assert not depends_on_context(question), question
+    for question in ["它用了什么数据集", "第二点能展开讲讲吗", "继续", "上面提到的损失函数是怎么定义的",
+                     "Can you elaborate on that?", "Why does this matter?", "What about the baselines?"]:
+        assert depends_on_context(question), question
+
+
+def test_cache_hits_invalidates_on_analysis_change_and_evicts():
+    cache = ChatAnswerCache(threshold=0.8, max_entries=2)
+    session = DBSession()
+    paper = Paper(title=f"Cache {uuid.uuid4().hex[:8]}", md5_hash=uuid.uuid4().hex,
+                  detailed_analysis="v1", chat_cache_enabled=True)
+    session.add(paper)
+    session.commit()
+    try:
+        cache.store(paper.id, paper_fingerprint(paper), "他们用了什么数据集？", "PubMedQA")
+        hit = cache.lookup(session, paper, "他们使用了什么数据集")
+        assert hit["answer"] == "PubMedQA"
+        # 依赖上下文的追问既不写入也不查询缓存
+        cache.store(paper.id, paper_fingerprint(paper), "它们用了什么数据集", "X")
+        assert cache.count(session, paper.id) == 1
+        assert cache.lookup(session, paper, "它们用了什么数据集") is None
+        assert cache.lookup(session, paper, "这篇论文的主要贡献是什么") is None
+
+        cache.store(paper.id, paper_fingerprint(paper), "这篇论文的主要贡献是什么", "A")
+        assert cache.lookup(session, paper, "他们用了什么数据集？") is not None
+        cache.store(paper.id, paper_fingerprint(paper), "实验用了多少张显卡", "B")
+        # 超出上限时淘汰最久未使用的条目（数据集问题刚被命中过，保留）
+        assert cache.count(session, paper.id) == 2
+        assert cache.lookup(session, paper, "这篇论文的主要贡献是什么") is None
+
+        paper.detailed_analysis = "v2"
+        session.commit()
+        assert cache.lookup(session, paper, "他们用了什么数据集？") is None
+        assert cache.count(session, paper.id) == 0
+        assert cache.stats()["invalidated"] == 2
+    finally:
+        session.query(PaperChatAnswerCache).filter(PaperChatAnswerCache.paper_id == paper.id).delete()
+        session.delete(paper)
+        session.commit()
+        session.close()
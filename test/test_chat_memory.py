@@ -0,0 +1,68 @@
+import asyncio
+import uuid
+
+from backend.core.db_models import PaperChatHistory, PaperChatSummary, Session as DBSession
+from backend.core.rate_governor import estimate_tokens
+from backend.services import chat_memory as chat_memory_module
+from backend.services.chat_memory import ChatMemory, assemble_messages
+
+
+class _FakeResponse:
+    def __init__(self, content: str):
+        message = type("Message", (), {"content": content})()
+        self.choices = [type("Choice", (), {"message": message})()]
+
+
+def test_assemble_messages_drops_oldest_turns_to_fit_budget():
+    history = []
+    for i in range(4):
+        history += [{"role": "user", "content": f"问题{i}" * 50}, {"role": "assistant", "content": f"回答{i}" * 50}]
+    history.append({"role": "user", "content": "当前问题"})
+
+    messages = assemble_messages("系统提示", "此前的摘要", history, token_budget=700)
+
+    assert messages[-1]["content"] == "当前问题"
+    assert messages[1]["role"] == "user"
+    assert estimate_tokens(messages) <= 700
+    assert len(messages) < len(history) + 1
+    assert "回答3" in messages[-2]["content"]
+
+    # 系统提示词本身超出预算时被截断，当前问题始终保留
+    tiny = assemble_messages("很长的论文上下文" * 100, None, history[-1:], token_budget=50)
+    assert estimate_tokens(tiny) <= 50 and tiny[-1]["content"] == "当前问题"
+
+
+def test_old_turns_fold_into_summary_and_recent_turns_stay_verbatim(monkeypatch):
+    paper_id = uuid.uuid4().int % 10**9 + 10**9
+    user_id = 1
+    folded = []
+
+    async def fake_chat(**kwargs):
+        folded.append(kwargs["messages"][0]["content"])
+        return _FakeResponse("用户关心数据集与模型结构")
+
+    monkeypatch.setattr(chat_memory_module.llm_manager, "chat", fake_chat)
+    memory = ChatMemory(recent_turns=1, token_budget=10000)
+
+    session = DBSession()
+    try:
+        for i in range(3):
+            session.add(PaperChatHistory(paper_id=paper_id, user_id=user_id, role="user", content=f"问题{i}"))
+            session.add(PaperChatHistory(paper_id=paper_id, user_id=user_id, role="assistant", content=f"回答{i}"))
+            session.flush()
+        session.commit()
+
+        assert asyncio.run(memory.refresh(paper_id, user_id)) is True
+        assert "问题1" in folded[0] and "问题2" not in folded[0]
+        assert asyncio.run(memory.refresh(paper_id, user_id)) is False
+
+        session.add(PaperChatHistory(paper_id=paper_id, user_id=user_id, role="user", content="问题3"))
+        session.commit()
+        messages = memory.build_messages(session, paper_id, user_id, "系统提示")
+        assert "用户关心数据集与模型结构" in messages[0]["content"]
+        assert [m["content"] for m in messages[1:]] == ["问题2", "回答2", "问题3"]
+    finally:
+        session.query(PaperChatHistory).filter(PaperChatHistory.paper_id == paper_id).delete()
+        session.query(PaperChatSummary).filter(PaperChatSummary.paper_id == paper_id).delete()
+        session.commit()
+        session.close()
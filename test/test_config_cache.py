@@ -0,0 +1,30 @@
+from backend.core.db_service import SystemConfigCache, config_cache, get_config, get_config_version, set_config
+
+
+def test_config_reads_are_served_from_snapshot_until_invalidated():
+    cache = SystemConfigCache(ttl_seconds=3600)
+    loads = []
+    original_load = cache._load
+
+    def counting_load():
+        loads.append(1)
+        return original_load()
+
+    cache._load = counting_load
+    cache.get("llm_max_retries")
+    cache.get("storage_quota_mb")
+    assert len(loads) == 1
+
+    version = cache.version
+    cache.invalidate()
+    cache.get("llm_max_retries")
+    assert len(loads) == 2
+    assert cache.version == version + 1
+
+
+def test_set_config_is_visible_immediately_and_bumps_version():
+    version = get_config_version()
+    assert set_config("test_config_cache_key", "42")
+    assert get_config_version() == version + 1
+    assert get_config("test_config_cache_key") == "42"
+    assert config_cache.snapshot()["test_config_cache_key"] == "42"
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from backend.deps import read_upload_form
+
+BOUNDARY = "paperflowboundary"
+
+
+def _multipart_request(body: bytes, content_length: int, received: list) -> Request:
+    async def receive():
+        received.append(True)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    headers = [
+        (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+        (b"content-length", str(content_length).encode()),
+    ]
+    return Request({"type": "http", "method": "POST", "path": "/api/upload", "headers": headers}, receive)
+
+
+def _pdf_part(filename: str, payload: bytes) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + payload + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def test_upload_over_remaining_quota_is_rejected_before_reading_body():
+    received = []
+    request = _multipart_request(b"", content_length=5 * 1024 * 1024, received=received)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(read_upload_form(request, current_usage=9 * 1024 * 1024, quota_bytes=10 * 1024 * 1024))
+
+    assert exc_info.value.status_code == 413
+    assert received == []
+
+
+def test_upload_within_quota_returns_form_files():
+    body = _pdf_part("paper.pdf", b"%PDF-1.4 test")
+    received = []
+    request = _multipart_request(body, content_length=len(body), received=received)
+
+    async def run():
+        form, files = await read_upload_form(request, current_usage=0, quota_bytes=1024 * 1024)
+        try:
+            return [(file.filename, await file.read()) for file in files]
+        finally:
+            await form.close()
+
+    assert asyncio.run(run()) == [("paper.pdf", b"%PDF-1.4 test")]
+    assert received
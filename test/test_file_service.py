@@ -0,0 +1,59 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+
+from backend.core.file_service import FileService, UploadTooLargeError
+
+
+class _FakeUpload:
+    def __init__(self, content: bytes):
+        self._buffer = io.BytesIO(content)
+        self.reads = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        return self._buffer.read(size)
+
+
+def test_stage_and_commit_upload_hashes_while_streaming(tmp_path):
+    service = FileService(base_path=str(tmp_path / "papers"))
+    content = os.urandom(3 * 1024 * 1024 + 17)
+    upload = _FakeUpload(content)
+
+    staged = asyncio.run(service.stage_upload(upload, user_id=1))
+    assert staged.md5_hash == hashlib.md5(content).hexdigest()
+    assert staged.file_size == len(content)
+    assert upload.reads > 1
+
+    file_info = service.commit_upload(staged, user_id=1, original_filename="paper.pdf")
+    final_path = service.get_file_path(1, staged.md5_hash)
+    assert final_path and not os.path.exists(staged.temp_path)
+    assert file_info["file_path"] == f"user_1/{staged.md5_hash}.pdf"
+    with open(final_path, "rb") as f:
+        assert f.read() == content
+
+
+def test_stage_upload_aborts_when_limit_exceeded(tmp_path):
+    service = FileService(base_path=str(tmp_path / "papers"))
+    upload = _FakeUpload(b"x" * (2 * 1024 * 1024 + 1))
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(service.stage_upload(upload, user_id=1, max_bytes=1024 * 1024))
+
+    # 超过上限后立即中止，不再继续读取，且不留下临时文件
+    assert upload.reads == 2
+    assert os.listdir(tmp_path / "papers" / "user_1") == []
+
+
+def test_cleanup_stale_uploads_removes_only_temp_files(tmp_path):
+    service = FileService(base_path=str(tmp_path / "papers"))
+    staged = asyncio.run(service.stage_upload(_FakeUpload(b"%PDF-1.4 test"), user_id=2))
+    kept = asyncio.run(service.stage_upload(_FakeUpload(b"%PDF-1.4 kept"), user_id=2))
+    service.commit_upload(kept, user_id=2, original_filename="kept.pdf")
+
+    assert service.cleanup_stale_uploads() == 1
+    assert not os.path.exists(staged.temp_path)
+    assert service.file_exists(2, kept.md5_hash)
@@ -0,0 +1,114 @@
+import asyncio
+import uuid
+
+from backend.core.db_models import IngestionJob, Paper, Session as DBSession
+from backend.core.file_service import file_service
+from backend.services import paper_pipeline
+from backend.services.ingestion_queue import IngestionQueueManager, delete_unreferenced_file
+
+
+def _make_manager(retry_max: int = 1) -> IngestionQueueManager:
+    manager = IngestionQueueManager()
+    manager.max_concurrent = 2
+    manager.retry_max = retry_max
+    manager.retry_delay = 0
+    return manager
+
+
+def _save_upload(user_id: int) -> tuple[str, dict]:
+    md5 = uuid.uuid4().hex
+    file_info = file_service.save_file(
+        content=b"%PDF-1.4 test", user_id=user_id, md5_hash=md5, original_filename="paper.pdf"
+    )
+    return md5, file_info
+
+
+async def _wait_for(manager: IngestionQueueManager, job_ids: list[int], timeout: float = 10):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        jobs = [manager.get_job(job_id) for job_id in job_ids]
+        if all(job["status"] not in ("pending", "processing") for job in jobs):
+            return jobs
+        await asyncio.sleep(0.05)
+    raise AssertionError("入库任务未在超时内结束")
+
+
+def test_jobs_retry_then_complete_and_duplicates_remove_file(monkeypatch):
+    user_id = uuid.uuid4().int % 10**6 + 3 * 10**6
+    attempts = {}
+
+    async def fake_workflow(pdf_path, file_md5=None, owner_id=None, file_info=None, on_stage=None):
+        attempts[file_md5] = attempts.get(file_md5, 0) + 1
+        on_stage("parse")
+        if file_md5 == duplicate_md5:
+            raise FileExistsError("语义重复: x")
+        if attempts[file_md5] == 1:
+            raise RuntimeError("upstream 502")
+        on_stage("save")
+        return 42
+
+    monkeypatch.setattr(paper_pipeline, "process_workflow", fake_workflow)
+    manager = _make_manager()
+    flaky_md5, flaky_info = _save_upload(user_id)
+    duplicate_md5, duplicate_info = _save_upload(user_id)
+
+    async def run():
+        flaky = manager.enqueue(user_id, flaky_md5, flaky_info)
+        duplicate = manager.enqueue(user_id, duplicate_md5, duplicate_info)
+        await manager.start_worker()
+        try:
+            return await _wait_for(manager, [flaky["id"], duplicate["id"]])
+        finally:
+            await manager.stop_worker()
+
+    try:
+        flaky_job, duplicate_job = asyncio.run(run())
+        assert flaky_job["status"] == "completed" and flaky_job["paper_id"] == 42
+        assert flaky_job["retry_count"] == 1 and flaky_job["stage"] == "save"
+        assert duplicate_job["status"] == "duplicate"
+        assert not file_service.file_exists(user_id, duplicate_md5)
+    finally:
+        file_service.delete_file(user_id, flaky_md5)
+        session = DBSession()
+        session.query(IngestionJob).filter(IngestionJob.user_id == user_id).delete()
+        session.commit()
+        session.close()
+
+
+def test_processing_jobs_are_recovered_after_restart():
+    user_id = uuid.uuid4().int % 10**6 + 4 * 10**6
+    session = DBSession()
+    try:
+        job = IngestionJob(user_id=user_id, md5_hash=uuid.uuid4().hex, status="processing", retry_count=0)
+        session.add(job)
+        session.commit()
+
+        manager = _make_manager(retry_max=1)
+        assert manager.recover_incomplete_jobs_on_startup()["recovered"] >= 1
+        recovered = manager.get_job(job.id)
+        assert recovered["status"] == "pending" and recovered["retry_count"] == 1
+    finally:
+        session.query(IngestionJob).filter(IngestionJob.user_id == user_id).delete()
+        session.commit()
+        session.close()
+
+
+def test_duplicate_cleanup_keeps_files_referenced_by_a_paper():
+    user_id = uuid.uuid4().int % 10**6 + 4 * 10**6
+    md5, _ = _save_upload(user_id)
+    session = DBSession()
+    try:
+        paper = Paper(title="persisted", md5_hash=md5, owner_id=user_id)
+        session.add(paper)
+        session.commit()
+        assert delete_unreferenced_file(user_id, md5) is False
+        assert file_service.file_exists(user_id, md5)
+
+        session.delete(paper)
+        session.commit()
+        assert delete_unreferenced_file(user_id, md5) is True
+        assert not file_service.file_exists(user_id, md5)
+    finally:
+        session.query(Paper).filter(Paper.owner_id == user_id).delete()
+        session.commit()
+        session.close()
@@ -0,0 +1,64 @@
+import asyncio
+import uuid
+
+from backend.core.llm_cache import LLMResponseCacheStore, make_cache_key
+from backend.core.llm_pool import GeminiResponseWrapper, llm_manager
+
+
+def test_cache_key_is_stable_and_sensitive_to_request_content():
+    messages = [{"role": "user", "content": "hi"}]
+    fmt = {"type": "json_object"}
+    key = make_cache_key("metadata", "m1,m2", messages, fmt, 0.1)
+    assert key == make_cache_key("metadata", "m1,m2", [{"content": "hi", "role": "user"}], fmt, 0.1)
+    assert key != make_cache_key("metadata", "m1,m2", messages, fmt, 0.2)
+    assert key != make_cache_key("metadata", "m1", messages, fmt, 0.1)
+
+
+def test_db_tier_serves_entries_after_memory_eviction_and_trims_to_max():
+    async def run():
+        store = LLMResponseCacheStore(pools="metadata", ttl_seconds=3600, memory_entries=1, max_entries=2)
+        keys = [uuid.uuid4().hex for _ in range(3)]
+        for index, key in enumerate(keys):
+            await store.put(key, "metadata", f"value-{index}")
+        # 内存只保留最后一条，第二条需从数据库读取；第一条已被条目上限淘汰
+        assert await store.get(keys[2]) == "value-2"
+        assert await store.get(keys[1]) == "value-1"
+        assert await store.get(keys[0]) is None
+        return store.stats()
+
+    stats = asyncio.run(run())
+    assert stats["memory_hits"] == 1 and stats["db_hits"] == 1 and stats["misses"] == 1
+    assert stats["evictions"] >= 1
+
+
+class _CountingClient:
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    async def create_chat_completion(self, **kwargs):
+        self.calls += 1
+        return GeminiResponseWrapper({"candidates": [{"content": {"parts": [{"text": self.text}]}}]})
+
+
+def test_chat_reuses_validated_response_and_honours_bypass():
+    client = _CountingClient('{"title": "%s"}' % uuid.uuid4().hex)
+    pool = [{"client": client, "model": "m", "id": "cache", "route_key": "cache/0/m", "request_format": "gemini"}]
+    messages = [{"role": "user", "content": uuid.uuid4().hex}]
+    saved_pools = llm_manager.pools
+    llm_manager.pools = {"cache-test": pool}
+
+    async def run():
+        first = await llm_manager.chat("cache-test", messages, cache=True, validator=lambda c: c.startswith("{"))
+        second = await llm_manager.chat("cache-test", messages, cache=True)
+        await llm_manager.chat("cache-test", messages, cache=False)
+        return first, second
+
+    try:
+        first, second = asyncio.run(run())
+    finally:
+        llm_manager.pools = saved_pools
+
+    assert second.choices[0].message.content == first.choices[0].message.content
+    assert getattr(second, "cached", False) is True
+    assert client.calls == 2
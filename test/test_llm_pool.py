@@ -0,0 +1,354 @@
+import asyncio
+import json
+
+import httpx
+
+from backend.core.llm_pool import (
+    AnthropicClientWrapper,
+    GeminiClientWrapper,
+    GeminiResponseWrapper,
+    ManagedClient,
+    SharedHTTPClientPool,
+)
+from backend.core.llm_routing import AdaptiveRouter
+
+
+def _sse_pool(base_url: str, events: list[dict], seen_requests: list) -> SharedHTTPClientPool:
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_requests.append(request)
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    pool = SharedHTTPClientPool()
+    pool._clients[(base_url, None)] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return pool
+
+
+async def _collect(agen) -> list[str]:
+    return [piece async for piece in agen]
+
+
+def test_shared_http_clients_are_keyed_by_base_url_and_proxy():
+    async def run():
+        pool = SharedHTTPClientPool()
+        first = GeminiClientWrapper(api_key="k1", base_url="https://a.example/v1", http_clients=pool)
+        second = GeminiClientWrapper(api_key="k2", base_url="https://a.example/v1", http_clients=pool)
+        other = GeminiClientWrapper(api_key="k1", base_url="https://b.example/v1", http_clients=pool)
+
+        async with first._http_client() as c1, second._http_client() as c2, other._http_client() as c3:
+            assert c1 is c2
+            assert c1 is not c3
+        await pool.aclose()
+        assert c1.is_closed and c3.is_closed
+
+    asyncio.run(run())
+
+
+def test_retired_pool_closes_after_inflight_requests_finish():
+    async def run():
+        pool = SharedHTTPClientPool()
+        async with pool.lease("https://a.example", None) as client:
+            pool.retire()
+            assert not client.is_closed
+        assert client.is_closed
+
+    asyncio.run(run())
+
+
+def test_lease_after_close_uses_one_shot_client():
+    async def run():
+        pool = SharedHTTPClientPool()
+        await pool.aclose()
+        async with pool.lease("https://a.example", None) as client:
+            assert not client.is_closed
+        assert client.is_closed
+        assert not pool._clients
+
+    asyncio.run(run())
+
+
+def test_lease_on_closed_client_handle_uses_one_shot_client():
+    class _Client:
+        def __init__(self):
+            self.closed = False
+
+        async def close(self):
+            self.closed = True
+
+    async def run():
+        handle = ManagedClient(_Client(), ("openai", "https://a.example", None, "k"), _Client)
+        handle.retire()
+        await handle.aclose()
+        assert handle.client.closed
+        async with handle.lease() as client:
+            assert client is not handle.client and not client.closed
+        assert client.closed
+
+    asyncio.run(run())
+
+
+def test_gemini_stream_yields_text_parts_and_skips_thoughts():
+    async def run():
+        seen = []
+        pool = _sse_pool("https://g.example/v1beta", [
+            {"candidates": [{"content": {"parts": [{"text": "hidden", "thought": True}]}}]},
+            {"candidates": [{"content": {"parts": [{"text": "Hel"}]}}]},
+            {"candidates": [{"content": {"parts": [{"text": "lo"}]}}]},
+        ], seen)
+        client = GeminiClientWrapper(api_key="k", base_url="https://g.example/v1beta", http_clients=pool)
+        pieces = await _collect(client.stream_chat_completion("gemini-x", [{"role": "user", "content": "hi"}]))
+        await pool.aclose()
+        assert pieces == ["Hel", "lo"]
+        assert ":streamGenerateContent" in seen[0].url.path
+        assert seen[0].url.params["alt"] == "sse"
+
+    asyncio.run(run())
+
+
+def test_anthropic_stream_yields_text_deltas():
+    async def run():
+        seen = []
+        pool = _sse_pool("https://a.example", [
+            {"type": "message_start", "message": {}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hi"}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": " there"}},
+            {"type": "message_stop"},
+        ], seen)
+        client = AnthropicClientWrapper(api_key="k", base_url="https://a.example", http_clients=pool)
+        pieces = await _collect(client.stream_chat_completion("claude-x", [{"role": "user", "content": "hi"}]))
+        await pool.aclose()
+        assert pieces == ["Hi", " there"]
+        assert json.loads(seen[0].content)["stream"] is True
+
+    asyncio.run(run())
+
+
+def test_adaptive_router_prefers_faster_node_within_tier():
+    router = AdaptiveRouter(failure_threshold=2, cooldown_seconds=60, ewma_alpha=0.5)
+    slow = {"id": "slow", "route_key": "1/0/m", "priority": 1}
+    fast = {"id": "fast", "route_key": "2/0/m", "priority": 1}
+    backup = {"id": "backup", "route_key": "3/0/m", "priority": 2}
+    router.record_success(slow, 900)
+    router.record_success(fast, 100)
+    router.record_success(backup, 10)
+
+    assert [n["id"] for n in router.order([slow, backup, fast])] == ["fast", "slow", "backup"]
+
+
+def test_adaptive_router_opens_circuit_and_demotes_node():
+    router = AdaptiveRouter(failure_threshold=2, cooldown_seconds=60, ewma_alpha=0.5)
+    primary = {"id": "primary", "route_key": "1/0/m", "priority": 1}
+    other = {"id": "other", "route_key": "2/0/m", "priority": 1}
+
+    assert router.record_failure(primary) is False
+    assert router.record_failure(primary) is True
+    assert router.is_available(primary) is False
+    assert [n["id"] for n in router.order([primary, other])] == ["other", "primary"]
+
+    # 冷却结束后半开，仅允许一次探测；探测成功后恢复
+    router._states["1/0/m"].opened_until = 0
+    assert router.is_available(primary) is True
+    router.mark_attempt(primary)
+    assert router.is_available(primary) is False
+    router.record_success(primary, 50)
+    assert router.is_available(primary) is True
+
+
+class _FakeChatClient:
+    def __init__(self, text: str, delay: float):
+        self.text = text
+        self.delay = delay
+        self.cancelled = False
+
+    async def create_chat_completion(self, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return GeminiResponseWrapper({"candidates": [{"content": {"parts": [{"text": self.text}]}}]})
+
+
+def test_hedged_chat_returns_first_valid_response_and_cancels_loser():
+    from backend.core.llm_pool import llm_manager
+
+    slow = _FakeChatClient("slow", delay=5)
+    fast = _FakeChatClient("fast", delay=0)
+    pool = [
+        {"client": slow, "model": "m", "id": "slow", "route_key": "hedge/slow", "request_format": "gemini"},
+        {"client": fast, "model": "m", "id": "fast", "route_key": "hedge/fast", "request_format": "gemini"},
+    ]
+    saved_pools = llm_manager.pools
+    llm_manager.pools = {"hedge-test": pool}
+    llm_manager._hedge_delay_seconds = lambda node: 0.01
+    try:
+        response = asyncio.run(
+            llm_manager.chat("hedge-test", [{"role": "user", "content": "hi"}], hedge=True)
+        )
+    finally:
+        llm_manager.pools = saved_pools
+        del llm_manager._hedge_delay_seconds
+
+    assert response.choices[0].message.content == "fast"
+    assert slow.cancelled is True
+    assert llm_manager.hedge_stats["hedge-test"] == {
+        "hedged": 1, "hedge_wins": 1, "primary_wins": 0, "cancelled": 1,
+    }
+
+
+def _provider(provider_id: int, api_key: str, models: str, request_format: str = "openai") -> dict:
+    return {
+        "id": provider_id, "base_url": "https://api.example.com/v1", "proxy": None,
+        "api_key": api_key, "api_type": request_format, "request_format": request_format,
+        "models": models, "is_primary": False, "priority": 1, "weight": 10,
+    }
+
+
+def test_reload_reuses_unchanged_clients_and_closes_removed_ones(monkeypatch):
+    import backend.core.llm_pool as llm_pool
+
+    providers = {"metadata": [_provider(1, "k1,k2", "m1")], "analysis": []}
+    monkeypatch.setattr(llm_pool, "get_enabled_providers", lambda pool_type: providers[pool_type])
+    manager = llm_pool.LLMManager()
+    version = manager.config_version
+    first_k1 = manager.pools["metadata"][0]["client"]
+    removed_k2 = manager.pools["metadata"][1]["client"]
+
+    # 配置未变化：不重建
+    assert manager.reload_config() is False
+    assert manager.config_version == version
+
+    providers["metadata"] = [_provider(1, "k1", "m1,m2")]
+    assert manager.reload_config() is True
+    assert manager.config_version == version + 1
+    nodes = manager.pools["metadata"]
+    assert isinstance(nodes, tuple) and len(nodes) == 2
+    assert all(node["client"] is first_k1 for node in nodes)
+    assert removed_k2.is_closed() and not first_k1.is_closed()
+
+    asyncio.run(manager.aclose())
+    assert first_k1.is_closed()
+
+
+def test_reload_if_changed_follows_config_version_marker(monkeypatch):
+    import backend.core.llm_pool as llm_pool
+    from backend.core.llm_service import bump_llm_config_version
+
+    calls = []
+
+    def fake_providers(pool_type):
+        calls.append(pool_type)
+        return []
+
+    monkeypatch.setattr(llm_pool, "get_enabled_providers", fake_providers)
+    manager = llm_pool.LLMManager()
+    calls.clear()
+
+    assert manager.reload_if_changed() is False
+    assert calls == []
+    bump_llm_config_version()
+    manager.reload_if_changed()
+    assert calls == ["metadata", "analysis"]
+
+
+class _FakeStreamClient:
+    def __init__(self, pieces: list[str], fail_after: int = None):
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.calls = 0
+        self.closed = False
+
+    async def stream_chat_completion(self, **kwargs):
+        self.calls += 1
+        try:
+            for index, piece in enumerate(self.pieces):
+                if index == self.fail_after:
+                    raise RuntimeError("upstream reset")
+                yield piece
+        finally:
+            self.closed = True
+
+
+def _stream_nodes(*clients) -> list[dict]:
+    return [
+        {"client": client, "model": "m", "id": f"stream-{i}", "route_key": f"stream/{i}",
+         "request_format": "gemini", "priority": i + 1}
+        for i, client in enumerate(clients)
+    ]
+
+
+def test_iter_chat_stream_fails_over_only_before_first_token():
+    from backend.core.llm_pool import llm_manager
+
+    broken = _FakeStreamClient(["never"], fail_after=0)
+    healthy = _FakeStreamClient(["Hel", "lo"])
+    midway = _FakeStreamClient(["par", "tial"], fail_after=1)
+    saved_pools = llm_manager.pools
+    llm_manager.pools = {"failover": _stream_nodes(broken, healthy), "midway": _stream_nodes(midway, healthy)}
+    messages = [{"role": "user", "content": "hi"}]
+    try:
+        assert asyncio.run(_collect(llm_manager.iter_chat_stream("failover", messages))) == ["Hel", "lo"]
+
+        received = []
+
+        async def consume_midway():
+            async for piece in llm_manager.iter_chat_stream("midway", messages):
+                received.append(piece)
+
+        healthy.calls = 0
+        try:
+            asyncio.run(consume_midway())
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("部分输出后的错误应直接抛出")
+        assert received == ["par"] and healthy.calls == 0
+    finally:
+        llm_manager.pools = saved_pools
+
+
+def test_chat_stream_does_not_fail_over_after_chunks_reached_callback():
+    from backend.core.llm_pool import llm_manager
+
+    midway = _FakeStreamClient(["par", "tial"], fail_after=1)
+    healthy = _FakeStreamClient(["Hel", "lo"])
+    saved_pools = llm_manager.pools
+    llm_manager.pools = {"midway": _stream_nodes(midway, healthy)}
+    messages = [{"role": "user", "content": "hi"}]
+    received = []
+    try:
+        try:
+            asyncio.run(llm_manager.chat_stream("midway", messages, on_chunk=received.append))
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("部分输出后的错误应直接抛出")
+        assert received == ["par"] and healthy.calls == 0
+
+        # 没有回调时调用方只拿到完整结果，仍可换节点重新生成
+        midway.calls = 0
+        assert asyncio.run(llm_manager.chat_stream("midway", messages)) == "Hello"
+        assert midway.calls >= 1 and healthy.calls == 1
+    finally:
+        llm_manager.pools = saved_pools
+
+
+def test_iter_chat_stream_closes_upstream_when_consumer_stops():
+    from backend.core.llm_pool import llm_manager
+
+    client = _FakeStreamClient(["a", "b", "c"])
+    saved_pools = llm_manager.pools
+    llm_manager.pools = {"early-stop": _stream_nodes(client)}
+
+    async def run():
+        stream = llm_manager.iter_chat_stream("early-stop", [{"role": "user", "content": "hi"}])
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    try:
+        assert asyncio.run(run()) == "a"
+        assert client.closed is True
+    finally:
+        llm_manager.pools = saved_pools
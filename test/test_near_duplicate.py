@@ -0,0 +1,57 @@
+import random
+import uuid
+
+from backend.core.db_models import Paper, PaperMinHash, Session as DBSession
+from backend.services.near_duplicate import NearDuplicateIndex, estimate_jaccard, minhash_signature
+
+_WORDS = [f"w{i}" for i in range(400)]
+
+
+def _paper_text(seed: int, length: int = 600) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_WORDS) for _ in range(length))
+
+
+def test_signature_similarity_tracks_text_overlap():
+    base = _paper_text(1)
+    revised = base.replace(base[:200], "arXiv preprint version two submitted to a different venue ")
+    assert estimate_jaccard(minhash_signature(base), minhash_signature(revised)) > 0.8
+    assert estimate_jaccard(minhash_signature(base), minhash_signature(_paper_text(2))) < 0.2
+    assert minhash_signature("too short") is None
+
+
+def test_index_finds_near_duplicates_within_owner_and_reports_clusters():
+    owner_id = uuid.uuid4().int % 10**9 + 2 * 10**9
+    index = NearDuplicateIndex(threshold=0.7)
+    base = _paper_text(3)
+    texts = {"preprint": base, "camera-ready": base + " accepted version", "other": _paper_text(4)}
+    session = DBSession()
+    try:
+        ids = {}
+        for title, text in texts.items():
+            paper = Paper(title=title, owner_id=owner_id)
+            session.add(paper)
+            session.flush()
+            index.add(session, paper.id, owner_id, minhash_signature(text))
+            ids[title] = paper.id
+        session.commit()
+
+        matches = index.find(session, minhash_signature(base), owner_id)
+        assert [m["paper_id"] for m in matches][:2] == [ids["preprint"], ids["camera-ready"]]
+        assert index.find(session, minhash_signature(base), owner_id + 1) == []
+
+        clusters = index.clusters(session, owner_id=owner_id)
+        assert [[p["paper_id"] for p in cluster] for cluster in clusters] == [
+            sorted([ids["preprint"], ids["camera-ready"]])
+        ]
+
+        # 删除论文时同步清理签名
+        session.delete(session.get(Paper, ids["other"]))
+        session.commit()
+        assert session.get(PaperMinHash, ids["other"]) is None
+    finally:
+        for paper_id in session.query(Paper.id).filter(Paper.owner_id == owner_id).all():
+            index.remove(session, paper_id[0])
+        session.query(Paper).filter(Paper.owner_id == owner_id).delete()
+        session.commit()
+        session.close()
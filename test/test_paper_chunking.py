@@ -0,0 +1,61 @@
+import asyncio
+
+from backend.core.llm_pool import GeminiResponseWrapper, llm_manager
+from backend.services.paper_chunking import chunk_text, estimate_text_tokens, split_sections
+
+
+def _paper(section_words: int) -> str:
+    body = " ".join(["word"] * section_words)
+    return (
+        "A Study of Things\nJane Doe\n\nAbstract\n" + body
+        + "\n\n1 Introduction\n" + body
+        + "\n\n2 Method\n" + body
+        + "\n\n2.1 Details\n" + body
+        + "\n\n3 Results\n" + body
+        + "\n\nReferences\n[1] Someone. A cited paper.\n"
+    )
+
+
+def test_split_sections_detects_numbered_and_named_headings():
+    titles = [title for title, _ in split_sections(_paper(10))]
+    assert titles == ["开头", "Abstract", "1 Introduction", "2 Method", "2.1 Details", "3 Results", "References"]
+
+
+def test_chunks_respect_budget_merge_small_sections_and_skip_references():
+    small = chunk_text(_paper(10), max_tokens=1000)
+    assert len(small) == 1
+    assert "Abstract" in small[0].section and "cited paper" not in small[0].text
+
+    large = chunk_text(_paper(3000), max_tokens=1000)
+    assert len(large) > 5
+    assert all(estimate_text_tokens(chunk.text) <= 1000 for chunk in large)
+    assert [chunk.index for chunk in large] == list(range(len(large)))
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.prompts = []
+
+    async def create_chat_completion(self, messages, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        return GeminiResponseWrapper({"candidates": [{"content": {"parts": [{"text": "要点 " * 60}]}}]})
+
+
+def test_long_paper_is_analyzed_with_chunk_notes_then_synthesis():
+    from backend.services.paper_pipeline import _analysis_input_budget, task_analyze_paper
+
+    client = _RecordingClient()
+    pool = ({"client": client, "model": "unknown-small", "id": "long", "route_key": "long/0/m", "request_format": "gemini"},)
+    saved_pools = llm_manager.pools
+    llm_manager.pools = {"analysis": pool}
+    try:
+        text = _paper(_analysis_input_budget())
+        report = asyncio.run(task_analyze_paper(text))
+    finally:
+        llm_manager.pools = saved_pools
+
+    assert report.startswith("要点")
+    chunk_prompts = [p for p in client.prompts if "个片段" in p]
+    assert len(chunk_prompts) >= 2
+    assert "分段要点笔记" in client.prompts[-1]
+    assert len(client.prompts) == len(chunk_prompts) + 1
@@ -0,0 +1,177 @@
+import asyncio
+import dataclasses
+import uuid
+
+import pytest
+
+from backend.core.db_models import Paper, Session as DBSession
+from backend.services import paper_pipeline
+from backend.services.ingest_checkpoint import ingest_checkpoints
+from backend.services.paper_pipeline import SpeculativeAnalysis, find_semantic_duplicate, speculative_analysis_stats
+
+
+def _enable_speculation(monkeypatch, calls: list, delay: float):
+    monkeypatch.setattr(
+        paper_pipeline, "settings",
+        dataclasses.replace(paper_pipeline.settings, speculative_analysis=True),
+    )
+
+    async def fake_analyze(full_text, **kwargs):
+        calls.append("start")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            calls.append("cancelled")
+            raise
+        return f"analysis of {full_text}"
+
+    monkeypatch.setattr(paper_pipeline, "task_analyze_paper", fake_analyze)
+
+
+def test_speculative_analysis_runs_alongside_metadata_and_is_reused(monkeypatch):
+    calls = []
+    _enable_speculation(monkeypatch, calls, delay=0.01)
+    used = speculative_analysis_stats["used"]
+
+    async def run():
+        async with SpeculativeAnalysis("paper") as speculative:
+            await asyncio.sleep(0)  # 模拟元数据提取期间分析已开始
+            assert calls == ["start"]
+            return await speculative.result()
+
+    assert asyncio.run(run()) == "analysis of paper"
+    assert speculative_analysis_stats["used"] == used + 1
+
+
+def test_speculative_analysis_waits_for_full_text_task(monkeypatch):
+    calls = []
+    _enable_speculation(monkeypatch, calls, delay=0)
+
+    async def parse_full_text():
+        await asyncio.sleep(0.01)
+        return "full text"
+
+    async def run():
+        async with SpeculativeAnalysis(asyncio.create_task(parse_full_text())) as speculative:
+            return await speculative.result()
+
+    assert asyncio.run(run()) == "analysis of full text"
+
+
+def test_speculative_analysis_is_cancelled_on_duplicate(monkeypatch):
+    calls = []
+    _enable_speculation(monkeypatch, calls, delay=10)
+    wasted = speculative_analysis_stats["wasted_duplicates"]
+
+    async def run():
+        async with SpeculativeAnalysis("paper"):
+            await asyncio.sleep(0)
+            raise FileExistsError("语义重复")
+
+    with pytest.raises(FileExistsError):
+        asyncio.run(run())
+    assert calls == ["start", "cancelled"]
+    assert speculative_analysis_stats["wasted_duplicates"] == wasted + 1
+
+
+def test_semantic_duplicate_uses_normalized_title_scoped_to_owner():
+    owner_id = uuid.uuid4().int % 10**9 + 10**9
+    title = f"Attention Is All You Need ({uuid.uuid4().hex[:8]})"
+    session = DBSession()
+    try:
+        session.add_all([Paper(title=title, owner_id=owner_id), Paper(title="纯中文标题", owner_id=owner_id)])
+        session.commit()
+        variant = title.upper().replace(" ", "-")
+        assert find_semantic_duplicate(session, variant, owner_id) == title
+        assert find_semantic_duplicate(session, variant, owner_id + 1) is None
+        # 规范化后为空的标题（如纯中文）不参与查重
+        assert find_semantic_duplicate(session, "另一个中文标题", owner_id) is None
+    finally:
+        session.query(Paper).filter(Paper.owner_id == owner_id).delete()
+        session.commit()
+        session.close()
+
+
+def test_workflow_resumes_from_first_incomplete_stage(monkeypatch):
+    owner_id = uuid.uuid4().int % 10**9 + 2 * 10**9
+    md5 = uuid.uuid4().hex
+    calls = {"full_parse": 0, "metadata": 0, "analysis": 0}
+    monkeypatch.setattr(
+        paper_pipeline, "settings",
+        dataclasses.replace(paper_pipeline.settings, speculative_analysis=False),
+    )
+
+    async def fake_extract(pdf_path, md5_hash=None):
+        calls["full_parse"] += 1
+        return "head", "full text"
+
+    async def fake_extract_head(pdf_path, md5_hash=None):
+        return "head"
+
+    async def fake_metadata(head_text):
+        calls["metadata"] += 1
+        return {"title": f"Resumable Paper {md5}", "year": 2024}
+
+    async def fake_analyze(full_text, **kwargs):
+        calls["analysis"] += 1
+        if calls["analysis"] == 1:
+            raise RuntimeError("upstream 502")
+        return "analysis"
+
+    monkeypatch.setattr(paper_pipeline, "extract_pdf_content_async", fake_extract)
+    monkeypatch.setattr(paper_pipeline, "extract_pdf_head_async", fake_extract_head)
+    monkeypatch.setattr(paper_pipeline, "task_extract_metadata", fake_metadata)
+    monkeypatch.setattr(paper_pipeline, "task_analyze_paper", fake_analyze)
+
+    stages = []
+    try:
+        with pytest.raises(RuntimeError):
+            asyncio.run(paper_pipeline.process_workflow("paper.pdf", md5, owner_id, on_stage=stages.append))
+        checkpoint = ingest_checkpoints.load(owner_id, md5)
+        assert checkpoint["stage"] == "dedup" and checkpoint["attempts"] == 1
+        stuck = ingest_checkpoints.stuck(0, owner_id=owner_id)
+        assert stuck["counts"]["analysis"] == 1
+
+        stages.clear()
+        paper_id = asyncio.run(paper_pipeline.process_workflow("paper.pdf", md5, owner_id, on_stage=stages.append))
+        assert stages == ["extract", "analysis", "persist"]
+        assert calls == {"full_parse": 2, "metadata": 1, "analysis": 2}
+        assert ingest_checkpoints.load(owner_id, md5) is None
+
+        session = DBSession()
+        try:
+            paper = session.query(Paper).filter(Paper.id == paper_id).first()
+            assert paper.title == f"Resumable Paper {md5}" and paper.detailed_analysis == "analysis"
+        finally:
+            session.close()
+    finally:
+        ingest_checkpoints.clear(owner_id, md5)
+        session = DBSession()
+        session.query(Paper).filter(Paper.owner_id == owner_id).delete()
+        session.commit()
+        session.close()
+
+
+def test_metadata_validator_rejects_unparseable_responses_and_cache_can_be_bypassed(monkeypatch):
+    calls = []
+
+    class _Response:
+        def __init__(self, content):
+            message = type("Message", (), {"content": content})()
+            self.choices = [type("Choice", (), {"message": message})()]
+
+    async def fake_chat(**kwargs):
+        calls.append(kwargs)
+        return _Response('{"title": "Paper", "authors": ["A", "B"]}')
+
+    monkeypatch.setattr(paper_pipeline.llm_manager, "chat", fake_chat)
+
+    metadata = asyncio.run(paper_pipeline.task_extract_metadata("head text", cache=False))
+    assert metadata["authors"] == "A, B"
+    assert calls[0]["cache"] is False
+
+    validator = calls[0]["validator"]
+    assert validator('<think>...</think>{"title": "Paper", "year": 2024}')
+    assert not validator('The title of this paper is unknown, sorry.')
+    assert not validator('{"title": "", "abstract": "missing title"}')
+    assert not validator('["title", "authors"]')
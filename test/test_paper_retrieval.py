@@ -0,0 +1,82 @@
+import asyncio
+import uuid
+
+from backend.core.db_models import Paper, Session as DBSession
+from backend.services.paper_retrieval import (
+    PaperRetrievalStore,
+    build_index,
+    paper_retrieval_store,
+    search_index,
+    tokenize,
+)
+from backend.services.paper_service import PaperService
+
+PAPER_TEXT = """1 Introduction
+We study long document question answering for scientific papers.
+
+2 Method
+Our encoder uses sparse attention with a sliding window of 512 tokens.
+
+3 Experiments
+We train on the PubMedQA dataset and report accuracy on the held-out split.
+
+4 Conclusion
+Sparse attention scales to long inputs.
+"""
+
+
+def test_tokenize_handles_english_terms_inside_chinese_questions():
+    assert tokenize("他们用了什么 PubMedQA 数据集？") == ["他们", "们用", "用了", "了什", "什么", "pubmedqa", "数据", "据集"]
+    assert "the" not in tokenize("the dataset")
+
+
+def test_bm25_returns_the_relevant_section_in_document_order():
+    index = build_index("0" * 32, PAPER_TEXT, chunk_tokens=20)
+    assert len(index["chunks"]) >= 3
+
+    results = search_index(index, "这篇论文用了哪个 PubMedQA dataset?", top_k=2)
+    assert results and "PubMedQA" in results[0]["text"]
+    assert all(result["score"] > 0 for result in results)
+    assert [r["index"] for r in results] == sorted(r["index"] for r in results)
+    assert search_index(index, "完全无关的问题", top_k=3) == []
+
+
+def test_store_persists_index_and_rebuilds_when_stale(tmp_path):
+    md5 = uuid.uuid4().hex
+    store = PaperRetrievalStore(root=str(tmp_path), chunk_tokens=20)
+    store.build(md5, PAPER_TEXT)
+    assert (tmp_path / md5[:2] / f"{md5}.json.gz").exists()
+
+    fresh = PaperRetrievalStore(root=str(tmp_path), chunk_tokens=20)
+    results = asyncio.run(fresh.search(md5, None, "sliding window attention", top_k=1))
+    assert "sliding window" in results[0]["text"]
+    assert fresh.stats()["hits"] == 1 and fresh.stats()["builds"] == 0
+
+    # 分块大小变化后旧索引失效
+    resized = PaperRetrievalStore(root=str(tmp_path), chunk_tokens=50)
+    assert resized.load(md5) is None
+
+
+def test_index_is_removed_with_the_last_paper_using_the_md5():
+    md5 = uuid.uuid4().hex
+    paper_retrieval_store.build(md5, PAPER_TEXT)
+    session = DBSession()
+    try:
+        first, second = Paper(title="a", md5_hash=md5), Paper(title="b", md5_hash=md5)
+        session.add_all([first, second])
+        session.commit()
+        service = PaperService(session)
+
+        service.delete_paper_files(first)
+        session.delete(first)
+        session.commit()
+        assert paper_retrieval_store.load(md5) is not None
+
+        service.delete_paper_files(second)
+        session.delete(second)
+        session.commit()
+        assert paper_retrieval_store.load(md5) is None
+    finally:
+        session.query(Paper).filter(Paper.md5_hash == md5).delete()
+        session.commit()
+        session.close()
@@ -0,0 +1,122 @@
+import asyncio
+
+import fitz
+import pytest
+
+from backend.services import text_cache
+from backend.services.pdf_parser import (
+    PDFParsePool,
+    PDFParseTimeoutError,
+    PDFTooLargeError,
+    TextBuilder,
+    _parse_pdf,
+)
+from backend.services.text_cache import TextArtifactStore
+
+
+def _make_pdf(path, pages: int) -> str:
+    doc = fitz.open()
+    for index in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {index} of a test paper about streaming parsers. " * 3)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_process_pool_extracts_text_and_records_parse_time(tmp_path):
+    pdf_path = _make_pdf(tmp_path / "paper.pdf", pages=3)
+    pool = PDFParsePool(workers=1, timeout_seconds=60, max_pages=10)
+    try:
+        head_text, full_text = asyncio.run(pool.extract(pdf_path))
+    finally:
+        pool.shutdown()
+
+    assert "Page 0" in head_text and "Page 2" not in head_text
+    assert "Page 2" in full_text
+    stats = pool.stats()
+    assert stats["completed"] == 1 and stats["pages"] == 3
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_timeout_is_checked_per_page_from_parse_start(tmp_path):
+    pdf_path = _make_pdf(tmp_path / "slow.pdf", pages=3)
+    with pytest.raises(PDFParseTimeoutError):
+        _parse_pdf(pdf_path, timeout_seconds=1e-9)
+
+    pool = PDFParsePool(workers=0, timeout_seconds=1e-9, max_pages=10)
+    with pytest.raises(PDFParseTimeoutError):
+        asyncio.run(pool.extract(pdf_path))
+    stats = pool.stats()
+    assert stats["timeouts"] == 1 and stats["pool_restarts"] == 0
+
+
+def test_documents_queued_behind_busy_worker_keep_their_own_deadline(tmp_path):
+    paths = [_make_pdf(tmp_path / f"paper{i}.pdf", pages=3) for i in range(4)]
+    pool = PDFParsePool(workers=1, timeout_seconds=30, max_pages=10)
+
+    async def run():
+        return await asyncio.gather(*(pool.extract(path) for path in paths))
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+    assert all(full_text and "Page 2" in full_text for _, full_text in results)
+    assert pool.stats()["timeouts"] == 0 and pool.stats()["pool_restarts"] == 0
+
+
+def test_max_pages_guard_rejects_before_reading_text(tmp_path):
+    pdf_path = _make_pdf(tmp_path / "book.pdf", pages=5)
+    pool = PDFParsePool(workers=0, timeout_seconds=60, max_pages=4)
+
+    with pytest.raises(PDFTooLargeError):
+        asyncio.run(pool.extract(pdf_path))
+    assert pool.stats()["rejected"] == 1
+
+
+def test_head_only_stops_after_head_pages_and_full_text_respects_char_cap(tmp_path):
+    pdf_path = _make_pdf(tmp_path / "long.pdf", pages=20)
+    head_text, full_text, pages_read = _parse_pdf(pdf_path, head_only=True)
+    assert full_text is None and pages_read == 2 and "Page 1" in head_text
+
+    _, capped, pages_read = _parse_pdf(pdf_path, max_chars=500)
+    assert len(capped) == 500 and pages_read < 20
+
+    builder = TextBuilder(max_chars=5)
+    assert builder.append("abc") and not builder.append("defg")
+    assert builder.getvalue() == "abcde" and builder.truncated
+
+
+def test_head_skips_leading_pages_without_text(tmp_path):
+    doc = fitz.open()
+    doc.new_page()
+    doc.new_page()  # 图片封面/空白页：没有文字层
+    for index in range(3):
+        doc.new_page().insert_text((72, 72), f"Body page {index} about sparse attention. " * 3)
+    pdf_path = str(tmp_path / "cover.pdf")
+    doc.save(pdf_path)
+    doc.close()
+
+    head_text, full_text, _ = _parse_pdf(pdf_path, head_only=True)
+    assert full_text is None and "Body page 0" in head_text
+
+    head_text, full_text, _ = _parse_pdf(pdf_path)
+    assert "Body page 0" in head_text and "Body page 2" in full_text
+
+
+def test_full_parse_writes_text_cache_and_reuses_it_until_version_changes(tmp_path, monkeypatch):
+    store = TextArtifactStore(root=str(tmp_path / "text_cache"))
+    monkeypatch.setattr("backend.services.pdf_parser.text_artifact_store", store)
+    pdf_path = _make_pdf(tmp_path / "cached.pdf", pages=3)
+    md5_hash = "0123456789abcdef0123456789abcdef"
+    pool = PDFParsePool(workers=0, timeout_seconds=60, max_pages=10)
+
+    first = asyncio.run(pool.extract(pdf_path, md5_hash=md5_hash))
+    assert store.exists(md5_hash)
+    second = asyncio.run(pool.extract(str(tmp_path / "missing.pdf"), md5_hash=md5_hash))
+    assert second == first and pool.stats()["cache_hits"] == 1
+
+    monkeypatch.setattr(text_cache, "EXTRACTOR_VERSION", text_cache.EXTRACTOR_VERSION + 1)
+    assert store.load_text(md5_hash) is None and not store.exists(md5_hash)
@@ -0,0 +1,50 @@
+from backend.core import llm_service
+from backend.core.provider_health import ProviderHealthAggregator, apply_ewma
+
+
+def test_apply_ewma_seeds_with_first_sample():
+    assert apply_ewma(None, 100, 0.3) == 100.0
+    assert apply_ewma(100.0, 200, 0.5) == 150.0
+
+
+def test_aggregator_tracks_counters_and_drains_pending_batch():
+    health = ProviderHealthAggregator(flush_interval=60, ewma_alpha=0.5)
+    health.record_success(1, 100)
+    health.record_success(1, 300)
+    health.record_failure(1, "boom")
+
+    stats = health.get_stats(1)
+    assert stats.success_count == 2
+    assert stats.failure_count == 1
+    assert stats.ewma_latency_ms == 200.0
+    assert stats.last_error == "boom"
+
+    batch = health._drain_pending()
+    assert batch[1]["success"] == 2
+    assert batch[1]["failure"] == 1
+    assert batch[1]["latencies"] == [100, 300]
+    assert health._drain_pending() == {}
+    # 落库后内存中的累计值保持不变
+    assert health.get_stats(1).success_count == 2
+
+
+def test_failed_flush_keeps_pending_counts_for_next_attempt(monkeypatch):
+    health = ProviderHealthAggregator(flush_interval=60, ewma_alpha=0.5)
+    health.record_success(1, 100)
+    health.record_failure(1, "boom")
+    written = []
+
+    def failing_apply(batch, alpha):
+        # 落库期间又有新的调用
+        health.record_success(1, 200)
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(llm_service, "apply_provider_health_batch", failing_apply)
+    assert health.flush_sync() == 0
+
+    monkeypatch.setattr(llm_service, "apply_provider_health_batch", lambda batch, alpha: written.append(batch))
+    assert health.flush_sync() == 1
+    assert written[0][1]["success"] == 2
+    assert written[0][1]["failure"] == 1
+    assert written[0][1]["latencies"] == [100, 200]
+    assert health._drain_pending() == {}
@@ -0,0 +1,90 @@
+import asyncio
+
+from backend.core.rate_governor import RateGovernor, RateLimit, rate_key
+
+
+def test_rate_key_shares_quota_across_paths_on_same_host():
+    native = rate_key("https://generativelanguage.googleapis.com/v1beta", "k1")
+    compat = rate_key("https://generativelanguage.googleapis.com/v1beta/openai/", "k1")
+    assert native == compat
+    assert native != rate_key("https://generativelanguage.googleapis.com/v1beta", "k2")
+
+
+def test_unlimited_key_has_no_limiter_and_overrides_match_key_suffix():
+    governor = RateGovernor(
+        default_limit=RateLimit(),
+        overrides={"api.example.com#abcd": RateLimit(rpm=60)},
+    )
+    assert governor.limiter("https://api.example.com/v1", "sk-0000") is None
+    limiter = governor.limiter("https://api.example.com/v1", "sk-abcd")
+    assert limiter.limit.rpm == 60
+    assert governor.limiter("https://api.example.com/other", "sk-abcd") is limiter
+
+
+def test_concurrency_limit_queues_instead_of_failing():
+    governor = RateGovernor(default_limit=RateLimit(max_concurrency=2), overrides={})
+    active = 0
+    peak = 0
+
+    async def call():
+        nonlocal active, peak
+        async with governor.limit("https://api.example.com", "k"):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
+    snapshot = governor.snapshot()[0]
+    assert snapshot["in_flight"] == 0 and snapshot["queued"] == 0
+
+
+def test_rpm_bucket_delays_requests_over_budget():
+    governor = RateGovernor(default_limit=RateLimit(rpm=600), overrides={})
+    limiter = governor.limiter("https://api.example.com", "k")
+    limiter._request_bucket.tokens = 1
+
+    async def run():
+        await limiter.acquire(1)
+        return await limiter.acquire(1)
+
+    # 600 RPM = 每 0.1 秒补充 1 个令牌
+    assert asyncio.run(run()) >= 0.05
+
+
+def test_translation_budget_respects_key_limits_and_reservation():
+    governor = RateGovernor(default_limit=RateLimit(rpm=300, max_concurrency=8), overrides={})
+    assert governor.translation_budget("https://api.example.com", "k", 10, 100) == (4, 8)
+
+    limiter = governor.limiter("https://api.example.com", "k")
+    with governor.reserve("https://api.example.com", "k", 240):
+        assert limiter._effective_rpm() == 60
+    assert limiter.reserved_rpm == 0
+
+
+def test_translation_budget_never_exceeds_low_rpm_keys():
+    governor = RateGovernor(default_limit=RateLimit(rpm=30), overrides={})
+    # 30 RPM 的 80% 不足 1 QPS：该 Key 上不能翻译
+    assert governor.translation_budget("https://api.example.com", "k", 10, 100) == (0, 100)
+
+    limiter = governor.limiter("https://api.example.com", "k")
+    with governor.reserve("https://api.example.com", "k", 60) as granted:
+        assert granted == 24
+        assert granted + limiter._effective_rpm() <= 30
+    assert limiter.reserved_rpm == 0
+
+
+def test_concurrent_translations_share_the_reservable_rpm():
+    governor = RateGovernor(default_limit=RateLimit(rpm=300), overrides={})
+    limiter = governor.limiter("https://api.example.com", "k")
+    with governor.reserve("https://api.example.com", "k", 180) as first:
+        assert first == 180
+        assert governor.translation_budget("https://api.example.com", "k", 10, 100) == (1, 100)
+        with governor.reserve("https://api.example.com", "k", 180) as second:
+            assert second == 60
+            assert limiter.reserved_rpm + limiter._effective_rpm() <= 300
+    assert limiter.reserved_rpm == 0
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from starlette.responses import StreamingResponse
+
+from backend.core.sse import (
+    ClientDisconnectedError,
+    InFlightRegistry,
+    SSETaskStream,
+    StreamSupersededError,
+    iterate_until_disconnected,
+)
+
+
+class _FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def _slow_source(closed: list):
+    async def source():
+        try:
+            yield "first"
+            await asyncio.sleep(10)
+            yield "never"
+        finally:
+            closed.append(True)
+    return source()
+
+
+def test_disconnect_while_waiting_cancels_upstream():
+    request = _FakeRequest()
+    closed = []
+    received = []
+
+    async def main():
+        with pytest.raises(ClientDisconnectedError):
+            async for item in iterate_until_disconnected(request, _slow_source(closed), poll_interval=0.01):
+                received.append(item)
+                request.disconnected = True
+
+    asyncio.run(main())
+
+    assert received == ["first"]
+    assert closed == [True]
+
+
+def test_new_request_supersedes_in_flight_stream():
+    registry = InFlightRegistry()
+    closed = []
+
+    async def consume(source):
+        async for _ in iterate_until_disconnected(_FakeRequest(), source, poll_interval=0.01,
+                                                  in_flight=registry, key=(1, 7)):
+            pass
+
+    async def main():
+        first = asyncio.create_task(consume(_slow_source(closed)))
+        await asyncio.sleep(0.02)
+        second = asyncio.create_task(consume(_slow_source([])))
+        await asyncio.sleep(0.02)
+        second.cancel()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first_result, _ = asyncio.run(main())
+
+    assert isinstance(first_result, StreamSupersededError)
+    assert closed == [True]
+    assert registry.superseded == 1 and len(registry) == 0
+
+
+def test_task_stream_cleans_up_when_starlette_cancels_on_disconnect():
+    # ASGI spec 2.3：Starlette 在收到 http.disconnect 时取消整个任务组，生成器的 finally 在被取消的作用域中执行
+    cancelled = []
+    handed_off = []
+    exited = []
+
+    async def worker():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            await asyncio.sleep(0.01)
+            exited.append(True)
+            raise
+
+    async def generate():
+        stream = SSETaskStream(_FakeRequest(), poll_interval=10)
+        stream.spawn(worker())
+        stream.emit({"step": 0})
+        async for event in stream.events(on_close=lambda: handed_off.append(True)):
+            yield event
+        yield "data: done\n\n"
+
+    async def main():
+        sent = []
+        messages = iter([{"type": "http.request", "body": b"", "more_body": False}])
+
+        async def receive():
+            message = next(messages, None)
+            if message is not None:
+                return message
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "asgi": {"spec_version": "2.3"}, "method": "POST", "path": "/", "headers": []}
+        await StreamingResponse(generate(), media_type="text/event-stream")(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(main())
+
+    assert any(message.get("body", b"").startswith(b"data: {") for message in sent)
+    assert cancelled == [True] and handed_off == [True] and exited == [True]
@@ -0,0 +1,66 @@
+import asyncio
+
+from backend.services.upload_concurrency import UploadConcurrencyLimiter
+
+
+def test_limiter_enforces_user_and_global_limits():
+    limiter = UploadConcurrencyLimiter(max_concurrent=3)
+    running = {1: 0, 2: 0}
+    peaks = {"total": 0, 1: 0, 2: 0}
+
+    async def work(user_id: int, user_limit: int):
+        async with limiter.slot(user_id, user_limit):
+            running[user_id] += 1
+            peaks[user_id] = max(peaks[user_id], running[user_id])
+            peaks["total"] = max(peaks["total"], running[1] + running[2])
+            await asyncio.sleep(0.01)
+            running[user_id] -= 1
+
+    async def main():
+        await asyncio.gather(*[work(1, 2) for _ in range(6)], *[work(2, 5) for _ in range(6)])
+
+    asyncio.run(main())
+
+    assert peaks[1] == 2
+    assert peaks["total"] == 3
+    stats = limiter.stats()
+    assert stats["completed"] == 12
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0
+
+
+def test_slow_task_does_not_block_other_slots():
+    limiter = UploadConcurrencyLimiter(max_concurrent=2)
+    finished = []
+
+    async def work(name: str, delay: float):
+        async with limiter.slot(1, 2):
+            await asyncio.sleep(delay)
+            finished.append(name)
+
+    async def main():
+        await asyncio.gather(work("slow", 0.2), *[work(f"fast-{i}", 0.01) for i in range(3)])
+
+    asyncio.run(main())
+
+    assert finished[-1] == "slow"
+
+
+def test_cancelled_waiter_releases_waiting_count():
+    limiter = UploadConcurrencyLimiter(max_concurrent=1)
+
+    async def hold():
+        async with limiter.slot(1, 1):
+            await asyncio.sleep(0.05)
+
+    async def main():
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["waiting"] == 1
+        waiter.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+
+    asyncio.run(main())
+
+    assert limiter.stats()["waiting"] == 0